@@ -8,7 +8,7 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.db.database import Base
-from app.models import sequence, email, user, api_key
+from app.models import sequence, email, user, api_key, wordpress_registration, wordpress_media, blog_post_outbox
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,26 @@
+"""Add wordpress_post_id to emails
+
+Revision ID: 6b432cc7c946
+Revises: c4d997bbdd8b
+Create Date: 2026-10-19 14:21:48.305117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b432cc7c946'
+down_revision: Union[str, None] = 'c4d997bbdd8b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('wordpress_post_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('emails', 'wordpress_post_id')
@@ -0,0 +1,54 @@
+"""Add blog_post_outbox
+
+Revision ID: 75d0e29c82c9
+Revises: 8e7e013df55d
+Create Date: 2026-10-19 16:05:12.480913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '75d0e29c82c9'
+down_revision: Union[str, None] = '8e7e013df55d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('sequences', sa.Column('api_key_id', sa.Integer(), nullable=True))
+    op.add_column('sequences', sa.Column('custom_post_type', sa.String(), nullable=True))
+    op.create_foreign_key('sequences_api_key_id_fkey', 'sequences', 'api_keys', ['api_key_id'], ['id'])
+    op.create_table('blog_post_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email_id', sa.Integer(), nullable=False),
+    sa.Column('api_key_id', sa.Integer(), nullable=False),
+    sa.Column('custom_post_type', sa.String(), nullable=False),
+    sa.Column('idempotency_key', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), server_default='pending', nullable=False),
+    sa.Column('attempt_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('published_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['api_key_id'], ['api_keys.id'], ),
+    sa.ForeignKeyConstraint(['email_id'], ['emails.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email_id'),
+    sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index(op.f('ix_blog_post_outbox_id'), 'blog_post_outbox', ['id'], unique=False)
+    op.create_index('ix_blog_post_outbox_due', 'blog_post_outbox', ['next_attempt_at'], unique=False, postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blog_post_outbox_due', table_name='blog_post_outbox', postgresql_where=sa.text("status = 'pending'"))
+    op.drop_index(op.f('ix_blog_post_outbox_id'), table_name='blog_post_outbox')
+    op.drop_table('blog_post_outbox')
+    op.drop_constraint('sequences_api_key_id_fkey', 'sequences', type_='foreignkey')
+    op.drop_column('sequences', 'custom_post_type')
+    op.drop_column('sequences', 'api_key_id')
@@ -0,0 +1,36 @@
+"""Add wordpress_media
+
+Revision ID: 8e7e013df55d
+Revises: f8663fe679a3
+Create Date: 2026-10-19 15:20:37.118406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e7e013df55d'
+down_revision: Union[str, None] = 'f8663fe679a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('wordpress_media',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('site_url', sa.String(), nullable=False),
+    sa.Column('source_url', sa.String(), nullable=False),
+    sa.Column('media_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('site_url', 'source_url', name='uq_wordpress_media_site_source')
+    )
+    op.create_index(op.f('ix_wordpress_media_id'), 'wordpress_media', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_wordpress_media_id'), table_name='wordpress_media')
+    op.drop_table('wordpress_media')
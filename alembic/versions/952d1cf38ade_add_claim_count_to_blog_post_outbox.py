@@ -0,0 +1,33 @@
+"""Add claim_count to blog_post_outbox
+
+Counts how many times an entry has been claimed, so a worker can tell that an earlier claim
+may already have created the post even when that attempt never recorded a failure (the
+worker died or outlived its lease). Adding a column with a constant default only changes
+the catalog.
+
+Revision ID: 952d1cf38ade
+Revises: a4c1e97b5d20
+Create Date: 2026-10-19 18:05:12.417093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '952d1cf38ade'
+down_revision: Union[str, None] = 'a4c1e97b5d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('blog_post_outbox', sa.Column('claim_count', sa.Integer(), nullable=False, server_default='0'))
+    # Entries that already have a lease or a failed attempt behind them may have a post
+    op.execute("UPDATE blog_post_outbox SET claim_count = 1 WHERE status = 'pending' AND (locked_until IS NOT NULL OR attempt_count > 0)")
+
+
+def downgrade() -> None:
+    op.drop_column('blog_post_outbox', 'claim_count')
@@ -0,0 +1,64 @@
+"""Add webhook submission retention
+
+Links each submission to the sequence made from it and records when its raw payload was
+compacted. Earlier submissions are linked where exactly one sequence has the same form,
+recipient and topic; the rest are only ever pruned by age. The backfill, the foreign key
+check and the indexes all run outside the migration transaction, so webhooks keep being
+accepted meanwhile.
+
+Revision ID: a4c1e97b5d20
+Revises: d267c31288df
+Create Date: 2026-10-19 17:41:08.215730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c1e97b5d20'
+down_revision: Union[str, None] = 'd267c31288df'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('webhook_submissions', sa.Column('sequence_id', sa.Integer(), nullable=True))
+    op.add_column('webhook_submissions', sa.Column('payload_compacted_at', sa.DateTime(timezone=True), nullable=True))
+    # NOT VALID, so adding it doesn't hold up webhook inserts while the table is scanned
+    op.execute(
+        "ALTER TABLE webhook_submissions ADD CONSTRAINT webhook_submissions_sequence_id_fkey "
+        "FOREIGN KEY (sequence_id) REFERENCES sequences (id) ON DELETE SET NULL NOT VALID"
+    )
+
+    with op.get_context().autocommit_block():
+        op.execute("""
+            UPDATE webhook_submissions w SET sequence_id = m.sequence_id
+            FROM (
+                SELECT form_id, recipient_email, topic, min(id) AS sequence_id
+                FROM sequences
+                GROUP BY form_id, recipient_email, topic
+                HAVING count(*) = 1
+            ) m
+            WHERE w.form_id = m.form_id AND w.recipient_email = m.recipient_email AND w.topic = m.topic
+        """)
+        op.execute("ALTER TABLE webhook_submissions VALIDATE CONSTRAINT webhook_submissions_sequence_id_fkey")
+        op.create_index('ix_webhook_submissions_created_at', 'webhook_submissions', ['created_at'], unique=False, postgresql_concurrently=True)
+        op.create_index(
+            'ix_webhook_submissions_compactable',
+            'webhook_submissions',
+            ['created_at'],
+            unique=False,
+            postgresql_where=sa.text('sequence_id IS NOT NULL AND payload_compacted_at IS NULL'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_webhook_submissions_compactable', table_name='webhook_submissions')
+    op.drop_index('ix_webhook_submissions_created_at', table_name='webhook_submissions')
+    op.drop_constraint('webhook_submissions_sequence_id_fkey', 'webhook_submissions', type_='foreignkey')
+    op.drop_column('webhook_submissions', 'payload_compacted_at')
+    op.drop_column('webhook_submissions', 'sequence_id')
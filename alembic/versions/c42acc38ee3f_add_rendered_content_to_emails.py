@@ -0,0 +1,31 @@
+"""Add pre-rendered send and blog content to emails
+
+Revision ID: c42acc38ee3f
+Revises: 8ac20a5232a7
+Create Date: 2026-10-19 09:12:41.203518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c42acc38ee3f'
+down_revision: Union[str, None] = '8ac20a5232a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('rendered_brevo_params', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('emails', sa.Column('rendered_blog_content', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('emails', sa.Column('render_version', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('emails', 'render_version')
+    op.drop_column('emails', 'rendered_blog_content')
+    op.drop_column('emails', 'rendered_brevo_params')
@@ -0,0 +1,40 @@
+"""Add send retry tracking and dead-letter state to emails
+
+Revision ID: c4d997bbdd8b
+Revises: c42acc38ee3f
+Create Date: 2026-10-19 10:03:17.845120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d997bbdd8b'
+down_revision: Union[str, None] = 'c42acc38ee3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('attempt_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('emails', sa.Column('last_error', sa.String(), nullable=True))
+    op.add_column('emails', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+    op.add_column('emails', sa.Column('dead_lettered_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'ix_emails_due',
+        'emails',
+        ['scheduled_for', 'next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text('sent_to_brevo = false AND dead_lettered_at IS NULL')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_due', table_name='emails')
+    op.drop_column('emails', 'dead_lettered_at')
+    op.drop_column('emails', 'next_attempt_at')
+    op.drop_column('emails', 'last_error')
+    op.drop_column('emails', 'attempt_count')
@@ -0,0 +1,129 @@
+"""Partition emails by month of scheduled_for
+
+The existing table is not copied. It becomes the partition for everything scheduled
+before the month after its last email, and new months get their own partitions. These
+steps run outside the migration transaction and don't block the app:
+- building the (id, scheduled_for) unique index concurrently;
+- backfilling and validating the outbox's reference to the email's scheduled_for.
+
+Writes to emails are frozen for the rest. The migration takes ACCESS EXCLUSIVE on emails
+and blog_post_outbox. Under that lock it reads the bounds, adds the bounds check and swaps
+the tables. Adding the check scans emails once, so the freeze lasts about one sequential
+scan of the table. The bounds must not move while the check is live, or an email
+scheduled past them would fail to insert. Writers queue behind the lock and do not error.
+If the lock can't be had within lock_timeout (10s), the migration fails without changing
+anything; run it again when no long transaction holds emails.
+
+Downgrade copies every attached partition back into a plain table. Partitions already
+moved to the email_archive schema are not brought back.
+
+Revision ID: d267c31288df
+Revises: 75d0e29c82c9
+Create Date: 2026-10-19 15:12:40.318207
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd267c31288df'
+down_revision: Union[str, None] = '75d0e29c82c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    id_sequence = conn.execute(sa.text("SELECT pg_get_serial_sequence('emails', 'id')")).scalar()
+
+    with op.get_context().autocommit_block():
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS emails_legacy_pkey ON emails (id, scheduled_for)")
+        op.add_column('blog_post_outbox', sa.Column('email_scheduled_for', sa.DateTime(), nullable=True))
+        op.execute("UPDATE blog_post_outbox o SET email_scheduled_for = e.scheduled_for FROM emails e WHERE e.id = o.email_id")
+
+    # Write freeze starts here (see above). Same order the app takes the locks in: emails are
+    # written before their outbox entries
+    op.execute("SET LOCAL lock_timeout = '10s'")
+    op.execute("LOCK TABLE emails, blog_post_outbox IN ACCESS EXCLUSIVE MODE")
+    unscheduled, cutover = conn.execute(sa.text(
+        "SELECT count(*) FILTER (WHERE scheduled_for IS NULL), "
+        "date_trunc('month', greatest(max(scheduled_for), timezone('utc', now()))) + interval '1 month' FROM emails"
+    )).one()
+    if unscheduled:
+        raise RuntimeError(f"{unscheduled} emails have no scheduled_for; give them one before partitioning on it")
+    op.execute(f"ALTER TABLE emails ADD CONSTRAINT emails_legacy_bounds CHECK (scheduled_for IS NOT NULL AND scheduled_for < '{cutover}')")
+    op.execute("UPDATE blog_post_outbox o SET email_scheduled_for = e.scheduled_for FROM emails e WHERE e.id = o.email_id AND o.email_scheduled_for IS NULL")
+    op.drop_constraint('blog_post_outbox_email_id_fkey', 'blog_post_outbox', type_='foreignkey')
+
+    # The check lets SET NOT NULL and ATTACH PARTITION skip their table scans
+    op.execute("ALTER TABLE emails DROP CONSTRAINT emails_pkey")
+    op.execute("ALTER TABLE emails ALTER COLUMN scheduled_for SET NOT NULL")
+    op.execute("ALTER TABLE emails ADD CONSTRAINT emails_legacy_pkey PRIMARY KEY USING INDEX emails_legacy_pkey")
+    op.execute("ALTER TABLE emails RENAME TO emails_legacy")
+    op.execute("ALTER INDEX ix_emails_id RENAME TO emails_legacy_id_idx")
+    op.execute("ALTER INDEX ix_emails_due RENAME TO emails_legacy_due_idx")
+
+    op.execute("CREATE TABLE emails (LIKE emails_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (scheduled_for)")
+    op.execute(f"ALTER SEQUENCE {id_sequence} OWNED BY emails.id")
+    op.create_primary_key('emails_pkey', 'emails', ['id', 'scheduled_for'])
+    op.create_index('ix_emails_id', 'emails', ['id'], unique=False)
+    op.create_index(
+        'ix_emails_due',
+        'emails',
+        ['scheduled_for', 'next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text('sent_to_brevo = false AND dead_lettered_at IS NULL')
+    )
+    op.create_foreign_key('emails_sequence_id_fkey', 'emails', 'sequences', ['sequence_id'], ['id'])
+    # Matching indexes and the foreign key on the old table are attached rather than rebuilt
+    op.execute(f"ALTER TABLE emails ATTACH PARTITION emails_legacy FOR VALUES FROM (MINVALUE) TO ('{cutover}')")
+    op.execute("ALTER TABLE emails_legacy DROP CONSTRAINT emails_legacy_bounds")
+
+    for offset in range(MONTHS_AHEAD):
+        start, end = add_months(cutover, offset), add_months(cutover, offset + 1)
+        op.execute(f"CREATE TABLE emails_y{start:%Y}m{start:%m} PARTITION OF emails FOR VALUES FROM ('{start}') TO ('{end}')")
+
+    op.execute(
+        "ALTER TABLE blog_post_outbox ADD CONSTRAINT blog_post_outbox_email_fkey "
+        "FOREIGN KEY (email_id, email_scheduled_for) REFERENCES emails (id, scheduled_for) NOT VALID"
+    )
+    op.execute("CREATE SCHEMA IF NOT EXISTS email_archive")
+
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE blog_post_outbox VALIDATE CONSTRAINT blog_post_outbox_email_fkey")
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    id_sequence = conn.execute(sa.text("SELECT pg_get_serial_sequence('emails', 'id')")).scalar()
+
+    op.drop_constraint('blog_post_outbox_email_fkey', 'blog_post_outbox', type_='foreignkey')
+    op.execute("CREATE TABLE emails_unpartitioned (LIKE emails INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO emails_unpartitioned SELECT * FROM emails")
+    op.execute(f"ALTER SEQUENCE {id_sequence} OWNED BY emails_unpartitioned.id")
+    op.execute("DROP TABLE emails")
+    op.execute("ALTER TABLE emails_unpartitioned RENAME TO emails")
+    op.execute("ALTER TABLE emails ALTER COLUMN scheduled_for DROP NOT NULL")
+    op.create_primary_key('emails_pkey', 'emails', ['id'])
+    op.create_index('ix_emails_id', 'emails', ['id'], unique=False)
+    op.create_index(
+        'ix_emails_due',
+        'emails',
+        ['scheduled_for', 'next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text('sent_to_brevo = false AND dead_lettered_at IS NULL')
+    )
+    op.create_foreign_key('emails_sequence_id_fkey', 'emails', 'sequences', ['sequence_id'], ['id'])
+    op.create_foreign_key('blog_post_outbox_email_id_fkey', 'blog_post_outbox', 'emails', ['email_id'], ['id'])
+    op.drop_column('blog_post_outbox', 'email_scheduled_for')
@@ -0,0 +1,36 @@
+"""Add wordpress_registrations
+
+Revision ID: f8663fe679a3
+Revises: 6b432cc7c946
+Create Date: 2026-10-19 14:52:06.719342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8663fe679a3'
+down_revision: Union[str, None] = '6b432cc7c946'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('wordpress_registrations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('site_url', sa.String(), nullable=False),
+    sa.Column('custom_post_type', sa.String(), nullable=False),
+    sa.Column('structure_hash', sa.String(), nullable=False),
+    sa.Column('registered_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('site_url', 'custom_post_type', name='uq_wordpress_registrations_site_post_type')
+    )
+    op.create_index(op.f('ix_wordpress_registrations_id'), 'wordpress_registrations', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_wordpress_registrations_id'), table_name='wordpress_registrations')
+    op.drop_table('wordpress_registrations')
@@ -0,0 +1,47 @@
+"""Key wordpress_registrations by email structure
+
+A post type on one site can be used by forms with different email sections, so a
+registration is now tracked per (site, post type, structure hash) instead of each
+structure overwriting the other's row. Existing rows keep their hash and stay valid.
+
+Revision ID: fb0bb9b056da
+Revises: 952d1cf38ade
+Create Date: 2026-10-19 18:31:47.902516
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fb0bb9b056da'
+down_revision: Union[str, None] = '952d1cf38ade'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint('uq_wordpress_registrations_site_post_type', 'wordpress_registrations', type_='unique')
+    op.create_unique_constraint(
+        'uq_wordpress_registrations_site_post_type_structure',
+        'wordpress_registrations',
+        ['site_url', 'custom_post_type', 'structure_hash']
+    )
+
+
+def downgrade() -> None:
+    # Keep only the most recent registration per site and post type
+    op.execute("""
+        DELETE FROM wordpress_registrations r
+        USING wordpress_registrations newer
+        WHERE newer.site_url = r.site_url AND newer.custom_post_type = r.custom_post_type
+          AND (newer.registered_at, newer.id) > (r.registered_at, r.id)
+    """)
+    op.drop_constraint('uq_wordpress_registrations_site_post_type_structure', 'wordpress_registrations', type_='unique')
+    op.create_unique_constraint(
+        'uq_wordpress_registrations_site_post_type',
+        'wordpress_registrations',
+        ['site_url', 'custom_post_type']
+    )
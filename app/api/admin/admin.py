@@ -2,11 +2,11 @@ from fastapi import APIRouter, Depends, HTTPException, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.core.auth import get_password_hash, verify_password
+from app.db.database import get_db, get_read_db
+from app.core.auth import get_password_hash_in_pool, verify_password_in_pool, notify_user_changed
 from app.models.user import User
 from app.models.api_key import APIKey
-from app.services import user_service
+from app.services import user_service, email_service, api_key_service
 import secrets
 from app.services.user_service import send_password_reset_email
 from datetime import datetime, timedelta
@@ -31,9 +31,9 @@ async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @router.post("/login")
-async def login(request: Request, email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+def login(request: Request, email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == email).first()
-    if user and verify_password(password, user.hashed_password):
+    if user and verify_password_in_pool(password, user.hashed_password):
         request.session["admin_user"] = user.email
         return RedirectResponse(url="/admin/users", status_code=303)
     return RedirectResponse(url="/admin/login?error=Invalid credentials", status_code=303)
@@ -44,7 +44,7 @@ async def logout(request: Request):
     return RedirectResponse(url="/admin/login", status_code=302)
 
 @router.get("/users", response_class=HTMLResponse)
-async def list_users(request: Request, db: Session = Depends(get_db), admin_user: User = Depends(get_admin_user)):
+def list_users(request: Request, db: Session = Depends(get_read_db), admin_user: User = Depends(get_admin_user)):
     users = db.query(User).all()
     return templates.TemplateResponse("users.html", {"request": request, "users": users})
 
@@ -53,7 +53,7 @@ async def create_user_form(request: Request, admin_user: str = Depends(get_admin
     return templates.TemplateResponse("user_form.html", {"request": request, "user": None})
 
 @router.post("/users/create")
-async def create_user(
+def create_user(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
@@ -63,7 +63,7 @@ async def create_user(
     db: Session = Depends(get_db),
     admin_user: str = Depends(get_admin_user)
 ):
-    user = User(email=email, hashed_password=get_password_hash(password))
+    user = User(email=email, hashed_password=get_password_hash_in_pool(password))
     db.add(user)
     db.flush()
 
@@ -75,12 +75,13 @@ async def create_user(
         wordpress_app_password=wordpress_app_password
     )
     db.add(api_key)
+    api_key_service.notify_api_key_changed(db, api_key.key)
     db.commit()
 
     return RedirectResponse(url="/admin/users", status_code=302)
 
 @router.get("/users/{user_id}/edit", response_class=HTMLResponse)
-async def edit_user_form(request: Request, user_id: int, db: Session = Depends(get_db), admin_user: str = Depends(get_admin_user)):
+def edit_user_form(request: Request, user_id: int, db: Session = Depends(get_db), admin_user: str = Depends(get_admin_user)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -88,7 +89,7 @@ async def edit_user_form(request: Request, user_id: int, db: Session = Depends(g
     return templates.TemplateResponse("user_form.html", {"request": request, "user": user, "api_key": api_key})
 
 @router.post("/users/{user_id}/edit")
-async def edit_user(
+def edit_user(
     request: Request,
     user_id: int,
     email: str = Form(...),
@@ -103,9 +104,12 @@ async def edit_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    # Cached users are keyed by email, so both the old and the new one are invalidated
+    notify_user_changed(db, user.email)
+    notify_user_changed(db, email)
     user.email = email
     if password:
-        user.hashed_password = get_password_hash(password)
+        user.hashed_password = get_password_hash_in_pool(password)
 
     api_key = db.query(APIKey).filter(APIKey.user_id == user_id).first()
     if not api_key:
@@ -117,14 +121,19 @@ async def edit_user(
     if wordpress_app_password:
         api_key.wordpress_app_password = wordpress_app_password
 
+    # Cached WordPress settings are dropped in every worker once this commits
+    api_key_service.notify_api_key_changed(db, api_key.key)
     db.commit()
     return RedirectResponse(url="/admin/users", status_code=302)
 
 @router.post("/users/{user_id}/delete")
-async def delete_user(request: Request, user_id: int, db: Session = Depends(get_db), admin_user: str = Depends(get_admin_user)):
+def delete_user(request: Request, user_id: int, db: Session = Depends(get_db), admin_user: str = Depends(get_admin_user)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    for api_key in user.api_keys:
+        api_key_service.notify_api_key_changed(db, api_key.key)
+    notify_user_changed(db, user.email)
     db.delete(user)
     db.commit()
     return RedirectResponse(url="/admin/users", status_code=302)
@@ -134,14 +143,14 @@ async def admin_index(request: Request, admin_user: str = Depends(get_admin_user
     return RedirectResponse(url="/admin/users", status_code=303)
 
 @router.get("/users/{user_id}/reset-password", response_class=HTMLResponse)
-async def reset_password_form(request: Request, user_id: int, db: Session = Depends(get_db), admin_user: str = Depends(get_admin_user)):
+def reset_password_form(request: Request, user_id: int, db: Session = Depends(get_db), admin_user: str = Depends(get_admin_user)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return templates.TemplateResponse("reset_password.html", {"request": request, "user": user})
 
 @router.post("/users/{user_id}/reset-password")
-async def reset_password(
+def reset_password(
     request: Request,
     user_id: int,
     new_password: str = Form(...),
@@ -152,9 +161,10 @@ async def reset_password(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user.hashed_password = get_password_hash(new_password)
+    user.hashed_password = get_password_hash_in_pool(new_password)
     user.reset_token = None
     user.reset_token_expiry = None
+    notify_user_changed(db, user.email)
     db.commit()
 
     return RedirectResponse(url="/admin/users", status_code=302)
@@ -164,7 +174,7 @@ async def forgot_password_form(request: Request):
     return templates.TemplateResponse("forgot_password.html", {"request": request})
 
 @router.post("/forgot-password")
-async def forgot_password(request: Request, email: str = Form(...), db: Session = Depends(get_db)):
+def forgot_password(request: Request, email: str = Form(...), db: Session = Depends(get_db)):
     try:
         user = db.query(User).filter(User.email == email).first()
         if user:
@@ -186,7 +196,7 @@ async def forgot_password(request: Request, email: str = Form(...), db: Session
         return templates.TemplateResponse("forgot_password_error.html", {"request": request, "error": "An unexpected error occurred. Please try again later."})
 
 @router.get("/reset-password/{token}", response_class=HTMLResponse)
-async def reset_password_form(request: Request, token: str, db: Session = Depends(get_db)):
+def reset_password_form(request: Request, token: str, db: Session = Depends(get_db)):
     with db as session:
         user = session.query(User).filter(User.reset_token == token, User.reset_token_expiry > datetime.utcnow()).first()
         if not user:
@@ -194,15 +204,27 @@ async def reset_password_form(request: Request, token: str, db: Session = Depend
         return templates.TemplateResponse("reset_password.html", {"request": request, "token": token})
 
 @router.post("/reset-password/{token}")
-async def reset_password(request: Request, token: str, new_password: str = Form(...), db: Session = Depends(get_db)):
+def reset_password(request: Request, token: str, new_password: str = Form(...), db: Session = Depends(get_db)):
     with db as session:
         user = session.query(User).filter(User.reset_token == token, User.reset_token_expiry > datetime.utcnow()).first()
         if not user:
             raise HTTPException(status_code=400, detail="Invalid or expired reset token")
 
-        user.hashed_password = get_password_hash(new_password)
+        user.hashed_password = get_password_hash_in_pool(new_password)
         user.reset_token = None
         user.reset_token_expiry = None
+        notify_user_changed(session, user.email)
         session.commit()
 
-    return RedirectResponse(url="/admin/login", status_code=302)
\ No newline at end of file
+    return RedirectResponse(url="/admin/login", status_code=302)
+
+@router.get("/dead-letter", response_class=HTMLResponse)
+def list_dead_lettered_emails(request: Request, db: Session = Depends(get_read_db), admin_user: User = Depends(get_admin_user)):
+    emails = email_service.get_dead_lettered_emails(db)
+    return templates.TemplateResponse("dead_letter.html", {"request": request, "emails": emails})
+
+@router.post("/dead-letter/{email_id}/requeue")
+def requeue_dead_lettered_email(request: Request, email_id: int, db: Session = Depends(get_db), admin_user: User = Depends(get_admin_user)):
+    if not email_service.requeue_dead_lettered_email(db, email_id):
+        raise HTTPException(status_code=404, detail="Dead-lettered email not found")
+    return RedirectResponse(url="/admin/dead-letter", status_code=302)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.services import api_key_service
 from app.core.auth import get_current_active_user
 from app.schemas.user import User
@@ -8,13 +8,13 @@ from app.schemas.user import User
 router = APIRouter()
 
 @router.post("/generate")
-async def generate_api_key(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
-    api_key = api_key_service.generate_api_key(db, current_user.id)
+async def generate_api_key(current_user: User = Depends(get_current_active_user), db: AsyncSession = Depends(get_async_db)):
+    api_key = await api_key_service.generate_api_key(db, current_user.id)
     return {"api_key": api_key}
 
 @router.post("/deactivate")
-async def deactivate_api_key(api_key: str, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
-    success = api_key_service.deactivate_api_key(db, api_key)
+async def deactivate_api_key(api_key: str, current_user: User = Depends(get_current_active_user), db: AsyncSession = Depends(get_async_db)):
+    success = await api_key_service.deactivate_api_key(db, api_key)
     if success:
         return {"message": "API key deactivated successfully"}
     else:
@@ -1,7 +1,7 @@
 from typing import Dict, Any, List
 from fastapi import APIRouter, Depends, BackgroundTasks, Request, HTTPException, Header
-from sqlalchemy.orm import Session
-from app.db.database import get_db, SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.schemas.sequence import SequenceCreate, SequenceResponse, EmailSection
 from app.services.sequence_generation import generate_and_store_email_sequence
 from app.services import sequence_service, brevo_service, api_key_service, webhook_service
@@ -18,7 +18,7 @@ from app.services import sequence_service, blog_post_service
 from app.services import webhook_service
 from app.schemas.blog_post import BlogPostCreate, BlogPostResponse
 from app.core.api_key import get_api_key
-from app.models.api_key import APIKey
+from app.core.logging_config import log_payload
 
 router = APIRouter()
 
@@ -26,15 +26,15 @@ router = APIRouter()
 async def webhook(
     request: Request, 
     background_tasks: BackgroundTasks, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     api_key: str = Depends(get_api_key)
 ):
     try:
         data = await request.json()
-        logger.info(f"Received webhook data: {data}")
+        logger.opt(lazy=True).debug("Received webhook data: {}", lambda: log_payload(data))
 
         # Store the raw submission
-        webhook_service.create_webhook_submission(db, data)
+        db_submission = await webhook_service.create_webhook_submission(db, data)
         logger.info("Webhook submission stored successfully")
 
         # Define required fields
@@ -90,7 +90,8 @@ async def webhook(
             preferred_time=preferred_time_obj,
             timezone=data["timezone"],
             api_key=api_key,
-            custom_post_type=data.get("custom_post_type", "email_blog_post")
+            custom_post_type=data.get("custom_post_type", "email_blog_post"),
+            submission_id=db_submission.id
         )
 
         background_tasks.add_task(process_submission, submission)
@@ -107,11 +108,10 @@ async def webhook(
 @router.post("/create-blog-post", response_model=BlogPostResponse)
 async def create_blog_post(
     post: BlogPostCreate,
-    db: Session = Depends(get_db),
-    api_key: APIKey = Depends(get_api_key)
+    api_key: str = Depends(get_api_key)
 ):
     try:
-        result = blog_post_service.create_blog_post(post.content, post.metadata, api_key)
+        result = await blog_post_service.create_blog_post(post.content, post.metadata, await api_key_service.get_cached_api_key(api_key))
         return BlogPostResponse(message=result)
     except Exception as e:
         logger.error(f"Error creating blog post: {str(e)}")
@@ -4,23 +4,76 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app.db.database import get_db
+from cachetools import TTLCache
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import AsyncSessionLocal
 from app.models.user import User
-from app.schemas.user import TokenData
+from app.schemas.user import TokenData, User as UserSchema
 from app.core.config import settings
+from app.core.metrics import record_cache
+from app.services import api_key_service
+from typing import Optional
+import asyncio
+import hashlib
+import multiprocessing
+import threading
 
 pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/users/token")
 
+# A hash takes a few hundred milliseconds of CPU in crypt(), which holds the GIL, so async
+# handlers run it in a small process pool; the event loop keeps serving other requests and
+# the pool size caps how many hashes run at once. Created on first use, with spawn rather
+# than fork for the same reason as content_formatter's pool.
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+
+# Users resolved from a token, keyed by sha256 of the token subject (the email). Changes to a
+# user send a NOTIFY on USER_CHANNEL, handled by api_key_service's listener thread.
+USER_CHANNEL = "user_changed"
+_user_cache = TTLCache(maxsize=10000, ttl=settings.USER_CACHE_TTL_SECONDS)
+_user_cache_lock = threading.Lock()
+_user_cache_generation = 0
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+def _get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _hash_executor
+
+def shutdown_hash_executor():
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is not None:
+            _hash_executor.shutdown(cancel_futures=True)
+            _hash_executor = None
+
+# For sync code (the admin routes run in the threadpool): waits on the process pool rather
+# than hashing on the calling thread, which would hold the GIL the event loop needs
+def verify_password_in_pool(plain_password: str, hashed_password: str) -> bool:
+    return _get_hash_executor().submit(verify_password, plain_password, hashed_password).result()
+
+def get_password_hash_in_pool(password: str) -> str:
+    return _get_hash_executor().submit(get_password_hash, password).result()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), get_password_hash, password)
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+    if not user or not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
@@ -34,7 +87,50 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _subject_key(email: str) -> str:
+    return hashlib.sha256(email.encode()).hexdigest()
+
+def invalidate_cached_user(subject_hash: Optional[str] = None):
+    """Drop one user (by sha256 of their email) from this process' cache, or everything when None."""
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        if subject_hash is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(subject_hash, None)
+
+def notify_user_changed(db: Session, email: str):
+    """Queue a cache invalidation for every process; delivered when the transaction commits."""
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": USER_CHANNEL, "payload": _subject_key(email)})
+
+api_key_service.add_notification_handler(USER_CHANNEL, invalidate_cached_user)
+
+async def get_user_by_subject(email: str) -> Optional[UserSchema]:
+    subject_hash = _subject_key(email)
+    use_cache = api_key_service.notifications_connected()
+    if use_cache:
+        with _user_cache_lock:
+            hit = subject_hash in _user_cache
+            cached = _user_cache.get(subject_hash)
+            generation = _user_cache_generation
+        record_cache("users", hit)
+        if hit:
+            return cached
+
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+        # The row was validated when it was written; model_construct skips re-checking the EmailStr on every lookup
+        cached = UserSchema.model_construct(
+            id=user.id, email=user.email, is_active=user.is_active, is_superuser=user.is_superuser
+        ) if user else None
+    if use_cache and cached is not None:
+        with _user_cache_lock:
+            if generation == _user_cache_generation and api_key_service.notifications_connected():
+                _user_cache[subject_hash] = cached
+    return cached
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -48,12 +144,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = await get_user_by_subject(token_data.email)
     if user is None:
         raise credentials_exception
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: UserSchema = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
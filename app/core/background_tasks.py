@@ -1,18 +1,17 @@
 from asyncio import Queue
 from pydantic import BaseModel
-from app.db.database import SessionLocal
+from app.db.database import async_session_scope
 from app.models.sequence import Sequence
 from app.schemas.sequence import SequenceCreate, EmailSection
-from app.services import sequence_service, api_key_service, blog_post_service
-from app.services.sequence_generation import generate_and_store_email_sequence, format_email_for_blog_post
+from app.services import sequence_service, api_key_service, outbox_service, webhook_service
+from app.services.sequence_generation import generate_and_store_email_sequence
 from app.services.brevo_service import subscribe_to_brevo_list
 from app.core.exceptions import AppException
 from loguru import logger
-from typing import List
+from typing import List, Optional
 from datetime import time
 import sentry_sdk
 
-from app.services import sequence_generation
 
 class SubmissionQueue(BaseModel):
     form_id: str
@@ -29,6 +28,7 @@ class SubmissionQueue(BaseModel):
     timezone: str
     api_key: str  # Add this line
     custom_post_type: str
+    submission_id: Optional[int] = None  # webhook_submissions row this came from
 
 async def process_submission_queue(queue: Queue):
     while True:
@@ -41,7 +41,6 @@ async def process_submission_queue(queue: Queue):
             queue.task_done()
 
 async def process_submission(submission: SubmissionQueue):
-    db = SessionLocal()
     try:
         sequence_create = SequenceCreate(
             form_id=submission.form_id,
@@ -58,9 +57,17 @@ async def process_submission(submission: SubmissionQueue):
             timezone=submission.timezone,
             custom_post_type=submission.custom_post_type
         )
+        # Get the API key object once; the sequence records it so its blog posts can be queued
+        api_key_obj = await api_key_service.get_cached_api_key(submission.api_key)
+        if not api_key_obj:
+            raise ValueError(f"Invalid API key: {submission.api_key}")
+
         logger.info(f"Creating sequence for email: {submission.recipient_email}")
-        db_sequence = sequence_service.create_sequence(db, sequence_create)
-        sequence_id = db_sequence.id
+        async with async_session_scope() as db:
+            sequence_id = (await sequence_service.create_sequence(db, sequence_create, api_key_id=api_key_obj.id)).id
+            if submission.submission_id is not None:
+                # From here on the submission's raw payload can be compacted (webhook_service)
+                await webhook_service.link_submission_to_sequence(db, submission.submission_id, sequence_id)
         logger.info(f"Sequence created with ID: {sequence_id}")
 
         # Subscribe the email to the Brevo list
@@ -76,44 +83,9 @@ async def process_submission(submission: SubmissionQueue):
         await generate_and_store_email_sequence(sequence_id, sequence_create)
         logger.info(f"Completed email generation for sequence ID: {sequence_id}")
 
-        # Get the API key object once
-        api_key_obj = api_key_service.get_api_key(db, submission.api_key)
-        if not api_key_obj:
-            raise ValueError(f"Invalid API key: {submission.api_key}")
-
-        # Set up custom post type and fields
-        try:
-            blog_post_service.setup_custom_post_type_and_fields(api_key_obj, submission.custom_post_type, submission.email_structure)
-            logger.info(f"Custom post type '{submission.custom_post_type}' is ready for use")
-        except AppException as e:
-            logger.error(f"Failed to set up custom post type: {str(e)}")
-            # Here you might want to send a notification to the user or admin
-            # For now, we'll continue processing but skip blog post creation
-            return
-
-        # Generate and post blog posts for each email in the sequence
-        emails = sequence_service.get_emails_for_sequence(db, db_sequence.id)
-        for email in emails:
-            blog_post_content = sequence_generation.format_email_for_blog_post(email)
-            blog_post_metadata = {
-                "title": f"{email.subject}",
-                "category": email.category,
-                "tags": email.tags,
-                "custom_post_type": submission.custom_post_type,
-                "custom_fields": {},
-                "featured_image_url": email.image_url
-            }
-            
-            # Add each email section as a custom field
-            for section_name, section_content in blog_post_content.items():
-                blog_post_metadata["custom_fields"][f"email_section_{section_name}"] = section_content
-
-            try:
-                blog_post_result = blog_post_service.create_blog_post(blog_post_content, blog_post_metadata, api_key_obj)
-                logger.info(f"Blog post created for email {email.id}: {blog_post_result}")
-            except Exception as e:
-                logger.error(f"Failed to create blog post for email {email.id}: {str(e)}")
-                # Consider adding a retry mechanism or alternative action here
+        # Blog posts were queued in the outbox alongside the emails; publish them now rather than
+        # waiting for the next worker poll. Anything that fails stays queued and is retried.
+        await outbox_service.drain_outbox(sequence_id=sequence_id)
 
     except AppException as e:
         sentry_sdk.capture_exception(e)
@@ -122,5 +94,4 @@ async def process_submission(submission: SubmissionQueue):
         sentry_sdk.capture_exception(e)
         logger.error(f"Unexpected error processing submission for email {submission.recipient_email}: {str(e)}")
     finally:
-        db.close()
-        logger.info(f"Closing database connection for email: {submission.recipient_email}")
\ No newline at end of file
+        logger.info(f"Finished processing submission for email: {submission.recipient_email}")
\ No newline at end of file
@@ -65,6 +65,7 @@ class Settings(BaseSettings):
 
     # API and Processing Configuration
     BATCH_SIZE: int = 10  # Number of emails to generate in each batch
+    EMAIL_COPY_THRESHOLD: int = 200  # Emails added at once from which add_emails_to_sequence uses COPY instead of INSERT
     OPENAI_REQUEST_TIMEOUT: int = 240  # Timeout for OpenAI API requests in seconds
 
     # OpenAI Prompt Settings
@@ -101,9 +102,25 @@ Return the result as a JSON array with {batch_size} items.
     # Database Settings
     DATABASE_URL: str = os.getenv("DATABASE_URL")  # Connection string for the database
     DEV_DATABASE_URL: Optional[str] = None
+    DATABASE_LISTEN_URL: Optional[str] = None  # Direct (non-pgbouncer) connection for LISTEN; defaults to DATABASE_URL
+    ASYNC_DATABASE_URL: Optional[str] = None  # asyncpg connection string; defaults to DATABASE_URL with the postgresql+asyncpg driver
+    DB_POOL_SIZE: int = 5  # Connections kept open per process by the sync engine (scheduler, admin, migrations)
+    DB_MAX_OVERFLOW: int = 5  # Extra connections opened under load and closed when returned
+    DB_ASYNC_POOL_SIZE: int = 10  # Connections kept open per process by the async engine (API and pipeline)
+    DB_ASYNC_MAX_OVERFLOW: int = 10  # Extra async connections under load
+    DB_POOL_TIMEOUT_SECONDS: int = 10  # How long a checkout waits for a free connection before failing
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # Connections older than this are replaced on checkout
+    DB_POOL_PRE_PING: bool = True  # Test connections on checkout so ones dropped by the server are replaced transparently
+    DB_CONNECT_TIMEOUT_SECONDS: int = 10  # libpq connect_timeout
+    DB_PGBOUNCER_TRANSACTION_MODE: bool = False  # Behind pgbouncer in transaction pooling mode: no client-side pool, pgbouncer does it
+    DATABASE_REPLICA_URL: Optional[str] = None  # Read replica for reporting and admin listings; unset sends those reads to the primary
+    DB_REPLICA_POOL_SIZE: int = 3  # Connections kept open per process to the replica
+    DB_REPLICA_MAX_OVERFLOW: int = 2  # Extra replica connections under load
+    DB_REPLICA_MAX_LAG_SECONDS: float = 30  # Reads go to the primary while the replica is further behind than this
+    DB_REPLICA_LAG_CHECK_SECONDS: float = 10  # How often each process re-measures replica lag
 
     # Sentry DSN
-    SENTRY_DSN: str = os.getenv("SENTRY_DSN")
+    SENTRY_DSN: Optional[str] = None  # Sentry is only initialised when this is set
 
     # WordPress Credentials
     WORDPRESS_URL: Optional[str] = None
@@ -115,6 +132,79 @@ Return the result as a JSON array with {batch_size} items.
     BREVO_PASSWORD_RESET_TEMPLATE_ID: int = 2  # Replace with your actual template ID for password reset emails
     PASSWORD_RESET_TOKEN_EXPIRE_HOURS: int = 24
 
+    # Brevo Outbound Rate Control
+    BREVO_MAX_REQUESTS_PER_SECOND: float = 10.0  # Account-level ceiling for Brevo API calls
+    BREVO_BURST: int = 20  # Calls allowed back-to-back before the rate limit applies
+    BREVO_MIN_REQUESTS_PER_SECOND: float = 0.5  # Floor for the adaptive rate after repeated 429s
+    BREVO_MAX_RETRIES: int = 3  # In-call retries for 429s and connections that never opened; other failures wait for the email's retry schedule
+    BREVO_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures before an endpoint's circuit opens
+    BREVO_CIRCUIT_RESET_SECONDS: int = 30  # How long an open circuit waits before a trial call
+
+    # Email Send Retries
+    EMAIL_SEND_MAX_ATTEMPTS: int = 8  # Failed sends before an email is moved to the dead-letter state
+    EMAIL_RETRY_BASE_SECONDS: int = 300  # Delay after the first failed send; doubles on each further failure
+    EMAIL_RETRY_MAX_SECONDS: int = 21600  # Upper bound on the delay between attempts (6 hours)
+    EMAIL_SEND_LEASE_SECONDS: int = 900  # How long a claimed email is hidden from other send ticks; long enough for a batch at the minimum Brevo rate
+
+    # emails table partitions (see app/services/partition_service.py)
+    EMAIL_PARTITION_MONTHS_AHEAD: int = 3  # Monthly partitions kept created ahead; sequences reaching further create theirs on insert
+    EMAIL_ARCHIVE_AFTER_MONTHS: int = 6  # Months after a partition's month ends before it's archived, once all its emails are sent or dead-lettered
+    EMAIL_ARCHIVE_SCHEMA: str = "email_archive"  # Where archived partitions are moved; created by the partitioning migration
+
+    # Webhook submission retention
+    WEBHOOK_PAYLOAD_COMPACT_AFTER_DAYS: int = 7  # Days a submission turned into a sequence keeps its full raw_payload
+    WEBHOOK_SUBMISSION_RETENTION_DAYS: int = 180  # Submissions older than this are deleted; 0 keeps them forever
+    WEBHOOK_RETENTION_BATCH_SIZE: int = 500  # Rows compacted or deleted per transaction
+    WEBHOOK_RETENTION_BATCH_PAUSE_SECONDS: float = 0.2  # Pause between batches, so retention never hogs the database
+    WEBHOOK_RETENTION_MAX_SECONDS: int = 300  # A run stops after this long; the next one carries on
+
+    # Outbound HTTP clients (one pooled client per upstream, see app/core/http_clients.py)
+    HTTP2_ENABLED: bool = True  # Negotiate HTTP/2 with upstreams that support it (needs the h2 package)
+    HTTP_MAX_CONNECTIONS: int = 20  # Connection limit per upstream
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10  # Idle connections kept open per upstream
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0  # Seconds an idle connection stays in the pool
+    PEXELS_TIMEOUT_SECONDS: float = 10.0  # Request timeout for Pexels
+    IMAGE_DOWNLOAD_TIMEOUT_SECONDS: float = 30.0  # Request timeout for downloading featured images from Pexels' CDN
+    BREVO_TIMEOUT_SECONDS: float = 15.0  # Request timeout for Brevo
+    WORDPRESS_TIMEOUT_SECONDS: float = 30.0  # Request timeout for customer WordPress sites
+
+    # WordPress
+    WORDPRESS_TERM_CACHE_TTL_SECONDS: int = 3600  # How long resolved category/tag IDs are cached per site
+    WORDPRESS_TERM_NEGATIVE_TTL_SECONDS: int = 300  # How long a term that failed to resolve is skipped
+    WORDPRESS_MAX_CONCURRENT_REQUESTS: int = 4  # Concurrent publishing requests per WordPress site
+    WORDPRESS_PUBLISH_BATCH_SIZE: int = 20  # Emails loaded from the database per publishing batch
+    WORDPRESS_REGISTRATION_TTL_HOURS: int = 24  # How long a custom post type/field registration is trusted before re-checking
+    MEDIA_SPOOL_MEMORY_BYTES: int = 5 * 1024 * 1024  # Downloaded images larger than this are buffered on disk until uploaded
+
+    # Blog post publishing outbox
+    OUTBOX_POLL_SECONDS: int = 30  # How often each worker drains due outbox entries
+    OUTBOX_BATCH_SIZE: int = 50  # Entries claimed per drain
+    OUTBOX_LEASE_SECONDS: int = 600  # How long a claimed entry is hidden from other workers
+    OUTBOX_MAX_ATTEMPTS: int = 10  # Failed publishes before an entry is given up on
+    OUTBOX_RETRY_BASE_SECONDS: int = 60  # Delay after the first failed publish; doubles on each further failure
+    OUTBOX_RETRY_MAX_SECONDS: int = 3600  # Upper bound on the delay between attempts
+    OUTBOX_SITE_FAILURE_THRESHOLD: int = 3  # Consecutive failed drains before a site is paused
+    OUTBOX_SITE_PAUSE_SECONDS: int = 300  # How long a paused site is left alone before a trial publish
+
+    # API key cache
+    API_KEY_CACHE_TTL_SECONDS: int = 300  # Upper bound on how long a key is cached; changes are pushed over LISTEN/NOTIFY
+    API_KEY_LISTENER_HEARTBEAT_SECONDS: int = 10  # Idle interval after which the notification connection is checked
+    CORS_REFRESH_SECONDS: int = 60  # How often allowed CORS origins are reloaded; key changes also trigger a reload
+
+    # Content formatting
+    CONTENT_FORMAT_WORKERS: int = 2  # Processes formatting large batches of content (bulk re-render) per app worker
+
+    # Authentication
+    PASSWORD_HASH_WORKERS: int = 2  # Processes hashing/verifying passwords per app worker; further logins wait for a free one
+    USER_CACHE_TTL_SECONDS: int = 60  # How long a token's user is cached; edits are pushed over LISTEN/NOTIFY
+
+    # Logging
+    LOG_LEVEL: str = "INFO"  # Default level for application and library loggers
+    LOG_MODULE_LEVELS: str = ""  # Per-module overrides, e.g. "app.services.email_service=DEBUG,sqlalchemy.engine=WARNING"
+    LOG_JSON: bool = False  # Emit one JSON object per line instead of plain text
+    LOG_PAYLOAD_MAX_CHARS: int = 2000  # Payloads passed through log_payload are truncated to this length
+    LOG_ENQUEUE: bool = True  # Hand records to a background thread so logging never blocks on stderr
+
     # Pexels API Key
     PEXELS_API_KEY: str = os.getenv("PEXELS_API_KEY")
 
@@ -0,0 +1,63 @@
+from starlette.middleware.cors import CORSMiddleware
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services import api_key_service
+from loguru import logger
+import threading
+
+# Allowed origins are the customers' WordPress sites. Rather than a list fixed when the app
+# is imported (which needed the database up at boot and a restart for every new site), the
+# middleware checks a set that a background thread reloads every CORS_REFRESH_SECONDS and
+# whenever an API key changes. Until the first load finishes, cross-origin requests are refused.
+
+_allowed_origins = frozenset()
+_refresh_requested = threading.Event()
+_refresher_stop = threading.Event()
+_refresher_thread = None
+
+def allowed_origins() -> frozenset:
+    return _allowed_origins
+
+def refresh_allowed_origins():
+    global _allowed_origins
+    db = SessionLocal()
+    try:
+        origins = frozenset(f"https://{domain}" for domain in api_key_service.get_all_active_domains(db))
+    finally:
+        db.close()
+    if origins != _allowed_origins:
+        logger.info(f"CORS now allows {len(origins)} origins")
+    _allowed_origins = origins
+
+def request_refresh():
+    _refresh_requested.set()
+
+def run_origin_refresher():
+    while not _refresher_stop.is_set():
+        try:
+            refresh_allowed_origins()
+        except Exception as e:
+            logger.warning(f"Could not refresh CORS origins, keeping the previous {len(_allowed_origins)}: {str(e)}")
+        # Bursts of key changes coalesce into one reload
+        _refresh_requested.wait(settings.CORS_REFRESH_SECONDS)
+        _refresh_requested.clear()
+
+def start_origin_refresher():
+    global _refresher_thread
+    api_key_service.add_api_key_change_listener(request_refresh)
+    _refresher_stop.clear()
+    _refresher_thread = threading.Thread(target=run_origin_refresher, name="cors-origin-refresher", daemon=True)
+    _refresher_thread.start()
+
+def stop_origin_refresher():
+    global _refresher_thread
+    if _refresher_thread is None:
+        return
+    _refresher_stop.set()
+    _refresh_requested.set()
+    _refresher_thread.join(timeout=5)
+    _refresher_thread = None
+
+class DynamicCORSMiddleware(CORSMiddleware):
+    def is_allowed_origin(self, origin: str) -> bool:
+        return origin in _allowed_origins
@@ -2,4 +2,10 @@ class AppException(Exception):
     def __init__(self, message: str, status_code: int = 500):
         self.message = message
         self.status_code = status_code
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class CircuitOpenError(AppException):
+    # The call was skipped because the upstream's circuit is open; it never reached the upstream
+    def __init__(self, message: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(message, status_code=503)
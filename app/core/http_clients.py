@@ -0,0 +1,71 @@
+from app.core.config import settings
+from app.core.metrics import HTTP_CLIENT_REQUESTS, HTTP_CLIENT_CONNECTIONS
+from loguru import logger
+from typing import Dict
+import importlib.util
+import httpx
+
+# One long-lived, connection-pooled client per upstream instead of a new client (and a new
+# TCP + TLS handshake) per call. Clients are opened on worker startup and closed on shutdown;
+# get_async_client also creates them on first use for code running outside the app.
+#
+# DNS is resolved by the OS resolver only when a new connection is opened, so with keep-alive
+# pools a lookup happens once per pooled connection rather than once per request.
+
+UPSTREAMS = {
+    "pexels": {"base_url": "https://api.pexels.com", "timeout": settings.PEXELS_TIMEOUT_SECONDS},
+    # Featured image downloads (absolute CDN URLs); kept off the API client's connection pool
+    "images": {"base_url": "", "timeout": settings.IMAGE_DOWNLOAD_TIMEOUT_SECONDS, "follow_redirects": True},
+    "brevo": {"base_url": "https://api.brevo.com", "timeout": settings.BREVO_TIMEOUT_SECONDS},
+    # Every customer has their own site, so WordPress requests use absolute URLs. Sites often
+    # redirect (http -> https, trailing slashes), which requests used to follow for us.
+    "wordpress": {"base_url": "", "timeout": settings.WORDPRESS_TIMEOUT_SECONDS, "follow_redirects": True},
+}
+
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+
+def http2_available() -> bool:
+    return settings.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+def _client_options(upstream: str) -> dict:
+    config = UPSTREAMS[upstream]
+    return {
+        "base_url": config["base_url"],
+        "timeout": httpx.Timeout(config["timeout"], connect=min(5.0, config["timeout"])),
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        ),
+        "http2": http2_available(),
+        "follow_redirects": config.get("follow_redirects", False),
+    }
+
+def _async_request_hook(upstream: str):
+    async def trace(event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            HTTP_CLIENT_CONNECTIONS.labels(upstream).inc()
+
+    async def on_request(request: httpx.Request):
+        HTTP_CLIENT_REQUESTS.labels(upstream).inc()
+        request.extensions["trace"] = trace
+    return on_request
+
+def get_async_client(upstream: str) -> httpx.AsyncClient:
+    client = _async_clients.get(upstream)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_options(upstream), event_hooks={"request": [_async_request_hook(upstream)]})
+        _async_clients[upstream] = client
+    return client
+
+async def open_http_clients():
+    if settings.HTTP2_ENABLED and not http2_available():
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1")
+    for upstream in UPSTREAMS:
+        get_async_client(upstream)
+    logger.info(f"Opened pooled HTTP clients for {', '.join(UPSTREAMS)}")
+
+async def close_http_clients():
+    for client in _async_clients.values():
+        await client.aclose()
+    _async_clients.clear()
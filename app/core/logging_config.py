@@ -0,0 +1,123 @@
+from app.core.config import settings
+from loguru import logger
+from typing import Any, Dict
+import inspect
+import json
+import logging
+import random
+import re
+import sys
+
+# All logging goes through loguru. Modules that use logging.getLogger(__name__), and the
+# libraries we depend on, are routed into it by InterceptHandler so there is one sink, one
+# format and one set of levels.
+#
+# Payloads (prompts, params, webhook bodies, API responses) should be logged with
+#     logger.opt(lazy=True).debug("Params: {}", lambda: log_payload(params))
+# so nothing is serialised unless the record is actually emitted, and what is emitted is
+# redacted and size-capped. High-frequency events can go through sampled(rate).
+
+REDACTED_KEY_PARTS = ("password", "secret", "token", "api_key", "api-key", "authorization")
+EMAIL_ADDRESS = re.compile(r"([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})")
+
+_module_levels: Dict[str, int] = {}
+_level_cache: Dict[str, int] = {}
+_default_level = logging.INFO
+
+class InterceptHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        # Find the caller outside the logging module so the record points at the real source
+        frame, depth = inspect.currentframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+
+        # Levels are looked up by the stdlib logger name (e.g. "sqlalchemy.engine"), not the caller module
+        logger.bind(logger_name=record.name).opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+def parse_module_levels(value: str) -> Dict[str, int]:
+    levels = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        module, level = item.split("=", 1)
+        levels[module.strip()] = logger.level(level.strip().upper()).no
+    return levels
+
+def _level_for(name: str) -> int:
+    level = _level_cache.get(name)
+    if level is None:
+        level = _default_level
+        # Longest configured prefix wins, so "app.services=WARNING,app.services.email_service=DEBUG" works
+        module = name
+        while module:
+            if module in _module_levels:
+                level = _module_levels[module]
+                break
+            module = module.rpartition(".")[0]
+        _level_cache[name] = level
+    return level
+
+def _filter(record) -> bool:
+    if record["level"].no < _level_for(record["extra"].get("logger_name") or record["name"] or ""):
+        return False
+    sample_rate = record["extra"].get("sample_rate")
+    return sample_rate is None or random.random() < sample_rate
+
+def sampled(rate: float):
+    """Logger that emits roughly `rate` of its records; use for per-email and per-request chatter."""
+    return logger.bind(sample_rate=rate)
+
+def redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: "[REDACTED]" if any(part in str(key).lower() for part in REDACTED_KEY_PARTS) else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return EMAIL_ADDRESS.sub(r"\1***@\2", value)
+    return value
+
+def truncate(text: str, limit: int = None) -> str:
+    limit = settings.LOG_PAYLOAD_MAX_CHARS if limit is None else limit
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+def log_payload(value: Any, limit: int = None) -> str:
+    """Redacted, size-capped rendering of a payload. Call it lazily; it is not free."""
+    if hasattr(value, "dict") and callable(value.dict):
+        value = value.dict()
+    value = redact(value)
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    return truncate(text, limit)
+
+def configure_logging():
+    global _module_levels, _default_level
+    _default_level = logger.level(settings.LOG_LEVEL.upper()).no
+    _module_levels = parse_module_levels(settings.LOG_MODULE_LEVELS)
+    _level_cache.clear()
+    min_level = min([_default_level, *_module_levels.values()])
+
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        level=min_level,
+        filter=_filter,
+        serialize=settings.LOG_JSON,
+        enqueue=settings.LOG_ENQUEUE,
+        backtrace=False,
+        diagnose=False
+    )
+
+    # Let stdlib loggers drop disabled records before they reach the intercept handler
+    logging.basicConfig(handlers=[InterceptHandler()], level=_default_level, force=True)
+    for module, level in _module_levels.items():
+        logging.getLogger(module).setLevel(level)
@@ -0,0 +1,91 @@
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from sqlalchemy import event
+import asyncio
+import os
+import time
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR and /metrics
+# aggregates them (see gunicorn_conf.py). Without the env var the default registry is used.
+
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (1, 2.5, 5, 10, 20, 30, 60, 120, 240)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to respond to HTTP requests (webhook ack time included)",
+    ["method", "route", "status"]
+)
+LLM_CALL_SECONDS = Histogram("llm_call_duration_seconds", "OpenAI call latency", ["operation"], buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens_total", "OpenAI tokens used", ["operation", "kind"])
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to Pexels, WordPress and Brevo",
+    ["upstream", "endpoint"], buckets=UPSTREAM_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Database statement execution time", buckets=FAST_BUCKETS)
+SCHEDULER_TICK_SECONDS = Histogram("scheduler_tick_duration_seconds", "Duration of scheduler jobs", ["job"], buckets=UPSTREAM_BUCKETS)
+EMAILS_PER_TICK = Histogram("scheduler_emails_sent_per_tick", "Emails handed to Brevo per scheduler tick", buckets=(0, 1, 5, 10, 25, 50, 100))
+EMAILS_SENT = Counter("emails_sent_total", "Scheduled email send outcomes", ["result"])
+BLOG_POSTS_PUBLISHED = Counter("blog_posts_published_total", "Publishing outbox outcomes", ["result"])
+EMAIL_QUEUE_DEPTH = Gauge("email_queue_depth", "Due emails not yet sent to Brevo", multiprocess_mode="mostrecent")
+EMAIL_QUEUE_LAG_SECONDS = Gauge("email_queue_lag_seconds", "Age of the oldest due, unsent email", multiprocess_mode="mostrecent")
+WEBHOOK_SUBMISSIONS_TABLE_BYTES = Gauge("webhook_submissions_table_bytes", "Size of webhook_submissions with its indexes and TOAST, after the last retention run", multiprocess_mode="mostrecent")
+WEBHOOK_SUBMISSIONS_ROWS = Gauge("webhook_submissions_rows", "Estimated rows in webhook_submissions, after the last retention run", multiprocess_mode="mostrecent")
+WEBHOOK_RETENTION_ROWS = Counter("webhook_retention_rows_total", "Webhook submissions compacted or deleted by retention; its rate is the pruning throughput", ["action"])
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by outcome", ["cache", "result"])
+HTTP_CLIENT_REQUESTS = Counter("http_client_requests_total", "Outbound requests sent through pooled clients", ["upstream"])
+HTTP_CLIENT_CONNECTIONS = Counter("http_client_connections_opened_total", "New outbound connections; requests minus this is pool reuse", ["upstream"])
+DB_POOL_CHECKOUT_SECONDS = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection", ["engine"], buckets=FAST_BUCKETS)
+DB_POOL_TIMEOUTS = Counter("db_pool_checkout_timeouts_total", "Checkouts that gave up waiting for a connection", ["engine"])
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Pooled database connections by state", ["engine", "state"], multiprocess_mode="livesum")
+DB_POOL_CAPACITY = Gauge("db_pool_capacity", "Maximum connections (pool size plus overflow); saturation is in_use / capacity", ["engine"], multiprocess_mode="livesum")
+DB_REPLICA_LAG_SECONDS = Gauge("db_replica_lag_seconds", "Replication lag at the last check; -1 when the replica couldn't be reached", multiprocess_mode="mostrecent")
+DB_READS_ROUTED = Counter("db_read_sessions_total", "Read-only sessions by the database they were sent to", ["target"])
+EVENT_LOOP_LAG_SECONDS = Histogram("event_loop_lag_seconds", "Delay of event loop callbacks beyond their schedule", buckets=FAST_BUCKETS)
+
+def render_metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_SECONDS.observe(time.perf_counter() - conn.info["query_start_time"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_start_time"):
+            context.connection.info["query_start_time"].pop()
+
+def instrument_pool(engine, name: str, capacity: int):
+    if not hasattr(engine.pool, "checkedout"):
+        return  # NullPool (pgbouncer mode) has nothing to report
+
+    def update(*args):
+        # Capacity is set here rather than at import: with gunicorn's preload_app the import
+        # happens in the master, and a forked worker's multiprocess values start from zero
+        DB_POOL_CAPACITY.labels(name).set(capacity)
+        # engine.pool, not a captured pool: engine.dispose() swaps in a new one
+        DB_POOL_CONNECTIONS.labels(name, "in_use").set(engine.pool.checkedout())
+        DB_POOL_CONNECTIONS.labels(name, "idle").set(engine.pool.checkedin())
+
+    event.listen(engine, "checkout", update)
+    event.listen(engine, "checkin", update)
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
@@ -1,6 +1,10 @@
 from functools import wraps
+from email.utils import parsedate_to_datetime
+from app.core.config import settings
+from app.core.exceptions import CircuitOpenError
 import time
 import asyncio
+import threading
 
 class RateLimiter:
     def __init__(self, calls_per_minute):
@@ -25,4 +29,177 @@ def rate_limit(calls_per_minute):
         return wrapper
     return decorator
 
-openai_limiter = rate_limit(60)  # Adjust the rate limit as needed
\ No newline at end of file
+openai_limiter = rate_limit(60)  # Adjust the rate limit as needed
+
+def parse_retry_after(value) -> float | None:
+    # Retry-After is either a number of seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose refill rate follows AIMD: it creeps back up to max_rate on
+    success and halves (at most once per cooldown) when the provider throttles us."""
+
+    def __init__(self, max_rate: float, burst: int, min_rate: float, decrease_cooldown: float = 1.0):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.rate = max_rate
+        self.tokens = float(burst)
+        self.decrease_cooldown = decrease_cooldown
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        # Take a token, going negative if necessary, and return how long the caller must wait.
+        # Reserving up front keeps concurrent callers queued fairly instead of stampeding.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_throttle(self, retry_after: float | None = None):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.decrease_cooldown:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.last_decrease = now
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            # Drop the burst allowance so the reduced rate takes effect immediately
+            self.tokens = min(self.tokens, 0.0)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+                return False
+            # Half-open: let a single trial call through
+            self.trial_in_flight = True
+            return True
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a trial call through again."""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            return remaining if remaining > 0 else self.reset_timeout
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        # The half-open trial got an answer that says nothing about health; let another one through
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class OutboundController:
+    """Shared rate and failure control for one upstream: a single adaptive token bucket
+    sized to the account limit plus a circuit breaker per endpoint."""
+
+    def __init__(self, name: str, max_rate: float, burst: int, min_rate: float, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.bucket = AdaptiveTokenBucket(max_rate, burst, min_rate)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[endpoint]
+
+    def _check_circuit(self, endpoint: str):
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit open for {endpoint}; skipping call", breaker.retry_after())
+
+    def acquire(self, endpoint: str):
+        self._check_circuit(endpoint)
+        self.bucket.acquire()
+
+    async def acquire_async(self, endpoint: str):
+        self._check_circuit(endpoint)
+        await self.bucket.acquire_async()
+
+    def record_success(self, endpoint: str):
+        self.bucket.on_success()
+        self.breaker(endpoint).record_success()
+
+    def record_response(self, endpoint: str, status: int | None, retry_after: float | None = None) -> bool:
+        """Record a failed call and return whether it is worth retrying."""
+        if status == 429:
+            # Throttling only shrinks the bucket; the breaker's failure count and state are left alone
+            self.bucket.on_throttle(retry_after)
+            self.breaker(endpoint).release_trial()
+            return True
+        if status is None or status >= 500:
+            self.breaker(endpoint).record_failure()
+            return True
+        # Other 4xx responses are our fault and won't succeed on retry
+        self.breaker(endpoint).record_success()
+        return False
+
+
+brevo_controller = OutboundController(
+    "Brevo",
+    max_rate=settings.BREVO_MAX_REQUESTS_PER_SECOND,
+    burst=settings.BREVO_BURST,
+    min_rate=settings.BREVO_MIN_REQUESTS_PER_SECOND,
+    failure_threshold=settings.BREVO_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.BREVO_CIRCUIT_RESET_SECONDS
+)
@@ -1,13 +1,169 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
+from contextlib import contextmanager, asynccontextmanager
+from loguru import logger
+from typing import AsyncIterator, Iterator, Optional
+import threading
+import time
 
 from app.core.config import settings
+from app.core.metrics import instrument_engine, instrument_pool, DB_POOL_CHECKOUT_SECONDS, DB_POOL_TIMEOUTS, DB_REPLICA_LAG_SECONDS, DB_READS_ROUTED
 
-engine = create_engine(settings.DATABASE_URL)
+# Two engines over the same database. The async engine (asyncpg) serves the API and the
+# generation/publishing pipeline, which run on the event loop. The sync engine (psycopg2) is
+# kept for Alembic, the APScheduler jobs (they run on the scheduler's own threads), the admin
+# pages and the LISTEN connection.
+#
+# Read-only work that can be slightly stale (admin listings, queue metrics, reports) opens its
+# session with read_session() instead. With DATABASE_REPLICA_URL set that's a streaming
+# replica, so reporting doesn't compete with the scheduler and the pipeline on the primary;
+# while the replica is unreachable or more than DB_REPLICA_MAX_LAG_SECONDS behind, the same
+# reads go to the primary. Either way the transaction is READ ONLY.
+
+class _CheckoutTimer:
+    """Pool mixin that records how long checkouts wait for a connection."""
+    engine_name: str
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.labels(self.engine_name).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.engine_name).observe(time.perf_counter() - start)
+
+class InstrumentedQueuePool(_CheckoutTimer, QueuePool):
+    engine_name = "sync"
+
+class InstrumentedAsyncQueuePool(_CheckoutTimer, AsyncAdaptedQueuePool):
+    engine_name = "async"
+
+class InstrumentedReplicaQueuePool(_CheckoutTimer, QueuePool):
+    engine_name = "replica"
+
+def engine_options(poolclass=InstrumentedQueuePool, pool_size: int = settings.DB_POOL_SIZE, max_overflow: int = settings.DB_MAX_OVERFLOW) -> dict:
+    options = {"connect_args": {"connect_timeout": settings.DB_CONNECT_TIMEOUT_SECONDS}}
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+        # pgbouncer owns the pool; holding server connections here as well would defeat it
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=poolclass,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    return options
+
+def async_database_url() -> URL:
+    if settings.ASYNC_DATABASE_URL:
+        return make_url(settings.ASYNC_DATABASE_URL)
+    return make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg")
+
+def async_engine_options() -> dict:
+    options = {"connect_args": {"timeout": settings.DB_CONNECT_TIMEOUT_SECONDS}}
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+        # Prepared statements are per server connection, which transaction pooling doesn't pin
+        options["poolclass"] = NullPool
+        options["connect_args"].update(statement_cache_size=0, prepared_statement_cache_size=0)
+    else:
+        options.update(
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=settings.DB_ASYNC_POOL_SIZE,
+            max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    return options
+
+engine = create_engine(settings.DATABASE_URL, **engine_options())
+instrument_engine(engine)
+instrument_pool(engine, "sync", settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(async_database_url(), **async_engine_options())
+instrument_engine(async_engine.sync_engine)
+instrument_pool(async_engine.sync_engine, "async", settings.DB_ASYNC_POOL_SIZE + settings.DB_ASYNC_MAX_OVERFLOW)
+# Objects stay usable after commit; lazy loads aren't possible on an AsyncSession anyway
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+replica_engine = None
+if settings.DATABASE_REPLICA_URL:
+    # Read only at the engine level: resetting a pooled connection to READ WRITE, as a per-session
+    # option does on checkin, fails on a hot standby
+    replica_engine = create_engine(
+        settings.DATABASE_REPLICA_URL,
+        execution_options={"postgresql_readonly": True},
+        **engine_options(InstrumentedReplicaQueuePool, settings.DB_REPLICA_POOL_SIZE, settings.DB_REPLICA_MAX_OVERFLOW)
+    )
+    instrument_engine(replica_engine)
+    instrument_pool(replica_engine, "replica", settings.DB_REPLICA_POOL_SIZE + settings.DB_REPLICA_MAX_OVERFLOW)
+
+# Primary read sessions share the sync pool; the option makes psycopg2 open READ ONLY transactions
+_read_only_engines = {
+    "primary": engine.execution_options(postgresql_readonly=True),
+    "replica": replica_engine,
+}
+
+# A replica that has replayed everything it received is current however old its last
+# transaction is (an idle primary sends nothing new); otherwise the lag is the age of the
+# last replayed transaction. Not in recovery means the URL points at a primary.
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+_replica_lock = threading.Lock()
+_replica_checked_at = float("-inf")
+_replica_usable = False
+
+def replica_lag() -> Optional[float]:
+    """Seconds the replica is behind the primary, or None if it can't tell."""
+    with replica_engine.connect() as conn:
+        lag = conn.execute(REPLICA_LAG_QUERY).scalar()
+    return float(lag) if lag is not None else None
+
+def replica_usable() -> bool:
+    """Whether reads may go to the replica; lag is re-measured at most every DB_REPLICA_LAG_CHECK_SECONDS."""
+    global _replica_checked_at, _replica_usable
+    if replica_engine is None:
+        return False
+    with _replica_lock:
+        if time.monotonic() - _replica_checked_at < settings.DB_REPLICA_LAG_CHECK_SECONDS:
+            return _replica_usable
+        try:
+            lag = replica_lag()
+        except exc.SQLAlchemyError as e:
+            logger.warning(f"Read replica unavailable, reading from the primary: {str(e)}")
+            lag = None
+            DB_REPLICA_LAG_SECONDS.set(-1)
+        else:
+            DB_REPLICA_LAG_SECONDS.set(lag if lag is not None else -1)
+        usable = lag is not None and lag <= settings.DB_REPLICA_MAX_LAG_SECONDS
+        if usable != _replica_usable:
+            logger.info(f"Read replica {'in use' if usable else 'out of use'} (lag: {lag})")
+        _replica_usable = usable
+        _replica_checked_at = time.monotonic()
+        return usable
+
+def read_session() -> Session:
+    """A session for read-only work that tolerates DB_REPLICA_MAX_LAG_SECONDS of staleness."""
+    target = "replica" if replica_usable() else "primary"
+    DB_READS_ROUTED.labels(target).inc()
+    return SessionLocal(bind=_read_only_engines[target])
+
 Base = declarative_base()
 
 def get_db():
@@ -15,4 +171,66 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@contextmanager
+def read_session_scope() -> Iterator[Session]:
+    """read_session() for one unit of reporting work; nothing to commit."""
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db():
+    """get_db for read-only endpoints (listings, status, exports): served by the replica when it's current."""
+    with read_session_scope() as db:
+        yield db
+
+def reset_engines_after_fork():
+    """Forget connections inherited from a parent process without closing them.
+
+    Run in each gunicorn worker after fork (gunicorn_conf.post_fork). Importing the app doesn't
+    connect, so normally there's nothing to forget; this keeps a worker from ever sharing a
+    socket with the master if something in the master did.
+    """
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    if replica_engine is not None:
+        replica_engine.dispose(close=False)
+
+async def dispose_async_engine():
+    # asyncpg connections have to be closed on the event loop that opened them
+    await async_engine.dispose()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@contextmanager
+def session_scope(**options):
+    """A session for one short unit of work, committed on success.
+
+    Open one around each group of queries rather than keeping a session across LLM or HTTP
+    calls, so the connection goes back to the pool while we wait on the network.
+    """
+    db = SessionLocal(**options)
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    """session_scope for async code: one short unit of work, committed on success."""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
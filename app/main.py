@@ -1,21 +1,22 @@
-import os
-from dotenv import load_dotenv
 import logging
-from fastapi import FastAPI, Request, HTTPException, Depends, Security
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, Request, HTTPException, Depends, Security, Response
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.core.config import settings
-from app.db.database import engine, Base, SessionLocal, get_db
+from app.db.database import get_db, dispose_async_engine
 from app.api.api_v1.api import router as api_router
 from app.services.email_service import check_and_send_scheduled_emails, check_and_schedule_emails
+from app.services.render_service import rerender_stale_emails
+from app.services.partition_service import maintain_email_partitions
+from app.services.webhook_service import apply_webhook_retention
 from app.services import api_key_service
-from app.services.api_key_service import get_all_active_domains
+from app.services.api_key_service import start_api_key_listener, stop_api_key_listener
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from app.core.auth import get_current_active_user
+from app.core.auth import get_current_active_user, shutdown_hash_executor
+from app.utils.content_formatter import shutdown_format_executor
 from app.schemas.user import User
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, AsyncExitStack
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from fastapi.staticfiles import StaticFiles
@@ -23,42 +24,97 @@ from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 from app.api.admin import admin
 from filelock import FileLock, Timeout
-
-# Load environment variables
-env = os.getenv('ENVIRONMENT', 'prod')
-load_dotenv(f'.env.{env}' if env != 'prod' else '.env')
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from app.core.metrics import HTTP_REQUEST_SECONDS, render_metrics, monitor_event_loop_lag
+from app.core.logging_config import configure_logging
+from app.core.http_clients import open_http_clients, close_http_clients
+from app.core.cors import DynamicCORSMiddleware, start_origin_refresher, stop_origin_refresher
+from app.services.outbox_service import run_outbox_worker
+import asyncio
+import time
+
+# Importing this module only builds the app: no database connection, no threads, no
+# scheduler. Everything that touches the outside world starts in lifespan(), once the server
+# is actually running it. The schema is managed by Alembic (run_migrations.sh).
 
 logger = logging.getLogger(__name__)
 
-Base.metadata.create_all(bind=engine)
-
-sentry_sdk.init(
-    dsn=settings.SENTRY_DSN,
-    integrations=[FastApiIntegration()],
-    traces_sample_rate=1.0,
-    profiles_sample_rate=1.0,
-)
-
-app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION)
+# Sentry's FastAPI integration patches middleware and route handlers as they are built, so it
+# has to be initialised before the app and its routers are, not in lifespan
+if settings.SENTRY_DSN:
+    sentry_sdk.init(
+        dsn=settings.SENTRY_DSN,
+        integrations=[FastApiIntegration()],
+        traces_sample_rate=1.0,
+        profiles_sample_rate=1.0,
+    )
 
-def get_allowed_origins():
-    db = SessionLocal()
+def locked_check_and_send_scheduled_emails():
+    lock = FileLock("email_sending.lock", timeout=10)  # 10 seconds timeout
     try:
-        return get_all_active_domains(db)
-    finally:
-        db.close()
+        with lock:
+            check_and_send_scheduled_emails()
+    except Timeout:
+        logger.info("Another instance of check_and_send_scheduled_emails is already running. Skipping this run.")
+    except Exception as e:
+        logger.error(f"Error in scheduled job: {str(e)}")
+
+def start_scheduler() -> BackgroundScheduler:
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(locked_check_and_send_scheduled_emails, CronTrigger(minute="*/5")) #Set to 5 minutes for testing. Change this to something more appropriate for production.
+    scheduler.add_job(check_and_schedule_emails, CronTrigger(hour="0", minute="0"))  # Run daily at midnight
+    scheduler.add_job(rerender_stale_emails, CronTrigger(hour="1", minute="0"))  # Rebuild pre-rendered content after a formatter change
+    scheduler.add_job(maintain_email_partitions, CronTrigger(hour="2", minute="0"))  # Create upcoming emails partitions, archive fully sent ones
+    scheduler.add_job(apply_webhook_retention, CronTrigger(minute="30"))  # Compact and prune webhook submissions a little at a time
+    scheduler.start()
+    return scheduler
+
+async def cancel_task(task: asyncio.Task):
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    # Each resource's teardown is registered as it starts and runs in reverse order, so a
+    # startup step that raises still stops everything started before it
+    async with AsyncExitStack() as stack:
+        stack.push_async_callback(dispose_async_engine)
+        stack.callback(shutdown_format_executor)
+        stack.callback(shutdown_hash_executor)
+        stack.push_async_callback(close_http_clients)
+        await open_http_clients()
+        stack.callback(stop_api_key_listener)
+        start_api_key_listener()
+        stack.callback(stop_origin_refresher)
+        start_origin_refresher()
+        for coroutine in (monitor_event_loop_lag, run_outbox_worker):
+            stack.push_async_callback(cancel_task, asyncio.create_task(coroutine()))
+        scheduler = start_scheduler()
+        stack.callback(scheduler.shutdown)
+        yield
+
+app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION, lifespan=lifespan)
 
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[f"https://{domain}" for domain in get_allowed_origins()],
+    DynamicCORSMiddleware,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so per-id paths don't explode the series count
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", str(status)).observe(time.perf_counter() - start)
+
 # Add session middleware
 app.add_middleware(SessionMiddleware, secret_key="your-secret-key")  # Replace with a secure secret key
 
@@ -74,23 +130,10 @@ templates = Jinja2Templates(directory="app/templates")
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
-scheduler = BackgroundScheduler()
-
-def locked_check_and_send_scheduled_emails():
-    lock = FileLock("email_sending.lock", timeout=10)  # 10 seconds timeout
-    try:
-        with lock:
-            check_and_send_scheduled_emails()
-    except Timeout:
-        logger.info("Another instance of check_and_send_scheduled_emails is already running. Skipping this run.")
-    except Exception as e:
-        logger.error(f"Error in scheduled job: {str(e)}")
-
-scheduler.add_job(locked_check_and_send_scheduled_emails, CronTrigger(minute="*/5")) #Set to 5 minutes for testing. Change this to something more appropriate for production.
-scheduler.add_job(check_and_schedule_emails, CronTrigger(hour="0", minute="0"))  # Run daily at midnight
-scheduler.start()
-
-app.add_event_handler("shutdown", scheduler.shutdown)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/users/token")
 
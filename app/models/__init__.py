@@ -4,3 +4,6 @@ from .api_key import APIKey
 from .sequence import Sequence
 from .email import Email
 from .webhook_submission import WebhookSubmission
+from .wordpress_registration import WordPressRegistration
+from .wordpress_media import WordPressMedia
+from .blog_post_outbox import BlogPostOutbox
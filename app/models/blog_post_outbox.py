@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, ForeignKeyConstraint, Index, text
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class BlogPostOutbox(Base):
+    __tablename__ = "blog_post_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email_id = Column(Integer, unique=True, nullable=False)  # Written in the same transaction as the email
+    email_scheduled_for = Column(DateTime, nullable=True)  # The email's partition key, so the reference can use the email's primary key
+    api_key_id = Column(Integer, ForeignKey("api_keys.id"), nullable=False)  # WordPress site to publish to
+    custom_post_type = Column(String, nullable=False)
+    idempotency_key = Column(String, unique=True, nullable=False)  # Becomes part of the post slug so a retry can find a post it already created
+    status = Column(String, nullable=False, default="pending", server_default="pending")  # pending, published or dead
+    attempt_count = Column(Integer, nullable=False, default=0, server_default="0")  # Failed publish attempts so far
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_until = Column(DateTime(timezone=True), nullable=True)  # Lease held by the worker that claimed the entry
+    claim_count = Column(Integer, nullable=False, default=0, server_default="0")  # Times claimed; after the first, an earlier claim may have created the post
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    published_at = Column(DateTime(timezone=True), nullable=True)
+
+    email = relationship("Email")
+    api_key = relationship("APIKey")
+
+    __table_args__ = (
+        ForeignKeyConstraint(["email_id", "email_scheduled_for"], ["emails.id", "emails.scheduled_for"], name="blog_post_outbox_email_fkey"),
+        # Covers the worker's due-entry query; published and dead entries drop out of it
+        Index("ix_blog_post_outbox_due", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+    )
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index, text
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.dialects.postgresql import JSONB
 
 from app.db.database import Base
@@ -17,21 +17,46 @@ class EmailBase(BaseModel):
     photographer: Optional[str] = None
     pexels_url: Optional[str] = None
 
+# The subject, content and everything rendered from them are only needed to send or publish
+# an email, so they aren't loaded with it by default: scheduling, listing and counting emails
+# only read the narrow columns. Query with undefer_group(BODY) where the bodies are used.
+BODY = "body"
+
 class Email(Base):
     __tablename__ = "emails"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     sequence_id = Column(Integer, ForeignKey("sequences.id"))
-    subject = Column(String)
-    content = Column(JSONB)  # This will store the dynamic content sections
-    scheduled_for = Column(DateTime)
+    subject = deferred(Column(String), group=BODY)
+    content = deferred(Column(JSONB), group=BODY)  # This will store the dynamic content sections
+    scheduled_for = Column(DateTime, primary_key=True)  # Partition key, so part of the key; never changes after insert
     sent_to_brevo = Column(Boolean, default=False)
     sent_to_brevo_at = Column(DateTime, nullable=True)
     brevo_message_id = Column(String, nullable=True)
-    category = Column(String)
-    tags = Column(JSONB)
-    image_url = Column(String)
-    photographer = Column(String)
-    pexels_url = Column(String)
+    category = deferred(Column(String), group=BODY)
+    tags = deferred(Column(JSONB), group=BODY)
+    image_url = deferred(Column(String), group=BODY)
+    photographer = deferred(Column(String), group=BODY)
+    pexels_url = deferred(Column(String), group=BODY)
+    rendered_brevo_params = deferred(Column(JSONB, nullable=True), group=BODY)  # Send-ready Brevo template params, built at generation time
+    rendered_blog_content = deferred(Column(JSONB, nullable=True), group=BODY)  # Blog-ready section content for the WordPress custom fields
+    render_version = Column(Integer, nullable=True)  # RENDER_VERSION the rendered columns were built with
+    attempt_count = Column(Integer, nullable=False, default=0, server_default="0")  # Failed send attempts so far
+    last_error = Column(String, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)  # Earliest retry after a failed send
+    dead_lettered_at = Column(DateTime, nullable=True)  # Set once attempts are exhausted; cleared on requeue
+    wordpress_post_id = Column(Integer, nullable=True)  # Draft post created for this email; set emails are skipped on re-runs
 
     sequence = relationship("Sequence", back_populates="emails")
+
+    __table_args__ = (
+        # Covers the scheduler's due-email query; sent and dead-lettered rows drop out of it
+        Index(
+            "ix_emails_due",
+            "scheduled_for",
+            "next_attempt_at",
+            postgresql_where=text("sent_to_brevo = false AND dead_lettered_at IS NULL")
+        ),
+        # Monthly partitions, created ahead by partition_service; fully sent old months are archived
+        {"postgresql_partition_by": "RANGE (scheduled_for)"},
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Time
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Time, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from app.db.database import Base
@@ -26,5 +26,7 @@ class Sequence(Base):
     error_message = Column(String, nullable=True)
     preferred_time = Column(Time, nullable=False, default=func.time('09:00:00'))
     timezone = Column(String, nullable=False, default='UTC')
+    api_key_id = Column(Integer, ForeignKey('api_keys.id'), nullable=True)  # WordPress site the sequence's blog posts go to
+    custom_post_type = Column(String, nullable=True)  # Blog posts are queued in blog_post_outbox when both are set
 
     emails = relationship("Email", back_populates="sequence")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from app.db.database import Base
 
@@ -18,4 +18,16 @@ class WebhookSubmission(Base):
     preferred_time = Column(String)
     timezone = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    raw_payload = Column(JSON)
\ No newline at end of file
+    raw_payload = Column(JSON)
+    sequence_id = Column(Integer, ForeignKey("sequences.id", ondelete="SET NULL"), nullable=True)  # Set once the submission has been turned into a sequence
+    payload_compacted_at = Column(DateTime(timezone=True), nullable=True)  # When the fields copied into the typed columns were dropped from raw_payload
+
+    __table_args__ = (
+        # Retention (webhook_service.apply_webhook_retention): pruning by age, and the payloads still to compact
+        Index("ix_webhook_submissions_created_at", "created_at"),
+        Index(
+            "ix_webhook_submissions_compactable",
+            "created_at",
+            postgresql_where=text("sequence_id IS NOT NULL AND payload_compacted_at IS NULL")
+        ),
+    )
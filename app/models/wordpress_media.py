@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class WordPressMedia(Base):
+    __tablename__ = "wordpress_media"
+
+    id = Column(Integer, primary_key=True, index=True)
+    site_url = Column(String, nullable=False)
+    source_url = Column(String, nullable=False)  # Image URL the attachment was uploaded from (e.g. a Pexels photo)
+    media_id = Column(Integer, nullable=False)  # WordPress attachment ID on site_url
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("site_url", "source_url", name="uq_wordpress_media_site_source"),
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class WordPressRegistration(Base):
+    __tablename__ = "wordpress_registrations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    site_url = Column(String, nullable=False)
+    custom_post_type = Column(String, nullable=False)
+    structure_hash = Column(String, nullable=False)  # Hash of the email sections the custom fields were registered for
+    registered_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Forms can post to the same post type with different sections; each structure is tracked on its own
+        UniqueConstraint("site_url", "custom_post_type", "structure_hash", name="uq_wordpress_registrations_site_post_type_structure"),
+    )
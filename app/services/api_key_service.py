@@ -1,44 +1,221 @@
 import secrets
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session
 from app.models.api_key import APIKey
+from app.db.database import AsyncSessionLocal, engine
+from app.core.config import settings
+from app.core.metrics import record_cache
+from cachetools import TTLCache
 from datetime import datetime
-from typing import List
+from typing import Callable, List, NamedTuple, Optional
+import hashlib
 import logging
+import os
+from select import select as wait_readable
+import threading
 
 logger = logging.getLogger(__name__)
 
-def generate_api_key(db: Session, user_id: int) -> str:
+# Active API keys and their WordPress settings are cached per process, so authenticating a
+# request normally costs no database round-trip. Every change to a key sends a NOTIFY on
+# API_KEY_CHANNEL in the same transaction; each process LISTENs on its own connection and
+# drops the entry as soon as the change commits. While that connection is down the cache
+# is bypassed, so a missed notification can never keep a deactivated key alive.
+
+API_KEY_CHANNEL = "api_key_changed"
+
+class CachedAPIKey(NamedTuple):
+    id: int
+    key: str
+    user_id: int
+    wordpress_url: Optional[str]
+    wordpress_username: Optional[str]
+    wordpress_app_password: Optional[str]
+
+# sha256(key) -> CachedAPIKey, or None for keys that are unknown or inactive
+_api_key_cache = TTLCache(maxsize=10000, ttl=settings.API_KEY_CACHE_TTL_SECONDS)
+_cache_lock = threading.Lock()
+# Bumped on every invalidation so a lookup racing with a change doesn't cache the old row
+_cache_generation = 0
+_listener_connected = threading.Event()
+_listener_stop = threading.Event()
+_listener_thread: Optional[threading.Thread] = None
+# Written to by stop_api_key_listener so the listener wakes from its wait straight away
+_listener_wakeup_read, _listener_wakeup_write = os.pipe()
+# Called (from the listener thread) after any invalidation; must not block
+_change_listeners: List[Callable[[], None]] = []
+
+def _cache_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def invalidate_cached_api_key(key_hash: Optional[str] = None):
+    """Drop one key (by its sha256) from this process' cache, or everything when key_hash is None."""
+    global _cache_generation
+    with _cache_lock:
+        _cache_generation += 1
+        if key_hash is None:
+            _api_key_cache.clear()
+        else:
+            _api_key_cache.pop(key_hash, None)
+    for listener in _change_listeners:
+        listener()
+
+def add_api_key_change_listener(listener: Callable[[], None]):
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+# Channel -> invalidation handler for everything the listener thread receives
+_channel_handlers = {API_KEY_CHANNEL: invalidate_cached_api_key}
+
+def api_key_notification(api_key: str):
+    """Statement that queues an invalidation for every process; Postgres delivers it when the transaction commits."""
+    return text("SELECT pg_notify(:channel, :payload)").bindparams(channel=API_KEY_CHANNEL, payload=_cache_key(api_key))
+
+def notify_api_key_changed(db: Session, api_key: str):
+    db.execute(api_key_notification(api_key))
+
+async def get_cached_api_key(api_key: str) -> Optional[CachedAPIKey]:
+    """The active key's settings, from the cache when possible; None if the key is unknown or inactive."""
+    if not api_key:
+        return None
+    key_hash = _cache_key(api_key)
+    use_cache = _listener_connected.is_set()
+    if use_cache:
+        with _cache_lock:
+            hit = key_hash in _api_key_cache
+            cached = _api_key_cache.get(key_hash)
+            generation = _cache_generation
+        record_cache("api_keys", hit)
+        if hit:
+            return cached
+
+    async with AsyncSessionLocal() as db:
+        db_api_key = await get_api_key(db, api_key)
+    cached = None
+    if db_api_key:
+        cached = CachedAPIKey(
+            id=db_api_key.id,
+            key=db_api_key.key,
+            user_id=db_api_key.user_id,
+            wordpress_url=db_api_key.wordpress_url,
+            wordpress_username=db_api_key.wordpress_username,
+            wordpress_app_password=db_api_key.wordpress_app_password
+        )
+    if use_cache:
+        with _cache_lock:
+            if generation == _cache_generation and _listener_connected.is_set():
+                _api_key_cache[key_hash] = cached
+    return cached
+
+def add_notification_handler(channel: str, handler: Callable[[Optional[str]], None]):
+    """Also LISTEN on `channel`; handler gets each payload, or None after a reconnect (clear everything).
+
+    Register before start_api_key_listener runs.
+    """
+    _channel_handlers[channel] = handler
+
+def notifications_connected() -> bool:
+    """Whether change notifications are being received; caches relying on them should be bypassed otherwise."""
+    return _listener_connected.is_set()
+
+def _listen(connection):
+    cursor = connection.cursor()
+    for channel in _channel_handlers:
+        cursor.execute(f"LISTEN {channel}")
+    # Anything that changed before we were listening may be stale
+    for handler in _channel_handlers.values():
+        handler(None)
+    _listener_connected.set()
+    logger.info(f"Listening for changes on {', '.join(_channel_handlers)}")
+    while not _listener_stop.is_set():
+        readable, _, _ = wait_readable([connection, _listener_wakeup_read], [], [], settings.API_KEY_LISTENER_HEARTBEAT_SECONDS)
+        if not readable:
+            # Idle; make sure the connection is still alive rather than waiting on a dead socket
+            cursor.execute("SELECT 1")
+        connection.poll()
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            _channel_handlers[notify.channel](notify.payload)
+
+def run_api_key_listener():
+    delay = 1
+    while not _listener_stop.is_set():
+        connection = None
+        try:
+            # A dedicated DBAPI connection outside the pool; it is held for the life of the process
+            # Must bypass pgbouncer: notifications don't survive transaction pooling
+            url = make_url(settings.DATABASE_LISTEN_URL) if settings.DATABASE_LISTEN_URL else engine.url
+            connect_args, connect_kwargs = engine.dialect.create_connect_args(url)
+            connection = engine.dialect.connect(*connect_args, **connect_kwargs)
+            connection.autocommit = True
+            delay = 1
+            _listen(connection)
+        except Exception as e:
+            logger.warning(f"Change listener disconnected, bypassing cached API keys and users until it reconnects: {str(e)}")
+        finally:
+            _listener_connected.clear()
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+        _listener_stop.wait(delay)
+        delay = min(delay * 2, 60)
+
+def start_api_key_listener():
+    global _listener_thread
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE and not settings.DATABASE_LISTEN_URL:
+        logger.warning("DB_PGBOUNCER_TRANSACTION_MODE is set without DATABASE_LISTEN_URL; API key and user caches are disabled")
+        return
+    _listener_stop.clear()
+    _listener_thread = threading.Thread(target=run_api_key_listener, name="api-key-listener", daemon=True)
+    _listener_thread.start()
+
+def stop_api_key_listener():
+    global _listener_thread
+    if _listener_thread is None:
+        return
+    _listener_stop.set()
+    os.write(_listener_wakeup_write, b"x")
+    _listener_thread.join(timeout=5)
+    _listener_thread = None
+    # Drain the wakeup so a restarted listener doesn't see it
+    while wait_readable([_listener_wakeup_read], [], [], 0)[0]:
+        os.read(_listener_wakeup_read, 64)
+
+async def generate_api_key(db: AsyncSession, user_id: int) -> str:
     key = secrets.token_urlsafe(32)
-    db_api_key = APIKey(key=key, user_id=user_id)
-    db.add(db_api_key)
-    db.commit()
-    db.refresh(db_api_key)
+    db.add(APIKey(key=key, user_id=user_id))
+    # The key may have been looked up (and cached as unknown) before it existed
+    await db.execute(api_key_notification(key))
+    await db.commit()
     return key
 
-def validate_api_key(db: Session, api_key: str) -> bool:
-    db_api_key = db.query(APIKey).filter(APIKey.key == api_key, APIKey.is_active == True).first()
-    return db_api_key is not None
+async def validate_api_key(api_key: str) -> bool:
+    return await get_cached_api_key(api_key) is not None
 
-def deactivate_api_key(db: Session, key: str) -> bool:
-    db_api_key = db.query(APIKey).filter(APIKey.key == key).first()
+async def deactivate_api_key(db: AsyncSession, key: str) -> bool:
+    db_api_key = (await db.execute(select(APIKey).where(APIKey.key == key))).scalars().first()
     if db_api_key:
         db_api_key.is_active = False
-        db.commit()
+        await db.execute(api_key_notification(key))
+        await db.commit()
+        invalidate_cached_api_key(_cache_key(key))
         return True
     return False
 
-def get_api_key(db: Session, api_key: str) -> APIKey:
-    return db.query(APIKey).filter(APIKey.key == api_key, APIKey.is_active == True).first()
+async def get_api_key(db: AsyncSession, api_key: str) -> Optional[APIKey]:
+    return (await db.execute(select(APIKey).where(APIKey.key == api_key, APIKey.is_active == True))).scalars().first()
 
 def get_all_active_domains(db: Session) -> List[str]:
-    active_api_keys = db.query(APIKey).filter(APIKey.is_active == True, APIKey.wordpress_url.isnot(None)).all()
-    domains = list(set(extract_domain(api_key.wordpress_url) for api_key in active_api_keys))
-    logger.info(f"Active domains: {['https://' + domain for domain in domains]}")
+    wordpress_urls = db.query(APIKey.wordpress_url).filter(APIKey.is_active == True, APIKey.wordpress_url.isnot(None)).all()
+    domains = list(set(extract_domain(wordpress_url) for (wordpress_url,) in wordpress_urls))
+    logger.debug(f"Active domains: {['https://' + domain for domain in domains]}")
     return domains
 
 def extract_domain(url: str) -> str:
     from urllib.parse import urlparse
     parsed_url = urlparse(url)
-    domain = parsed_url.netloc
-    logger.info(f"Extracted domain '{domain}' from URL '{url}'")
-    return domain
\ No newline at end of file
+    return parsed_url.netloc
\ No newline at end of file
@@ -1,89 +1,439 @@
-import requests
+import httpx
 from app.core.config import settings
 import re
 from app.models.api_key import APIKey
 from loguru import logger
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple, Union
+from cachetools import TTLCache
+import asyncio
+import html
+import unicodedata
+from app.core.logging_config import log_payload
 from app.core.exceptions import AppException
 from app.schemas.sequence import EmailSection
+from app.models.email import Email
+from app.models.wordpress_registration import WordPressRegistration
+from app.models.wordpress_media import WordPressMedia
+from urllib.parse import urlsplit
+import mimetypes
+import posixpath
+import tempfile
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+from app.services.render_service import get_blog_content
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.metrics import UPSTREAM_SECONDS
+from app.core.http_clients import get_async_client
 
-def create_blog_post(content: Dict[str, str], metadata: dict, api_key: APIKey) -> str:
-    # Content filtering is temporarily disabled
-    # for section_content in content.values():
-    #     if filter_content(section_content):
-    #         return "Content flagged as potentially inappropriate"
-    
-    # Create WordPress post
+TAXONOMY_ENDPOINTS = {"category": "categories", "tag": "tags"}
+TERM_LOOKUP_PAGE_SIZE = 100  # WordPress' per_page maximum
+BATCH_MAX_REQUESTS = 25  # Default maxItems of WordPress' /batch/v1 endpoint (WordPress 5.6+)
+
+# Category/tag name -> ID per site, keyed by (wordpress_url, taxonomy, lowercased name).
+# Terms that failed to resolve are remembered briefly so every post doesn't retry them.
+_term_cache = TTLCache(maxsize=10000, ttl=settings.WORDPRESS_TERM_CACHE_TTL_SECONDS)
+_missing_terms = TTLCache(maxsize=10000, ttl=settings.WORDPRESS_TERM_NEGATIVE_TTL_SECONDS)
+# In-flight term creates; concurrent posts needing the same new term await the same future
+_term_creates: Dict[Tuple[str, str, str], asyncio.Future] = {}
+# Source image URL -> attachment ID per site, keyed by (wordpress_url, source_url); backed by wordpress_media
+_media_cache = TTLCache(maxsize=10000, ttl=settings.WORDPRESS_TERM_CACHE_TTL_SECONDS)
+_media_uploads: Dict[Tuple[str, str], asyncio.Future] = {}
+# Whether a site exposes /batch/v1, detected once per site
+_batch_support = TTLCache(maxsize=1000, ttl=settings.WORDPRESS_REGISTRATION_TTL_HOURS * 3600)
+# Caps concurrent publishing requests per WordPress site
+_site_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def site_semaphore(api_key: APIKey) -> asyncio.Semaphore:
+    site = api_key.wordpress_url.rstrip('/')
+    if site not in _site_semaphores:
+        _site_semaphores[site] = asyncio.Semaphore(settings.WORDPRESS_MAX_CONCURRENT_REQUESTS)
+    return _site_semaphores[site]
+
+async def supports_batch(api_key: APIKey) -> bool:
+    site = api_key.wordpress_url.rstrip('/')
+    if site not in _batch_support:
+        try:
+            async with site_semaphore(api_key):
+                response = await get_async_client("wordpress").get(f"{site}/wp-json/", params={'_fields': 'namespaces'})
+            response.raise_for_status()
+            _batch_support[site] = 'batch/v1' in response.json().get('namespaces', [])
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            logger.warning(f"Could not detect WordPress batch support on {site}: {str(e)}")
+            _batch_support[site] = False
+    return _batch_support[site]
+
+async def wordpress_batch(api_key: APIKey, requests: List[dict]) -> Optional[List[Tuple[int, Any]]]:
+    """Send sub-requests through /batch/v1, 25 per call, and return (status, body) for each in order.
+
+    Returns None if the site turns out not to have the endpoint, so callers can fall back to single
+    requests; nothing was executed in that case. Any other failure raises httpx.HTTPError.
+    """
+    url = f"{api_key.wordpress_url}/wp-json/batch/v1"
+    auth = (api_key.wordpress_username, api_key.wordpress_app_password)
+
+    async def send_chunk(chunk: List[dict]) -> Optional[List[Tuple[int, Any]]]:
+        async with site_semaphore(api_key):
+            with UPSTREAM_SECONDS.labels("wordpress", "batch").time():
+                response = await get_async_client("wordpress").post(url, auth=auth, json={'validation': 'normal', 'requests': chunk})
+        if response.status_code == 404:
+            _batch_support[api_key.wordpress_url.rstrip('/')] = False
+            return None
+        response.raise_for_status()
+        return [(item.get('status'), item.get('body')) for item in response.json()['responses']]
+
+    chunks = [requests[i:i + BATCH_MAX_REQUESTS] for i in range(0, len(requests), BATCH_MAX_REQUESTS)]
+    results = await asyncio.gather(*[send_chunk(chunk) for chunk in chunks])
+    if any(result is None for result in results):
+        return None
+    return [item for result in results for item in result]
+
+def _wordpress_error(status: int, body: Any) -> AppException:
+    message = body.get('message') if isinstance(body, dict) else None
+    return AppException(f"WordPress returned {status}: {message or body}", status_code=502)
+
+async def build_post_data(metadata: dict, api_key: APIKey) -> dict:
+    category_id = await get_category_id(api_key, metadata['category'])
     post_data = {
         'title': metadata['title'],
         'status': 'draft',
-        'categories': [get_category_id(api_key, metadata['category'])],
-        'tags': get_tag_ids(api_key, metadata['tags']),
+        'categories': [category_id] if category_id is not None else [],
+        'tags': await get_tag_ids(api_key, metadata['tags']),
         'content': '',  # Leave the content empty
     }
+    if metadata.get('slug'):
+        post_data['slug'] = metadata['slug']
+
+    if metadata.get('featured_image_url'):
+        media_id = await get_media_id(api_key, metadata['featured_image_url'])
+        if media_id is not None:
+            post_data['featured_media'] = media_id
 
     # Add custom fields
     if 'custom_fields' in metadata:
         post_data['meta'] = metadata['custom_fields']
-        logger.info(f"Custom fields being sent: {metadata['custom_fields']}")
+    return post_data
+
+async def publish_blog_post(metadata: dict, api_key: APIKey) -> int:
+    """Create a draft post and return its WordPress ID. Raises httpx.HTTPError on failure."""
+    post_data = await build_post_data(metadata, api_key)
 
     # Post to WordPress
     url = f"{api_key.wordpress_url}/wp-json/wp/v2/{metadata['custom_post_type']}"
     auth = (api_key.wordpress_username, api_key.wordpress_app_password)
     
-    logger.info(f"Attempting to create blog post with data: {post_data}")
+    logger.opt(lazy=True).debug("Attempting to create blog post with data: {}", lambda: log_payload(post_data))
+
+    async with site_semaphore(api_key):
+        with UPSTREAM_SECONDS.labels("wordpress", "posts").time():
+            response = await get_async_client("wordpress").post(url, json=post_data, auth=auth)
+    response.raise_for_status()
+    post_id = response.json()['id']
+    logger.info(f"Blog post created successfully with ID: {post_id}")
+    logger.opt(lazy=True).debug("WordPress response: {}", lambda: log_payload(response.text))
+    return post_id
+
+async def publish_blog_posts(metadatas: List[dict], api_key: APIKey) -> List[Union[int, BaseException]]:
+    """Create several draft posts; returns a post ID or the exception for each, in order.
+
+    Sites with /batch/v1 get up to 25 posts per request; others get one request per post.
+    """
+    if len(metadatas) > 1 and await supports_batch(api_key):
+        post_datas = [await build_post_data(metadata, api_key) for metadata in metadatas]
+        try:
+            responses = await wordpress_batch(api_key, [
+                {'method': 'POST', 'path': f"/wp/v2/{metadata['custom_post_type']}", 'body': post_data}
+                for metadata, post_data in zip(metadatas, post_datas)
+            ])
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            return [e] * len(metadatas)
+        if responses is not None:
+            results = []
+            for status, body in responses:
+                if status in (200, 201) and isinstance(body, dict) and 'id' in body:
+                    results.append(body['id'])
+                else:
+                    results.append(_wordpress_error(status, body))
+            logger.info(f"Created {sum(isinstance(result, int) for result in results)} of {len(results)} blog posts through the batch endpoint")
+            return results
 
+    return await asyncio.gather(*[publish_blog_post(metadata, api_key) for metadata in metadatas], return_exceptions=True)
+
+async def create_blog_post(content: Dict[str, str], metadata: dict, api_key: APIKey) -> str:
+    # Content filtering is temporarily disabled
+    # for section_content in content.values():
+    #     if filter_content(section_content):
+    #         return "Content flagged as potentially inappropriate"
+    
     try:
-        response = requests.post(url, json=post_data, auth=auth)
-        response.raise_for_status()
-        post_id = response.json()['id']
-        logger.info(f"Blog post created successfully. Response: {response.text}")
+        post_id = await publish_blog_post(metadata, api_key)
         return f"Blog post created with ID: {post_id} (in draft status for review)"
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Failed to create blog post: {str(e)}")
-        logger.error(f"Response content: {e.response.text if e.response else 'No response content'}")
+        response = getattr(e, "response", None)
+        logger.error(f"Response content: {response.text if response is not None else 'No response content'}")
         return f"Failed to create blog post: {str(e)}"
 
-def get_category_id(api_key: APIKey, category_name: str) -> int:
-    url = f"{api_key.wordpress_url}/wp-json/wp/v2/categories"
+def blog_post_metadata(email: Email, custom_post_type: str) -> dict:
+    blog_post_content = get_blog_content(email)
+    return {
+        "title": f"{email.subject}",
+        "category": email.category,
+        "tags": email.tags,
+        "custom_post_type": custom_post_type,
+        # Each email section becomes a custom field
+        "custom_fields": {f"email_section_{section_name}": section_content for section_name, section_content in blog_post_content.items()},
+        "featured_image_url": email.image_url
+    }
+
+def post_slug(title: str, idempotency_key: str) -> str:
+    # The key suffix makes the slug unique to one outbox entry, so a retry can tell whether
+    # an earlier attempt already created the post
+    return f"{term_slug(title)[:80].strip('-')}-{idempotency_key[:12]}"
+
+async def find_post_by_slug(api_key: APIKey, custom_post_type: str, slug: str) -> Optional[int]:
+    """Return the ID of an existing post (draft or otherwise) with this slug, if any."""
+    url = f"{api_key.wordpress_url}/wp-json/wp/v2/{custom_post_type}"
     auth = (api_key.wordpress_username, api_key.wordpress_app_password)
-    
-    try:
-        response = requests.get(url, auth=auth, params={'search': category_name})
+    async with site_semaphore(api_key):
+        with UPSTREAM_SECONDS.labels("wordpress", "posts").time():
+            response = await get_async_client("wordpress").get(url, auth=auth, params={'slug': slug, 'status': 'any', '_fields': 'id'})
+    response.raise_for_status()
+    posts = response.json()
+    return posts[0]['id'] if posts else None
+
+def _term_key(api_key: APIKey, taxonomy: str, name: str) -> Tuple[str, str, str]:
+    return (api_key.wordpress_url.rstrip('/'), taxonomy, name.strip().lower())
+
+def term_slug(name: str) -> str:
+    # Close to WordPress' sanitize_title; names it slugs differently fall back to term_exists on create
+    slug = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').lower()
+    slug = re.sub(r'[^a-z0-9\s_-]', '', slug)
+    return re.sub(r'[\s_-]+', '-', slug).strip('-')
+
+async def _lookup_terms(api_key: APIKey, taxonomy: str, names: List[str]) -> Dict[str, int]:
+    # One request per 100 terms instead of a search per term; slugs are exact, unlike ?search=
+    url = f"{api_key.wordpress_url}/wp-json/wp/v2/{TAXONOMY_ENDPOINTS[taxonomy]}"
+    auth = (api_key.wordpress_username, api_key.wordpress_app_password)
+    slugs = {term_slug(name): name for name in names if term_slug(name)}
+    slug_list = list(slugs)
+    by_name = {name.strip().lower(): name for name in names}
+    found = {}
+    for i in range(0, len(slug_list), TERM_LOOKUP_PAGE_SIZE):
+        async with site_semaphore(api_key):
+            with UPSTREAM_SECONDS.labels("wordpress", TAXONOMY_ENDPOINTS[taxonomy]).time():
+                response = await get_async_client("wordpress").get(url, auth=auth, params={
+                    'slug': ','.join(slug_list[i:i + TERM_LOOKUP_PAGE_SIZE]),
+                    'per_page': TERM_LOOKUP_PAGE_SIZE,
+                    '_fields': 'id,name,slug'
+                })
         response.raise_for_status()
-        categories = response.json()
-        if categories:
-            return categories[0]['id']
-        else:
-            # Create new category if it doesn't exist
-            new_category = requests.post(url, auth=auth, json={'name': category_name})
-            new_category.raise_for_status()
-            return new_category.json()['id']
-    except requests.RequestException as e:
-        logger.error(f"Failed to get or create category: {str(e)}")
+        for term in response.json():
+            name = slugs.get(term['slug']) or by_name.get(html.unescape(term['name']).strip().lower())
+            if name:
+                found[name] = term['id']
+    return found
+
+def _record_created_term(api_key: APIKey, taxonomy: str, name: str, status: int, body: Any) -> Optional[int]:
+    key = _term_key(api_key, taxonomy, name)
+    body = body if isinstance(body, dict) else {}
+    if status in (200, 201) and 'id' in body:
+        term_id = body['id']
+    elif status == 400 and body.get('code') == 'term_exists':
+        # Created by another worker (or slugged differently than we guessed)
+        term_id = body['data']['term_id']
+    else:
+        logger.error(f"Failed to create {taxonomy} '{name}': {status} {body.get('message', '')}")
+        _missing_terms[key] = True
         return None
+    _term_cache[key] = term_id
+    return term_id
 
-def get_tag_ids(api_key: APIKey, tag_names: list) -> list:
-    url = f"{api_key.wordpress_url}/wp-json/wp/v2/tags"
+async def _create_term_uncached(api_key: APIKey, taxonomy: str, name: str) -> Optional[int]:
+    url = f"{api_key.wordpress_url}/wp-json/wp/v2/{TAXONOMY_ENDPOINTS[taxonomy]}"
     auth = (api_key.wordpress_username, api_key.wordpress_app_password)
-    tag_ids = []
-    
-    for tag_name in tag_names:
-        try:
-            response = requests.get(url, auth=auth, params={'search': tag_name})
-            response.raise_for_status()
-            tags = response.json()
-            if tags:
-                tag_ids.append(tags[0]['id'])
+    try:
+        async with site_semaphore(api_key):
+            with UPSTREAM_SECONDS.labels("wordpress", TAXONOMY_ENDPOINTS[taxonomy]).time():
+                response = await get_async_client("wordpress").post(url, auth=auth, json={'name': name})
+        body = response.json() if response.content else {}
+    except (httpx.HTTPError, ValueError) as e:
+        logger.error(f"Failed to create {taxonomy} '{name}': {str(e)}")
+        _missing_terms[_term_key(api_key, taxonomy, name)] = True
+        return None
+    return _record_created_term(api_key, taxonomy, name, response.status_code, body)
+
+async def _create_term(api_key: APIKey, taxonomy: str, name: str) -> Optional[int]:
+    # Single-flight: concurrent posts that need the same new term share one create request
+    key = _term_key(api_key, taxonomy, name)
+    if key in _term_cache:
+        return _term_cache[key]
+    if key in _missing_terms:
+        return None
+    future = _term_creates.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_create_term_uncached(api_key, taxonomy, name))
+        _term_creates[key] = future
+        future.add_done_callback(lambda _: _term_creates.pop(key, None))
+    return await asyncio.shield(future)
+
+async def _create_terms(api_key: APIKey, taxonomy: str, names: List[str]) -> List[Optional[int]]:
+    if len(names) < 2 or not await supports_batch(api_key):
+        return await asyncio.gather(*[_create_term(api_key, taxonomy, name) for name in names])
+
+    # Claim every term nobody else is creating, then create the claimed ones in one batch request
+    loop = asyncio.get_running_loop()
+    claimed = {}
+    for name in names:
+        key = _term_key(api_key, taxonomy, name)
+        if key not in _term_cache and key not in _term_creates:
+            claimed[name] = _term_creates[key] = loop.create_future()
+    try:
+        if claimed:
+            try:
+                responses = await wordpress_batch(api_key, [
+                    {'method': 'POST', 'path': f"/wp/v2/{TAXONOMY_ENDPOINTS[taxonomy]}", 'body': {'name': name}}
+                    for name in claimed
+                ])
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                logger.error(f"Batch {taxonomy} creation failed, falling back to single requests: {str(e)}")
+                responses = None
+            if responses is None:
+                created = await asyncio.gather(*[_create_term_uncached(api_key, taxonomy, name) for name in claimed])
             else:
-                # Create new tag if it doesn't exist
-                new_tag = requests.post(url, auth=auth, json={'name': tag_name})
-                new_tag.raise_for_status()
-                tag_ids.append(new_tag.json()['id'])
-        except requests.RequestException as e:
-            logger.error(f"Failed to get or create tag: {str(e)}")
-    
-    return tag_ids
+                created = [_record_created_term(api_key, taxonomy, name, status, body) for name, (status, body) in zip(claimed, responses)]
+            for future, term_id in zip(claimed.values(), created):
+                future.set_result(term_id)
+    finally:
+        for name, future in claimed.items():
+            if not future.done():
+                future.set_result(None)
+            _term_creates.pop(_term_key(api_key, taxonomy, name), None)
+
+    return await asyncio.gather(*[_create_term(api_key, taxonomy, name) for name in names])
+
+async def resolve_term_ids(api_key: APIKey, taxonomy: str, names: List[str]) -> Dict[str, Optional[int]]:
+    """Map term names to IDs for one site, creating missing terms. Failed terms map to None."""
+    names = [name for name in dict.fromkeys(names) if name and name.strip()]
+    resolved = {}
+    missing = []
+    for name in names:
+        key = _term_key(api_key, taxonomy, name)
+        if key in _term_cache:
+            resolved[name] = _term_cache[key]
+        elif key in _missing_terms:
+            resolved[name] = None
+        else:
+            missing.append(name)
+
+    if missing:
+        try:
+            found = await _lookup_terms(api_key, taxonomy, missing)
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to look up {taxonomy} terms: {str(e)}")
+            found = {}
+        for name, term_id in found.items():
+            _term_cache[_term_key(api_key, taxonomy, name)] = term_id
+        resolved.update(found)
+        to_create = [name for name in missing if name not in found]
+        resolved.update(zip(to_create, await _create_terms(api_key, taxonomy, to_create)))
+
+    return {name: resolved[name] for name in names}
+
+def media_filename(source_url: str) -> str:
+    filename = posixpath.basename(urlsplit(source_url).path) or "image"
+    return filename if '.' in filename else f"{filename}.jpg"
+
+async def download_media(source_url: str, spool) -> str:
+    """Download source_url (decoded) into spool and return its content type."""
+    with UPSTREAM_SECONDS.labels("pexels", "image_download").time():
+        async with get_async_client("images").stream("GET", source_url) as source:
+            source.raise_for_status()
+            async for chunk in source.aiter_bytes():
+                spool.write(chunk)
+    return source.headers.get('Content-Type')
+
+async def read_chunks(file, chunk_size: int = 64 * 1024):
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+async def upload_media(api_key: APIKey, source_url: str) -> Optional[int]:
+    """Copy an image from source_url into the site's media library and return the attachment ID."""
+    url = f"{api_key.wordpress_url}/wp-json/wp/v2/media"
+    auth = (api_key.wordpress_username, api_key.wordpress_app_password)
+    filename = media_filename(source_url)
+    try:
+        # Downloaded in full before taking one of the site's request slots, so a slow CDN
+        # doesn't hold up the site's other requests; large images are buffered on disk
+        with tempfile.SpooledTemporaryFile(max_size=settings.MEDIA_SPOOL_MEMORY_BYTES) as spool:
+            content_type = await download_media(source_url, spool)
+            headers = {
+                'Content-Type': content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                # The length of the decoded body, so WordPress gets a plain (not chunked) upload
+                'Content-Length': str(spool.tell())
+            }
+            spool.seek(0)
+            async with site_semaphore(api_key):
+                with UPSTREAM_SECONDS.labels("wordpress", "media").time():
+                    response = await get_async_client("wordpress").post(url, auth=auth, headers=headers, content=read_chunks(spool))
+        response.raise_for_status()
+        media_id = response.json()['id']
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        logger.error(f"Failed to upload featured image {source_url} to {api_key.wordpress_url}: {str(e)}")
+        return None
+    logger.info(f"Uploaded featured image {filename} to {api_key.wordpress_url} as media {media_id}")
+    return media_id
+
+async def get_media_id(api_key: APIKey, source_url: str) -> Optional[int]:
+    # Each distinct image is uploaded once per site; concurrent posts share the in-flight upload
+    key = (api_key.wordpress_url.rstrip('/'), source_url)
+    if key in _media_cache:
+        return _media_cache[key]
+    future = _media_uploads.get(key)
+    if future is None:
+        future = asyncio.ensure_future(upload_media(api_key, source_url))
+        _media_uploads[key] = future
+
+        def done(task):
+            _media_uploads.pop(key, None)
+            if not task.cancelled() and task.result() is not None:
+                _media_cache[key] = task.result()
+        future.add_done_callback(done)
+    return await asyncio.shield(future)
+
+async def warm_media_cache(db: AsyncSession, api_key: APIKey, source_urls: List[str]):
+    """Load known attachments for source_urls from the database and upload the rest concurrently."""
+    site_url = api_key.wordpress_url.rstrip('/')
+    source_urls = [source_url for source_url in dict.fromkeys(source_urls) if source_url and (site_url, source_url) not in _media_cache]
+    if not source_urls:
+        return
+    known = await db.execute(select(WordPressMedia.source_url, WordPressMedia.media_id).where(WordPressMedia.site_url == site_url, WordPressMedia.source_url.in_(source_urls)))
+    for source_url, media_id in known:
+        _media_cache[(site_url, source_url)] = media_id
+    # Don't hold the connection while uploading
+    await db.commit()
+
+    missing = [source_url for source_url in source_urls if (site_url, source_url) not in _media_cache]
+    media_ids = await asyncio.gather(*[get_media_id(api_key, source_url) for source_url in missing])
+    uploaded = [{"site_url": site_url, "source_url": source_url, "media_id": media_id} for source_url, media_id in zip(missing, media_ids) if media_id is not None]
+    if uploaded:
+        await db.execute(insert(WordPressMedia).values(uploaded).on_conflict_do_nothing(constraint="uq_wordpress_media_site_source"))
+        await db.commit()
+
+async def warm_term_cache(api_key: APIKey, categories: List[str], tags: List[str]):
+    # Resolve a whole sequence's terms up front so each post is served from the cache
+    await resolve_term_ids(api_key, "category", categories)
+    await resolve_term_ids(api_key, "tag", tags)
+
+async def get_category_id(api_key: APIKey, category_name: str) -> Optional[int]:
+    return (await resolve_term_ids(api_key, "category", [category_name])).get(category_name)
+
+async def get_tag_ids(api_key: APIKey, tag_names: list) -> list:
+    resolved = await resolve_term_ids(api_key, "tag", tag_names or [])
+    return [term_id for term_id in resolved.values() if term_id is not None]
 
 # def filter_content(content: str) -> bool:
 #     inappropriate_words = [
@@ -116,23 +466,57 @@ def get_tag_ids(api_key: APIKey, tag_names: list) -> list:
     
 #     return False
 
-def setup_custom_post_type_and_fields(api_key: APIKey, custom_post_type: str, email_structure: List[EmailSection]) -> None:
+def email_structure_hash(email_structure: List[EmailSection]) -> str:
+    # Only what register_custom_fields sends to WordPress matters for the registration
+    fields = [[section.name, section.description] for section in email_structure]
+    return hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+async def ensure_custom_post_type_and_fields(db: AsyncSession, api_key: APIKey, custom_post_type: str, email_structure: List[EmailSection]) -> None:
+    """Run setup_custom_post_type_and_fields only when this email structure isn't registered yet or its last check expired."""
+    site_url = api_key.wordpress_url.rstrip('/')
+    structure_hash = email_structure_hash(email_structure)
+    registration = (await db.execute(select(WordPressRegistration).where(
+        WordPressRegistration.site_url == site_url,
+        WordPressRegistration.custom_post_type == custom_post_type,
+        WordPressRegistration.structure_hash == structure_hash
+    ))).scalars().first()
+    # Don't hold the connection while talking to WordPress
+    await db.commit()
+    expires_before = datetime.now(timezone.utc) - timedelta(hours=settings.WORDPRESS_REGISTRATION_TTL_HOURS)
+    if registration and registration.registered_at > expires_before:
+        logger.debug("Custom post type '{}' already registered on {}", custom_post_type, site_url)
+        return
+
+    await setup_custom_post_type_and_fields(api_key, custom_post_type, email_structure)
+
+    await db.execute(
+        insert(WordPressRegistration)
+        .values(site_url=site_url, custom_post_type=custom_post_type, structure_hash=structure_hash)
+        .on_conflict_do_update(
+            constraint="uq_wordpress_registrations_site_post_type_structure",
+            set_={"registered_at": datetime.now(timezone.utc)}
+        )
+    )
+    await db.commit()
+
+async def setup_custom_post_type_and_fields(api_key: APIKey, custom_post_type: str, email_structure: List[EmailSection]) -> None:
     # Check if the custom post type exists and is accessible via REST API
     url = f"{api_key.wordpress_url}/wp-json/wp/v2/{custom_post_type}"
     auth = (api_key.wordpress_username, api_key.wordpress_app_password)
 
     try:
-        response = requests.get(url, auth=auth)
+        with UPSTREAM_SECONDS.labels("wordpress", "post_type").time():
+            response = await get_async_client("wordpress").get(url, auth=auth)
         response.raise_for_status()
         logger.info(f"Custom post type '{custom_post_type}' exists and is accessible via REST API")
         
         # Register custom fields
-        register_custom_fields(api_key, custom_post_type, email_structure)
-    except requests.RequestException as e:
+        await register_custom_fields(api_key, custom_post_type, email_structure)
+    except httpx.HTTPError as e:
         logger.error(f"Custom post type '{custom_post_type}' does not exist or is not accessible via REST API: {str(e)}")
         raise AppException(f"Custom post type '{custom_post_type}' is not properly set up in WordPress. Please ensure it's registered with 'show_in_rest' => true", status_code=404)
 
-def register_custom_fields(api_key: APIKey, custom_post_type: str, email_structure: List[EmailSection]) -> None:
+async def register_custom_fields(api_key: APIKey, custom_post_type: str, email_structure: List[EmailSection]) -> None:
     url = f"{api_key.wordpress_url}/wp-json/wp/v2/posts"
     auth = (api_key.wordpress_username, api_key.wordpress_app_password)
 
@@ -152,21 +536,24 @@ def register_custom_fields(api_key: APIKey, custom_post_type: str, email_structu
     }
 
     logger.info(f"Attempting to register custom fields for post type '{custom_post_type}'")
-    logger.info(f"Request data: {data}")
+    logger.opt(lazy=True).debug("Request data: {}", lambda: log_payload(data))
 
     try:
-        response = requests.post(url, json=data, auth=auth)
+        with UPSTREAM_SECONDS.labels("wordpress", "posts").time():
+            response = await get_async_client("wordpress").post(url, json=data, auth=auth)
         response.raise_for_status()
-        logger.info(f"Custom fields registration response: {response.text}")
+        logger.opt(lazy=True).debug("Custom fields registration response: {}", lambda: log_payload(response.text))
         logger.info(f"Custom fields registered for post type '{custom_post_type}'")
         
         # Delete the temporary post
         temp_post_id = response.json()['id']
         delete_url = f"{api_key.wordpress_url}/wp-json/wp/v2/posts/{temp_post_id}"
-        delete_response = requests.delete(delete_url, auth=auth)
+        with UPSTREAM_SECONDS.labels("wordpress", "posts").time():
+            delete_response = await get_async_client("wordpress").delete(delete_url, auth=auth)
         delete_response.raise_for_status()
         logger.info(f"Temporary post deleted successfully")
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Failed to register custom fields: {str(e)}")
-        logger.error(f"Response content: {e.response.text if e.response else 'No response content'}")
+        response = getattr(e, "response", None)
+        logger.error(f"Response content: {response.text if response is not None else 'No response content'}")
         raise AppException(f"Failed to register custom fields: {str(e)}", status_code=500)
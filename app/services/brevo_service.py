@@ -1,10 +1,17 @@
-import aiohttp
+import httpx
+import asyncio
 from app.core.config import settings
+from app.core.rate_limiter import brevo_controller, parse_retry_after
+from app.core.metrics import UPSTREAM_SECONDS
+from app.core.http_clients import get_async_client
+import time
 from loguru import logger
 
+BREVO_CONTACTS_ENDPOINT = "contacts"
+
 async def subscribe_to_brevo_list(email: str, list_id: int):
     logger.info(f"Starting Brevo subscription process for email: {email} to list: {list_id}")
-    url = "https://api.brevo.com/v3/contacts"
+    url = "/v3/contacts"
     headers = {
         "accept": "application/json",
         "content-type": "application/json",
@@ -16,18 +23,39 @@ async def subscribe_to_brevo_list(email: str, list_id: int):
     }
 
     try:
-        logger.info(f"Sending request to Brevo API for email: {email}")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                logger.info(f"Received response from Brevo API. Status: {response.status}")
-                if response.status == 201:
+        for attempt in range(settings.BREVO_MAX_RETRIES + 1):
+            await brevo_controller.acquire_async(BREVO_CONTACTS_ENDPOINT)
+            logger.debug("Sending request to Brevo API for email: {}", email)
+            start = time.perf_counter()
+            try:
+                response = await get_async_client("brevo").post(url, json=payload, headers=headers)
+                UPSTREAM_SECONDS.labels("brevo", BREVO_CONTACTS_ENDPOINT).observe(time.perf_counter() - start)
+                logger.debug("Received response from Brevo API. Status: {}", response.status_code)
+                if response.status_code == 201:
                     logger.info(f"Contact {email} successfully subscribed to Brevo list {list_id}")
-                elif response.status == 204:
+                    brevo_controller.record_success(BREVO_CONTACTS_ENDPOINT)
+                    break
+                elif response.status_code == 204:
                     logger.info(f"Contact {email} was already in Brevo list {list_id}")
-                else:
-                    response_text = await response.text()
-                    logger.error(f"Failed to subscribe {email} to Brevo list {list_id}. Status: {response.status}, Response: {response_text}")
-                    raise Exception(f"Failed to subscribe email to Brevo list. Status: {response.status}, Response: {response_text}")
+                    brevo_controller.record_success(BREVO_CONTACTS_ENDPOINT)
+                    break
+                response_text = response.text
+                retry_after = parse_retry_after(response.headers.get("Retry-After") or response.headers.get("x-sib-ratelimit-reset"))
+                retryable = brevo_controller.record_response(BREVO_CONTACTS_ENDPOINT, response.status_code, retry_after)
+            except httpx.RequestError as e:
+                brevo_controller.record_response(BREVO_CONTACTS_ENDPOINT, None)
+                if attempt == settings.BREVO_MAX_RETRIES:
+                    raise
+                logger.warning(f"Connection error calling Brevo for {email}: {str(e)}, retrying")
+                await asyncio.sleep(min(2 ** attempt, 30))
+                continue
+
+            if not retryable or attempt == settings.BREVO_MAX_RETRIES:
+                logger.error(f"Failed to subscribe {email} to Brevo list {list_id}. Status: {response.status_code}, Response: {response_text}")
+                raise Exception(f"Failed to subscribe email to Brevo list. Status: {response.status_code}, Response: {response_text}")
+            logger.warning(f"Brevo returned {response.status_code} for {email}, retrying (attempt {attempt + 1} of {settings.BREVO_MAX_RETRIES})")
+            if response.status_code != 429:
+                await asyncio.sleep(min(2 ** attempt, 30))
     except Exception as e:
         logger.error(f"Exception occurred while subscribing to Brevo: {str(e)}")
         raise
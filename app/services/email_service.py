@@ -1,38 +1,83 @@
 from app.core.config import settings, TIMEZONE
-import sib_api_v3_sdk
 from app.schemas.sequence import EmailContent
 from fastapi import BackgroundTasks
-from app.db.database import SessionLocal, get_db
-from app.models.email import Email
-from datetime import datetime, timedelta, date
-import logging
-from sib_api_v3_sdk.rest import ApiException
+from app.db.database import SessionLocal, read_session_scope
+from app.models.email import Email, BODY
+from datetime import datetime, timedelta, date, timezone
+from loguru import logger
 from tenacity import retry, stop_after_attempt, wait_exponential
-from sqlalchemy import func
+from sqlalchemy import func, or_, select, update
 from zoneinfo import ZoneInfo
-import pytz
 from app.models.sequence import Sequence
-from sqlalchemy.orm import Session
-from app.core.exceptions import AppException
-from typing import Dict
+from sqlalchemy.orm import Session, joinedload, undefer_group, undefer
+from app.core.exceptions import AppException, CircuitOpenError
+from typing import Dict, List
+from functools import lru_cache
 from filelock import FileLock, Timeout
 import sentry_sdk
 import time
-import psutil
+import random
 from app.utils.content_formatter import format_content
+from app.services.render_service import get_brevo_params
+from app.core.rate_limiter import brevo_controller, parse_retry_after
+import urllib3
+from app.core.metrics import UPSTREAM_SECONDS, SCHEDULER_TICK_SECONDS, EMAILS_PER_TICK, EMAILS_SENT, EMAIL_QUEUE_DEPTH, EMAIL_QUEUE_LAG_SECONDS
+from app.core.logging_config import log_payload, sampled
 
-logger = logging.getLogger(__name__)
+@lru_cache(maxsize=None)
+def get_transactional_api():
+    # One SDK client, and so one urllib3 keep-alive pool, shared by every send. The SDK loads
+    # every Brevo model on import, so it's imported on the first send rather than at startup.
+    import sib_api_v3_sdk
+    configuration = sib_api_v3_sdk.Configuration()
+    configuration.api_key['api-key'] = settings.BREVO_API_KEY
+    return sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+
+BREVO_SMTP_ENDPOINT = "smtp/email"
+
+def get_retry_after(headers) -> float | None:
+    if not headers:
+        return None
+    return parse_retry_after(headers.get("Retry-After") or headers.get("x-sib-ratelimit-reset"))
 
-# Configure API key authorization
-configuration = sib_api_v3_sdk.Configuration()
-configuration.api_key['api-key'] = settings.BREVO_API_KEY
+def is_connect_error(error: urllib3.exceptions.HTTPError) -> bool:
+    # urllib3 wraps the last error once its own retries run out
+    if isinstance(error, urllib3.exceptions.MaxRetryError):
+        error = error.reason
+    return isinstance(error, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+def send_transac_email_with_retry(api_instance, send_smtp_email):
+    # Every Brevo send goes through the shared controller so concurrent senders stay under the
+    # account limit, back off together on 429s and stop calling an endpoint that is down.
+    # Sends aren't idempotent, so only failures where Brevo can't have accepted the message (a
+    # 429, or no connection made) are retried here; 5xx responses, read timeouts and dropped
+    # connections are left to the email's own retry schedule (record_send_failure).
+    from sib_api_v3_sdk.rest import ApiException
+    for attempt in range(settings.BREVO_MAX_RETRIES + 1):
+        brevo_controller.acquire(BREVO_SMTP_ENDPOINT)
+        try:
+            with UPSTREAM_SECONDS.labels("brevo", BREVO_SMTP_ENDPOINT).time():
+                api_response = api_instance.send_transac_email(send_smtp_email)
+        except ApiException as e:
+            brevo_controller.record_response(BREVO_SMTP_ENDPOINT, e.status, get_retry_after(e.headers))
+            if e.status != 429 or attempt == settings.BREVO_MAX_RETRIES:
+                raise
+            logger.warning(f"Brevo returned 429, retrying (attempt {attempt + 1} of {settings.BREVO_MAX_RETRIES})")
+        except urllib3.exceptions.HTTPError as e:
+            brevo_controller.record_response(BREVO_SMTP_ENDPOINT, None)
+            if not is_connect_error(e) or attempt == settings.BREVO_MAX_RETRIES:
+                raise
+            logger.warning(f"Connection error calling Brevo: {str(e)}, retrying (attempt {attempt + 1} of {settings.BREVO_MAX_RETRIES})")
+            time.sleep(min(2 ** attempt, 30))
+        else:
+            brevo_controller.record_success(BREVO_SMTP_ENDPOINT)
+            return api_response
 
 def send_email(recipient_email: str, email: Email, sequence: Sequence):
+    import sib_api_v3_sdk
+    from sib_api_v3_sdk.rest import ApiException
     try:
-        logger.info(f"Preparing to send email to {recipient_email}")
-        logger.info(f"Email content: {email.content}")
-        
-        api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+        logger.debug("Preparing to send email {} to {}", email.id, recipient_email)
         
         subscriber_timezone = ZoneInfo(sequence.timezone)
         
@@ -45,21 +90,9 @@ def send_email(recipient_email: str, email: Email, sequence: Sequence):
         utc_offset = local_scheduled_time.strftime('%z')
         scheduled_at = local_scheduled_time.strftime(f'%Y-%m-%dT%H:%M:%S{utc_offset[:3]}:{utc_offset[3:]}')
 
-        subject = email.subject if email.subject else "No Subject"
-        logger.info(f"Retrieved subject: {subject}")
-
-        # Process HTML content
-        html_content = {key: process_html_content(value) for key, value in email.content.items()}
-
-        params = {
-            "subject": subject,
-            "image_url": email.image_url,
-            "photographer": email.photographer,
-            "pexels_url": email.pexels_url,
-            **html_content,
-            **{f"input_{key}": value for key, value in sequence.inputs.items()}
-        }
-        logger.info(f"Params being sent to Brevo: {params}")
+        # Params are rendered at generation time; stale or missing renders are rebuilt here
+        params = get_brevo_params(email, sequence.inputs)
+        logger.opt(lazy=True).debug("Params being sent to Brevo: {}", lambda: log_payload(params))
 
         send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
             to=[{"email": recipient_email}],
@@ -71,74 +104,151 @@ def send_email(recipient_email: str, email: Email, sequence: Sequence):
             scheduled_at=scheduled_at
         )
         
-        logger.info(f"Sending email with subject: {subject}")
-        logger.info(f"Making API call to Brevo with the following details:")
-        logger.info(f"To: {send_smtp_email.to}")
-        logger.info(f"Template ID: {sequence.brevo_template_id}")
-        logger.info(f"Params: {send_smtp_email.params}")
-        
-        api_response = api_instance.send_transac_email(send_smtp_email)
+        api_response = send_transac_email_with_retry(get_transactional_api(), send_smtp_email)
         
-        logger.info(f"Email sent successfully. Message ID: {api_response.message_id}")
+        logger.info("Email {} sent to Brevo for template {}. Message ID: {}", email.id, sequence.brevo_template_id, api_response.message_id)
         return api_response
 
+    except AppException:
+        raise
     except ApiException as e:
         logger.error(f"Exception when calling Brevo API: {e}")
         raise AppException(f"Brevo API error: {str(e)}", status_code=500)
     except TypeError as e:
         logger.error(f"TypeError when preparing or sending email: {e}")
-        logger.error(f"Email content: {email.content}")
-        logger.error(f"Inputs: {sequence.inputs}")
+        logger.opt(lazy=True).error("Email content: {} Inputs: {}", lambda: log_payload(email.content), lambda: log_payload(sequence.inputs))
         raise AppException(f"Error preparing email data: {str(e)}", status_code=500)
     except Exception as e:
         logger.error(f"Unexpected error when sending email: {e}")
         raise AppException(f"Unexpected error: {str(e)}", status_code=500)
 
+def _memory_usage_mb() -> float:
+    import psutil
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
 def log_memory_usage():
-    process = psutil.Process()
-    memory_info = process.memory_info()
-    logger.info(f"Memory usage: {memory_info.rss / 1024 / 1024:.2f} MB")
+    logger.opt(lazy=True).debug("Memory usage: {:.2f} MB", _memory_usage_mb)
+
+def due_email_filter(current_date: datetime):
+    # Emails waiting out a retry backoff or parked in the dead-letter state are skipped (ix_emails_due)
+    return (
+        Email.scheduled_for <= current_date,
+        Email.sent_to_brevo == False,
+        Email.dead_lettered_at.is_(None),
+        or_(Email.next_attempt_at.is_(None), Email.next_attempt_at <= current_date)
+    )
+
+def record_queue_metrics(db: Session, current_date: datetime):
+    # count(*) rather than count(id): everything this reads is in ix_emails_due, so it's an index-only scan
+    queue_depth, oldest_due = db.query(func.count(), func.min(Email.scheduled_for)).filter(*due_email_filter(current_date)).one()
+    EMAIL_QUEUE_DEPTH.set(queue_depth)
+    EMAIL_QUEUE_LAG_SECONDS.set((current_date - oldest_due.replace(tzinfo=TIMEZONE)).total_seconds() if oldest_due else 0)
+
+def claim_due_emails(db: Session, current_date: datetime, limit: int = 100) -> List[Email]:
+    """Lease up to `limit` due emails to this process and commit, so no row lock is held while they're sent.
 
+    The lease is a next_attempt_at in the future, which due_email_filter already skips. An email
+    whose send never reports back (the process died mid-tick) is due again once the lease runs out.
+    """
+    due = select(Email.id).where(*due_email_filter(current_date)).limit(limit).with_for_update(skip_locked=True)
+    ids = db.execute(
+        update(Email)
+        .where(Email.id.in_(due.scalar_subquery()))
+        .values(next_attempt_at=current_date + timedelta(seconds=settings.EMAIL_SEND_LEASE_SECONDS))
+        .returning(Email.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    if not ids:
+        return []
+    # Every email claimed here is sent, so this is the one place its body is loaded with it
+    emails = db.query(Email).options(joinedload(Email.sequence), undefer_group(BODY)).filter(Email.id.in_(ids)).order_by(Email.scheduled_for).all()
+    # Give the connection back before sending; the session doesn't expire what was loaded
+    db.commit()
+    return emails
+
+@SCHEDULER_TICK_SECONDS.labels("send_scheduled_emails").time()
 def check_and_send_scheduled_emails():
-    db = next(get_db())
+    db = SessionLocal(expire_on_commit=False)
     try:
-        with db.begin():  # Start a transaction
-            log_memory_usage()
-            current_date = datetime.now(TIMEZONE)
-            logger.info(f"Checking for emails scheduled up to {current_date}")
-            
-            emails_to_send = db.query(Email).filter(
-                Email.scheduled_for <= current_date,
-                Email.sent_to_brevo == False
-            ).with_for_update().limit(100).all()  # Lock the rows for update
-            
-            logger.info(f"Found {len(emails_to_send)} emails to send")
-            
-            for email in emails_to_send:
-                try:
-                    if email.sent_to_brevo:
-                        logger.warning(f"Email {email.id} is marked as sent to Brevo but was returned in the query")
-                        continue
-                    
-                    logger.info(f"Attempting to send email {email.id} scheduled for {email.scheduled_for}")
-                    api_response = send_email(email.sequence.recipient_email, email, email.sequence)
-                    
-                    email.sent_to_brevo = True
-                    email.sent_to_brevo_at = current_date
-                    email.brevo_message_id = api_response.message_id
-                    logger.info(f"Email {email.id} sent successfully (originally scheduled for {email.scheduled_for})")
-                except Exception as e:
-                    logger.error(f"Error sending email {email.id}: {str(e)}")
-                    # Don't raise the exception, continue with the next email
-            
-            db.commit()  # Commit the transaction
-            log_memory_usage()
+        current_date = datetime.now(TIMEZONE)
+        # Reporting only, so it can come from the replica rather than add to the sending transaction
+        with read_session_scope() as read_db:
+            record_queue_metrics(read_db, current_date)
+        log_memory_usage()
+        emails_to_send = claim_due_emails(db, current_date)
+
+        # Idle ticks run every few minutes; only a sample of them is worth a log line
+        (logger if emails_to_send else sampled(0.05)).info(f"Found {len(emails_to_send)} emails to send scheduled up to {current_date}")
+        sent_count = 0
+
+        for email in emails_to_send:
+            try:
+                if email.sent_to_brevo:
+                    logger.warning(f"Email {email.id} is marked as sent to Brevo but was returned in the query")
+                    continue
+
+                logger.debug("Attempting to send email {} scheduled for {}", email.id, email.scheduled_for)
+                api_response = send_email(email.sequence.recipient_email, email, email.sequence)
+
+                email.sent_to_brevo = True
+                email.sent_to_brevo_at = current_date
+                email.brevo_message_id = api_response.message_id
+                email.next_attempt_at = None
+                sent_count += 1
+                EMAILS_SENT.labels("sent").inc()
+            except Exception as e:
+                logger.error(f"Error sending email {email.id}: {str(e)}")
+                record_send_failure(email, e, current_date)
+                # Don't raise the exception, continue with the next email
+            # One short transaction per outcome, so an email Brevo accepted is never sent again
+            db.commit()
+
+        EMAILS_PER_TICK.observe(sent_count)
+        log_memory_usage()
     except Exception as e:
         logger.error(f"Error in check_and_send_scheduled_emails: {str(e)}")
         db.rollback()
     finally:
         db.close()
 
+def get_retry_delay(attempt_count: int) -> timedelta:
+    # Exponential backoff with jitter so a batch that failed together doesn't retry together
+    delay = min(settings.EMAIL_RETRY_MAX_SECONDS, settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempt_count - 1))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+def record_send_failure(email: Email, error: Exception, current_date: datetime):
+    if isinstance(error, CircuitOpenError):
+        # Brevo was never called, so this isn't a failed attempt; wait out the open circuit
+        email.next_attempt_at = current_date + timedelta(seconds=error.retry_after)
+        logger.debug("Brevo circuit is open; email {} postponed to {}", email.id, email.next_attempt_at)
+        return
+    email.attempt_count = (email.attempt_count or 0) + 1
+    email.last_error = str(error)[:1000]
+    if email.attempt_count >= settings.EMAIL_SEND_MAX_ATTEMPTS:
+        EMAILS_SENT.labels("dead_lettered").inc()
+        email.dead_lettered_at = current_date
+        email.next_attempt_at = None
+        logger.error(f"Email {email.id} moved to dead-letter after {email.attempt_count} failed attempts")
+    else:
+        EMAILS_SENT.labels("failed").inc()
+        email.next_attempt_at = current_date + get_retry_delay(email.attempt_count)
+        logger.info(f"Email {email.id} will be retried at {email.next_attempt_at} (attempt {email.attempt_count} of {settings.EMAIL_SEND_MAX_ATTEMPTS})")
+
+def get_dead_lettered_emails(db: Session, limit: int = 200):
+    return db.query(Email).options(joinedload(Email.sequence), undefer(Email.subject)).filter(Email.dead_lettered_at.isnot(None)).order_by(Email.dead_lettered_at.desc()).limit(limit).all()
+
+def requeue_dead_lettered_email(db: Session, email_id: int) -> bool:
+    email = db.query(Email).filter(Email.id == email_id, Email.dead_lettered_at.isnot(None)).first()
+    if not email:
+        return False
+    email.dead_lettered_at = None
+    email.next_attempt_at = None
+    email.attempt_count = 0
+    db.commit()
+    logger.info(f"Email {email_id} requeued from dead-letter")
+    return True
+
 def send_email_background(db: Session, recipient_email: str, email: EmailContent, inputs: dict):
     try:
         message_id = send_email_to_brevo(db, recipient_email, email, inputs)
@@ -151,17 +261,13 @@ def send_email_background(db: Session, recipient_email: str, email: EmailContent
         # Here you might want to handle the error, maybe retry later or mark as failed in the database
 
 def send_email_to_brevo(db: Session, to_email: str, email_content: EmailContent, inputs: dict, template_id: int):
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = settings.BREVO_API_KEY
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-
+    from sib_api_v3_sdk.rest import ApiException
     subject = email_content.subject
     sender = {"name": settings.EMAIL_FROM_NAME, "email": settings.EMAIL_FROM}
     to = [{"email": to_email}]
     
     # Combine all content sections into a single HTML string, preserving HTML tags
     html_content = "\n\n".join([f"<h2>{section}</h2>{content}" for section, content in email_content.content.items()])
-    logger.info(f"HTML content being sent to Brevo: {html_content}")
     
     params = {
         "subject": subject,
@@ -169,17 +275,15 @@ def send_email_to_brevo(db: Session, to_email: str, email_content: EmailContent,
         **inputs
     }
     
-    scheduled_at = email_content.scheduled_for.replace(tzinfo=pytz.UTC).isoformat()
+    scheduled_at = email_content.scheduled_for.replace(tzinfo=timezone.utc).isoformat()
     
-    # Log the API call details
-    logger.info(f"Making API call to Brevo with the following details:")
-    logger.info(f"To: {to}")
-    logger.info(f"Params: {params}")
-    logger.info(f"Scheduled At: {scheduled_at}")
-    logger.info(f"Template ID: {template_id}")
+    logger.opt(lazy=True).debug(
+        "Making API call to Brevo. Template ID: {}, scheduled at: {}, params: {}",
+        lambda: template_id, lambda: scheduled_at, lambda: log_payload(params)
+    )
 
     try:
-        api_response = api_instance.send_transac_email({
+        api_response = send_transac_email_with_retry(get_transactional_api(), {
             "templateId": template_id,
             "to": to,
             "params": params,
@@ -191,6 +295,7 @@ def send_email_to_brevo(db: Session, to_email: str, email_content: EmailContent,
         logger.error(f"Exception when calling SMTPApi->send_transac_email: {e}")
         raise
 
+@SCHEDULER_TICK_SECONDS.labels("schedule_emails").time()
 def check_and_schedule_emails():
     db = SessionLocal()
     try:
@@ -206,7 +311,9 @@ def check_and_schedule_emails():
             if should_send_email(sequence):
                 emails_to_schedule = [
                     email for email in sequence.emails 
-                    if not email.sent_to_brevo and email.scheduled_for.replace(tzinfo=TIMEZONE) <= next_3_days
+                    if not email.sent_to_brevo and email.dead_lettered_at is None
+                    and (email.next_attempt_at is None or email.next_attempt_at.replace(tzinfo=TIMEZONE) <= current_date)
+                    and email.scheduled_for.replace(tzinfo=TIMEZONE) <= next_3_days
                 ]
                 
                 for email in emails_to_schedule:
@@ -217,20 +324,25 @@ def check_and_schedule_emails():
                             email.sent_to_brevo_at = current_date
                             email.brevo_message_id = api_response.message_id
                             db.commit()
-                            logger.info(f"Scheduled email {email.id} for sequence {sequence.id}")
+                            EMAILS_SENT.labels("sent").inc()
+                            logger.debug("Scheduled email {} for sequence {}", email.id, sequence.id)
                         else:
                             logger.warning(f"Email {email.id} for sequence {sequence.id} already sent to Brevo")
                     except AppException as e:
                         sentry_sdk.capture_exception(e)
                         logger.error(f"AppException scheduling email {email.id} for sequence {sequence.id}: {str(e)}")
                         db.rollback()
+                        record_send_failure(email, e, current_date)
+                        db.commit()
                     except Exception as e:
                         sentry_sdk.capture_exception(e)
                         logger.error(f"Unexpected error scheduling email {email.id} for sequence {sequence.id}: {str(e)}")
                         db.rollback()
+                        record_send_failure(email, e, current_date)
+                        db.commit()
                 
                 sequence.next_email_date = min(
-                    (email.scheduled_for.replace(tzinfo=TIMEZONE) for email in sequence.emails if not email.sent_to_brevo),
+                    (email.scheduled_for.replace(tzinfo=TIMEZONE) for email in sequence.emails if not email.sent_to_brevo and email.dead_lettered_at is None),
                     default=None
                 )
                 db.commit()
@@ -3,7 +3,6 @@ from app.schemas.sequence import EmailSection, EmailBase
 from app.core.config import settings, TIMEZONE
 from app.core.exceptions import AppException
 from loguru import logger
-import openai
 import json
 from datetime import timedelta, datetime
 from tenacity import retry, stop_after_attempt, wait_exponential
@@ -17,12 +16,21 @@ import sentry_sdk
 from app.utils.content_formatter import format_content
 from app.services.pexels_service import get_image_for_tags
 from app.models.email import EmailBase  
+from app.core.metrics import LLM_CALL_SECONDS, LLM_TOKENS, record_cache
+from app.core.logging_config import log_payload
 
-openai.api_key = settings.OPENAI_API_KEY
+@lru_cache(maxsize=None)
+def get_openai():
+    # Imported on first use: the SDK (with aiohttp) is the slowest import in the app and only
+    # generation needs it
+    import openai
+    openai.api_key = settings.OPENAI_API_KEY
+    return openai
 
 @openai_limiter
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 async def generate_email_sequence(topic: str, inputs: Dict[str, str], email_structure: List[EmailSection], start_index: int, batch_size: int, days_between_emails: int, buffer_time: timedelta = timedelta(minutes=1), previous_topics: Dict[str, int] = {}, topic_depth: int = 5, start_date: datetime = None) -> List[EmailBase]:
+    openai = get_openai()
     try:
         sections_prompt = "\n".join([settings.OPENAI_SECTIONS_PROMPT.format(
             index=i+1, 
@@ -109,9 +117,10 @@ Ensure there's proper spacing between elements using appropriate HTML structure.
         }
         
         logger.info(f"Sending request to OpenAI API for emails {start_index + 1} to {start_index + batch_size}")
-        logger.info(f"Full prompt being sent to OpenAI:\n{prompt}")
-        logger.info(f"JSON structure for function call:\n{json.dumps(json_structure, indent=2)}")
+        logger.opt(lazy=True).debug("Full prompt being sent to OpenAI:\n{}", lambda: log_payload(prompt))
+        logger.opt(lazy=True).debug("JSON structure for function call: {}", lambda: log_payload(json_structure))
         
+        llm_start = time.perf_counter()
         response: openai.ChatCompletion = await openai.ChatCompletion.acreate(
             model=settings.OPENAI_MODEL,
             messages=[
@@ -149,10 +158,11 @@ Ensure there's proper spacing between elements using appropriate HTML structure.
             presence_penalty=settings.OPENAI_PRESENCE_PENALTY,
             timeout=settings.OPENAI_REQUEST_TIMEOUT
         )
+        record_llm_usage("generate_email_sequence", response, llm_start)
         
         logger.info(f"Received response from OpenAI API for emails {start_index + 1} to {start_index + batch_size}")
         function_call = response.choices[0].message.function_call
-        logger.info(f"Function call response:\n{json.dumps(function_call.arguments, indent=2)}")
+        logger.opt(lazy=True).debug("Function call response: {}", lambda: log_payload(function_call.arguments))
         
         try:
             emails_data = json.loads(function_call.arguments)['emails']
@@ -185,7 +195,7 @@ Ensure there's proper spacing between elements using appropriate HTML structure.
                     pexels_url=image_info['pexels_url'] if image_info else None,
                     scheduled_for=current_date + timedelta(days=i * days_between_emails)
                 )
-                logger.debug(f"Created EmailBase object: {email.dict()}")  # Add this debug log
+                logger.opt(lazy=True).debug("Created EmailBase object: {}", lambda: log_payload(email))
                 processed_emails.append(email)
             except Exception as e:
                 logger.error(f"Error creating EmailBase object: {str(e)}")
@@ -210,6 +220,12 @@ Ensure there's proper spacing between elements using appropriate HTML structure.
         logger.error(f"Unexpected error in generate_email_sequence for batch starting at {start_index}: {str(e)}")
         raise AppException(f"Unexpected error: {str(e)}", status_code=500)
 
+def record_llm_usage(operation: str, response, start: float):
+    LLM_CALL_SECONDS.labels(operation).observe(time.perf_counter() - start)
+    usage = response.get("usage") or {}
+    LLM_TOKENS.labels(operation, "prompt").inc(usage.get("prompt_tokens", 0))
+    LLM_TOKENS.labels(operation, "completion").inc(usage.get("completion_tokens", 0))
+
 def validate_email_content(email, email_structure):
     for section in email_structure:
         if section.name not in email['content'] or not email['content'][section.name].strip():
@@ -225,7 +241,9 @@ def async_lru_cache(maxsize=100, ttl=300):
         async def wrapper(*args, **kwargs):
             key = str(args) + str(kwargs)
             if key in cache:
+                record_cache(func.__name__, True)
                 return cache[key]
+            record_cache(func.__name__, False)
             result = await func(*args, **kwargs)
             cache[key] = result
             return result
@@ -256,6 +274,8 @@ Return the result as a JSON object."""
         "required": ["journal_prompt", "wrap_up"]
     }
 
+    openai = get_openai()
+    llm_start = time.perf_counter()
     response = await openai.ChatCompletion.acreate(
         model=settings.OPENAI_MODEL,
         messages=[
@@ -271,6 +291,7 @@ Return the result as a JSON object."""
         temperature=0.7,
         max_tokens=300
     )
+    record_llm_usage("generate_demo_prompt", response, llm_start)
 
     if hasattr(response.choices[0].message, 'function_call'):
         return json.loads(response.choices[0].message.function_call.arguments)
@@ -0,0 +1,214 @@
+from sqlalchemy import select, update, or_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import async_session_scope
+from app.models.blog_post_outbox import BlogPostOutbox
+from app.models.email import Email, BODY
+from app.models.api_key import APIKey
+from app.schemas.sequence import EmailSection
+from app.services import blog_post_service
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.rate_limiter import CircuitBreaker
+from app.core.metrics import BLOG_POSTS_PUBLISHED, SCHEDULER_TICK_SECONDS
+from app.core.logging_config import sampled
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+import asyncio
+import httpx
+
+# Blog posts are published from blog_post_outbox rather than inline after generation.
+# Entries are written in the same transaction as their emails (see add_emails_to_sequence),
+# so a crash or a WordPress outage never loses a post and recovery never needs regeneration:
+# the worker in every app process claims due entries with FOR UPDATE SKIP LOCKED plus a
+# lease, publishes them per site, and retries failures with exponential backoff. A site that
+# keeps failing is paused by a circuit breaker instead of burning every entry's attempts.
+
+# Per WordPress site, keyed by the site URL
+_site_breakers: Dict[str, CircuitBreaker] = {}
+
+def site_breaker(api_key: APIKey) -> CircuitBreaker:
+    site = api_key.wordpress_url.rstrip('/')
+    if site not in _site_breakers:
+        _site_breakers[site] = CircuitBreaker(settings.OUTBOX_SITE_FAILURE_THRESHOLD, settings.OUTBOX_SITE_PAUSE_SECONDS)
+    return _site_breakers[site]
+
+def retry_delay(attempt_count: int) -> timedelta:
+    seconds = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** max(attempt_count - 1, 0)
+    return timedelta(seconds=min(seconds, settings.OUTBOX_RETRY_MAX_SECONDS))
+
+async def claim_entries(db: AsyncSession, limit: int, sequence_id: Optional[int] = None) -> List[BlogPostOutbox]:
+    """Lease up to `limit` due entries to this worker; other workers skip them until the lease runs out."""
+    now = datetime.now(timezone.utc)
+    due = select(BlogPostOutbox.id).where(
+        BlogPostOutbox.status == "pending",
+        BlogPostOutbox.next_attempt_at <= now,
+        or_(BlogPostOutbox.locked_until.is_(None), BlogPostOutbox.locked_until < now)
+    )
+    if sequence_id is not None:
+        due = due.join(BlogPostOutbox.email).where(Email.sequence_id == sequence_id)
+    due = due.order_by(BlogPostOutbox.next_attempt_at).limit(limit).with_for_update(of=BlogPostOutbox, skip_locked=True)
+
+    ids = (await db.execute(
+        update(BlogPostOutbox)
+        .where(BlogPostOutbox.id.in_(due.scalar_subquery()))
+        .values(locked_until=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS), claim_count=BlogPostOutbox.claim_count + 1)
+        .returning(BlogPostOutbox.id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all()
+    await db.commit()
+    if not ids:
+        return []
+    entries = (await db.execute(select(BlogPostOutbox).options(
+        joinedload(BlogPostOutbox.email).joinedload(Email.sequence),
+        joinedload(BlogPostOutbox.email).undefer_group(BODY),
+        joinedload(BlogPostOutbox.api_key)
+    ).where(BlogPostOutbox.id.in_(ids)).order_by(BlogPostOutbox.api_key_id, BlogPostOutbox.custom_post_type, BlogPostOutbox.id)
+    # The session may still hold an entry from an earlier claim; refresh it to this claim's state
+    .execution_options(populate_existing=True))).unique().scalars().all()
+    # Give the connection back before publishing; the session doesn't expire what was loaded
+    await db.commit()
+    return entries
+
+def mark_published(entry: BlogPostOutbox, post_id: int):
+    entry.email.wordpress_post_id = post_id
+    entry.status = "published"
+    entry.published_at = datetime.now(timezone.utc)
+    entry.locked_until = None
+    entry.last_error = None
+    BLOG_POSTS_PUBLISHED.labels("published").inc()
+
+def mark_failed(entry: BlogPostOutbox, error: str):
+    entry.attempt_count += 1
+    entry.last_error = error[:1000]
+    entry.locked_until = None
+    if entry.attempt_count >= settings.OUTBOX_MAX_ATTEMPTS:
+        entry.status = "dead"
+        BLOG_POSTS_PUBLISHED.labels("dead").inc()
+        logger.error(f"Giving up on blog post for email {entry.email_id} after {entry.attempt_count} attempts: {error}")
+    else:
+        entry.next_attempt_at = datetime.now(timezone.utc) + retry_delay(entry.attempt_count)
+        BLOG_POSTS_PUBLISHED.labels("retry").inc()
+        logger.warning(f"Blog post for email {entry.email_id} failed (attempt {entry.attempt_count}), retrying at {entry.next_attempt_at}: {error}")
+
+def postpone(entry: BlogPostOutbox, delay: timedelta):
+    # A paused site doesn't count against the entry's attempts
+    entry.next_attempt_at = datetime.now(timezone.utc) + delay
+    entry.locked_until = None
+
+def _email_structure(sequence) -> List[EmailSection]:
+    # EmailSection's validator turns plain word counts into ints, and that's how they were stored
+    return [EmailSection(**{**section, "word_count": str(section["word_count"])}) for section in sequence.email_structure]
+
+async def _resolve_existing(entries: List[BlogPostOutbox], api_key: APIKey, custom_post_type: str) -> List[BlogPostOutbox]:
+    """Mark entries whose post an earlier attempt already created; return the ones still to publish."""
+    remaining = []
+    for entry in entries:
+        if entry.email.wordpress_post_id is not None:
+            mark_published(entry, entry.email.wordpress_post_id)
+            continue
+        # Any earlier claim may have created the post, including one that died or outlived its
+        # lease before recording anything, so this can't go by attempt_count
+        if entry.claim_count > 1:
+            post_id = await blog_post_service.find_post_by_slug(api_key, custom_post_type, blog_post_service.post_slug(entry.email.subject, entry.idempotency_key))
+            if post_id is not None:
+                logger.info(f"Found blog post {post_id} from an earlier attempt for email {entry.email_id}")
+                mark_published(entry, post_id)
+                continue
+        remaining.append(entry)
+    return remaining
+
+async def publish_site_entries(db: AsyncSession, api_key: APIKey, custom_post_type: str, entries: List[BlogPostOutbox]) -> Tuple[int, int]:
+    """Publish one site's entries; returns (published, failed)."""
+    breaker = site_breaker(api_key)
+    if not api_key.is_active or not breaker.allow():
+        for entry in entries:
+            postpone(entry, timedelta(seconds=settings.OUTBOX_SITE_PAUSE_SECONDS))
+        await db.commit()
+        sampled(0.05).info(f"WordPress site {api_key.wordpress_url} is paused; postponed {len(entries)} blog posts")
+        return 0, 0
+
+    entry_ids = [entry.id for entry in entries]
+    published = failed = 0
+    try:
+        # Entries from different sequences can share a post type with different sections; every
+        # structure's custom fields must be registered before any of its posts go out
+        structures = {}
+        for entry in entries:
+            structure = _email_structure(entry.email.sequence)
+            structures.setdefault(blog_post_service.email_structure_hash(structure), structure)
+        for structure in structures.values():
+            await blog_post_service.ensure_custom_post_type_and_fields(db, api_key, custom_post_type, structure)
+        remaining = await _resolve_existing(entries, api_key, custom_post_type)
+        published = len(entries) - len(remaining)
+
+        for start in range(0, len(remaining), settings.WORDPRESS_PUBLISH_BATCH_SIZE):
+            batch = remaining[start:start + settings.WORDPRESS_PUBLISH_BATCH_SIZE]
+            emails = [entry.email for entry in batch]
+            await blog_post_service.warm_term_cache(api_key, [email.category for email in emails], [tag for email in emails for tag in (email.tags or [])])
+            await blog_post_service.warm_media_cache(db, api_key, [email.image_url for email in emails])
+            metadatas = []
+            for entry in batch:
+                metadata = blog_post_service.blog_post_metadata(entry.email, custom_post_type)
+                metadata['slug'] = blog_post_service.post_slug(entry.email.subject, entry.idempotency_key)
+                metadatas.append(metadata)
+
+            results = await blog_post_service.publish_blog_posts(metadatas, api_key)
+            for entry, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    mark_failed(entry, str(result))
+                    failed += 1
+                else:
+                    mark_published(entry, result)
+                    published += 1
+            await db.commit()
+    except (AppException, httpx.HTTPError, ValueError, KeyError) as e:
+        # Registration or lookup failed, so nothing else for this site will work either
+        await db.rollback()
+        # The rollback expired the entries and async sessions can't lazy load, so reload them in one query
+        await db.execute(
+            select(BlogPostOutbox).where(BlogPostOutbox.id.in_(entry_ids))
+            .execution_options(populate_existing=True)
+        )
+        for entry in entries:
+            if entry.status == "pending" and entry.locked_until is not None:
+                mark_failed(entry, str(e))
+                failed += 1
+        await db.commit()
+
+    if published or not failed:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    return published, failed
+
+async def drain_outbox(sequence_id: Optional[int] = None) -> int:
+    """Publish every due outbox entry (optionally only one sequence's); returns how many were published."""
+    total = 0
+    # AsyncSessionLocal doesn't expire on commit, so claimed entries stay loaded across commits
+    # and the session only holds a connection while it is actually reading or writing
+    async with async_session_scope() as db:
+        while True:
+            entries = await claim_entries(db, settings.OUTBOX_BATCH_SIZE, sequence_id)
+            if not entries:
+                break
+            for (_, custom_post_type), group in groupby(entries, key=lambda entry: (entry.api_key_id, entry.custom_post_type)):
+                group = list(group)
+                published, _ = await publish_site_entries(db, group[0].api_key, custom_post_type, group)
+                total += published
+            if len(entries) < settings.OUTBOX_BATCH_SIZE:
+                break
+    if total:
+        logger.info(f"Published {total} blog posts from the outbox")
+    return total
+
+async def run_outbox_worker():
+    while True:
+        try:
+            with SCHEDULER_TICK_SECONDS.labels("drain_outbox").time():
+                await drain_outbox()
+        except Exception as e:
+            logger.error(f"Error draining blog post outbox: {str(e)}")
+        await asyncio.sleep(settings.OUTBOX_POLL_SECONDS)
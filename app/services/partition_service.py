@@ -0,0 +1,158 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.db.database import engine, session_scope
+from app.core.config import settings
+from app.core.metrics import SCHEDULER_TICK_SECONDS
+from loguru import logger
+from typing import Iterable, List, NamedTuple, Optional, Set
+from datetime import datetime, timezone
+import re
+
+# emails is range-partitioned by month of scheduled_for (migration d267c31288df). Everything
+# scheduled before the migration lives in one partition, emails_legacy; after that each month
+# is its own emails_yYYYYmMM table. The due-email query only reaches partitions that have
+# started, and old months whose emails are all sent get detached into EMAIL_ARCHIVE_SCHEMA, so
+# the scheduler's queries and vacuum only ever work on the last few months.
+#
+# maintain_email_partitions keeps the next EMAIL_PARTITION_MONTHS_AHEAD months created; a
+# sequence reaching further creates the months it needs before its emails are inserted
+# (ensure_email_partitions). New partitions are created standalone and then attached, which
+# only takes a SHARE UPDATE EXCLUSIVE lock on emails, so sends and inserts carry on meanwhile.
+
+# Advisory lock keys: one for creating partitions, one for the archiving run
+PARTITION_LOCK_KEY = 7316048
+ARCHIVE_LOCK_KEY = 7316049
+
+PARTITIONS_QUERY = text("""
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'emails'::regclass
+""")
+PARTITION_BOUND = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+class Partition(NamedTuple):
+    name: str
+    start: Optional[datetime]  # None for MINVALUE
+    end: Optional[datetime]  # None for MAXVALUE
+
+# Months this process has seen covered by a committed partition
+_known_months: Set[datetime] = set()
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+def partition_name(month: datetime) -> str:
+    return f"emails_y{month:%Y}m{month:%m}"
+
+def _bound(value: str) -> Optional[datetime]:
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+def parse_partitions(rows) -> List[Partition]:
+    partitions = []
+    for name, bound in rows:
+        start, end = PARTITION_BOUND.search(bound).groups()
+        partitions.append(Partition(name, _bound(start), _bound(end)))
+    return sorted(partitions, key=lambda partition: partition.start or datetime.min)
+
+def covers(partitions: List[Partition], month: datetime) -> bool:
+    return any((p.start is None or p.start <= month) and (p.end is None or month < p.end) for p in partitions)
+
+def create_partition_statements(month: datetime) -> List[str]:
+    name = partition_name(month)
+    return [
+        f"CREATE TABLE {name} (LIKE emails INCLUDING DEFAULTS)",
+        f"ALTER TABLE emails ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')",
+    ]
+
+async def ensure_email_partitions(db: AsyncSession, scheduled_for: Iterable[datetime]):
+    """Create any missing monthly partitions for these send times, in the caller's transaction."""
+    months = {month_start(value) for value in scheduled_for if value is not None} - _known_months
+    if not months:
+        return
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    partitions = parse_partitions((await db.execute(PARTITIONS_QUERY)).all())
+    for month in sorted(months):
+        if covers(partitions, month):
+            _known_months.add(month)
+            continue
+        for statement in create_partition_statements(month):
+            await db.execute(text(statement))
+        logger.info(f"Created emails partition {partition_name(month)}")
+
+def create_upcoming_partitions(db: Session) -> int:
+    db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    partitions = parse_partitions(db.execute(PARTITIONS_QUERY).all())
+    current = month_start(datetime.now(timezone.utc).replace(tzinfo=None))
+    created = 0
+    for offset in range(settings.EMAIL_PARTITION_MONTHS_AHEAD + 1):
+        month = add_months(current, offset)
+        if not covers(partitions, month):
+            for statement in create_partition_statements(month):
+                db.execute(text(statement))
+            logger.info(f"Created emails partition {partition_name(month)}")
+            created += 1
+    return created
+
+def archivable_partitions(partitions: List[Partition], now: datetime) -> List[Partition]:
+    cutoff = add_months(month_start(now), -settings.EMAIL_ARCHIVE_AFTER_MONTHS)
+    return [p for p in partitions if p.end is not None and p.end <= cutoff]
+
+def has_pending_outbox_entries(conn, name: str) -> bool:
+    return conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM blog_post_outbox o JOIN {name} e ON e.id = o.email_id AND e.scheduled_for = o.email_scheduled_for "
+        f"WHERE o.status = 'pending')"
+    )).scalar()
+
+def archive_partition(conn, partition: Partition) -> bool:
+    """Detach one partition into the archive schema if all its work is done; conn is in autocommit."""
+    name = partition.name
+    unsent = conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {name} WHERE sent_to_brevo = false AND dead_lettered_at IS NULL)"
+    )).scalar()
+    if unsent or has_pending_outbox_entries(conn, name):
+        logger.info(f"Keeping emails partition {name}: it still has {'unsent emails' if unsent else 'unpublished blog posts'}")
+        return False
+
+    # Finished outbox entries would block the detach (they reference the emails) and are no longer needed.
+    # An entry can be queued after the check above, so pending ones are never deleted here.
+    deleted = conn.execute(text(
+        f"DELETE FROM blog_post_outbox o USING {name} e WHERE e.id = o.email_id AND e.scheduled_for = o.email_scheduled_for "
+        f"AND o.status <> 'pending'"
+    )).rowcount
+    if has_pending_outbox_entries(conn, name):
+        logger.info(f"Keeping emails partition {name}: a blog post was queued while archiving it (removed {deleted} finished outbox entries)")
+        return False
+    # Anything queued from here on still references the partition, so the foreign key fails the detach
+    # CONCURRENTLY waits for running queries instead of blocking new ones
+    conn.execute(text(f"ALTER TABLE emails DETACH PARTITION {name} CONCURRENTLY"))
+    conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {settings.EMAIL_ARCHIVE_SCHEMA}"))
+    logger.info(f"Archived emails partition {name} to {settings.EMAIL_ARCHIVE_SCHEMA} (removed {deleted} finished outbox entries)")
+    return True
+
+def archive_sent_partitions() -> int:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Every process runs the job; the first one to get here does the work
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ARCHIVE_LOCK_KEY}).scalar():
+            return 0
+        try:
+            partitions = parse_partitions(conn.execute(PARTITIONS_QUERY).all())
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            return sum(archive_partition(conn, partition) for partition in archivable_partitions(partitions, now))
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ARCHIVE_LOCK_KEY})
+
+@SCHEDULER_TICK_SECONDS.labels("maintain_email_partitions").time()
+def maintain_email_partitions():
+    try:
+        with session_scope() as db:
+            create_upcoming_partitions(db)
+        archive_sent_partitions()
+    except Exception as e:
+        logger.error(f"Error maintaining emails partitions: {str(e)}")
@@ -1,10 +1,11 @@
-import httpx
 from app.core.config import settings
 from loguru import logger
 from typing import Dict, Optional
+from app.core.metrics import UPSTREAM_SECONDS
+from app.core.http_clients import get_async_client
 
 async def get_image_for_tags(tags: list[str], orientation: str = "landscape") -> Optional[Dict[str, str]]:
-    url = "https://api.pexels.com/v1/search"
+    url = "/v1/search"
     headers = {"Authorization": settings.PEXELS_API_KEY}
     params = {
         "query": tags[0] if tags else "",  # Use only the first tag
@@ -12,10 +13,10 @@ async def get_image_for_tags(tags: list[str], orientation: str = "landscape") ->
         "orientation": orientation
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
+    with UPSTREAM_SECONDS.labels("pexels", "search").time():
+        response = await get_async_client("pexels").get(url, headers=headers, params=params)
+    response.raise_for_status()
+    data = response.json()
 
     if data["photos"]:
         photo = data["photos"][0]
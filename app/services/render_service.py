@@ -0,0 +1,106 @@
+from sqlalchemy import or_, text
+from sqlalchemy.orm import joinedload, undefer_group
+from app.db.database import SessionLocal, engine
+from app.models.email import Email, BODY
+from app.utils.content_formatter import format_content, format_contents
+from app.core.metrics import SCHEDULER_TICK_SECONDS
+from typing import Dict, Any
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever format_content, the Brevo params layout or the blog formatting changes.
+# Emails stamped with an older version are re-rendered by rerender_stale_emails and are
+# rendered on the fly at send time until then.
+RENDER_VERSION = 1
+
+# Every app process schedules the re-render; the advisory lock lets only one of them run it
+RERENDER_LOCK_KEY = 7316051
+
+def render_brevo_params(email, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    # Everything Brevo needs except scheduledAt, which depends on the time of sending
+    html_content = {key: format_content(value) for key, value in email.content.items()}
+    return {
+        "subject": email.subject if email.subject else "No Subject",
+        "image_url": email.image_url,
+        "photographer": email.photographer,
+        "pexels_url": email.pexels_url,
+        **html_content,
+        **{f"input_{key}": value for key, value in (inputs or {}).items()}
+    }
+
+def render_blog_content(email) -> Dict[str, str]:
+    blog_post_content = {}
+    for section_name, section_content in email.content.items():
+        # Remove any personal information or placeholders
+        content = re.sub(r'\[NAME\]', 'Reader', section_content)
+        content = re.sub(r'\[EMAIL\]', 'your email', content)
+        # Keep the HTML formatting as is
+        blog_post_content[section_name] = content.strip()
+    return blog_post_content
+
+def render_email_fields(email, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "rendered_brevo_params": render_brevo_params(email, inputs),
+        "rendered_blog_content": render_blog_content(email),
+        "render_version": RENDER_VERSION
+    }
+
+def is_render_current(email: Email) -> bool:
+    return email.render_version == RENDER_VERSION and email.rendered_brevo_params is not None
+
+def get_brevo_params(email: Email, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    if is_render_current(email):
+        return email.rendered_brevo_params
+    return render_brevo_params(email, inputs)
+
+def get_blog_content(email: Email) -> Dict[str, str]:
+    if email.render_version == RENDER_VERSION and email.rendered_blog_content is not None:
+        return email.rendered_blog_content
+    return render_blog_content(email)
+
+@SCHEDULER_TICK_SECONDS.labels("rerender_stale_emails").time()
+def rerender_stale_emails(batch_size: int = 500) -> int:
+    """Re-render unsent emails whose stored content predates RENDER_VERSION."""
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RERENDER_LOCK_KEY}).scalar():
+            lock_conn.rollback()
+            logger.info("Another process is already re-rendering stale emails. Skipping this run.")
+            return 0
+        # The lock is held by the session, not this transaction, so don't sit idle in one
+        lock_conn.commit()
+        try:
+            return _rerender_stale_emails(batch_size)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RERENDER_LOCK_KEY})
+            lock_conn.commit()
+
+def _rerender_stale_emails(batch_size: int) -> int:
+    db = SessionLocal()
+    total = 0
+    try:
+        while True:
+            emails = db.query(Email).options(joinedload(Email.sequence), undefer_group(BODY)).filter(
+                Email.sent_to_brevo == False,
+                or_(Email.render_version.is_(None), Email.render_version != RENDER_VERSION)
+            ).order_by(Email.id).limit(batch_size).all()
+            if not emails:
+                break
+
+            # Warm the formatter cache for the whole batch (fanned out to a process pool when large)
+            format_contents([value for email in emails for value in email.content.values()])
+            for email in emails:
+                for field, value in render_email_fields(email, email.sequence.inputs).items():
+                    setattr(email, field, value)
+            db.commit()
+            total += len(emails)
+
+        logger.info(f"Re-rendered {total} emails to render version {RENDER_VERSION}")
+        return total
+    except Exception as e:
+        logger.error(f"Error in rerender_stale_emails: {str(e)}")
+        db.rollback()
+        return total
+    finally:
+        db.close()
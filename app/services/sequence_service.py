@@ -1,17 +1,31 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.sequence import Sequence
-from app.models.email import Email
+from app.models.email import Email, BODY
+from app.models.blog_post_outbox import BlogPostOutbox
 from app.schemas.sequence import SequenceCreate, EmailContent, EmailBase, EmailSection
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.exc import SQLAlchemyError
 from app.core.exceptions import AppException
+from app.core.config import settings
 from loguru import logger
 from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy import func
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import undefer_group
 import json
 from sqlalchemy import String
+from app.services.render_service import render_email_fields
+from app.services import partition_service
+import uuid
+from datetime import datetime, timezone
 
-def create_sequence(db: Session, sequence: SequenceCreate) -> Sequence:
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    # emails.scheduled_for is a timestamp without time zone holding UTC. asyncpg refuses aware
+    # datetimes for it (psycopg2 used to let Postgres convert them), so convert here.
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+async def create_sequence(db: AsyncSession, sequence: SequenceCreate, api_key_id: Optional[int] = None) -> Sequence:
     email_structure_json = [
         {
             "name": section.name,
@@ -31,97 +45,144 @@ def create_sequence(db: Session, sequence: SequenceCreate) -> Sequence:
         email_structure=email_structure_json,
         inputs=sequence.inputs,
         preferred_time=sequence.preferred_time,
-        timezone=sequence.timezone
+        timezone=sequence.timezone,
+        api_key_id=api_key_id,
+        custom_post_type=sequence.custom_post_type
     )
     db.add(db_sequence)
-    db.commit()
-    db.refresh(db_sequence)
+    await db.commit()
     return db_sequence
 
-def create_empty_sequence(db: Session, sequence: SequenceCreate):
-    return create_sequence(db, sequence)
+async def create_empty_sequence(db: AsyncSession, sequence: SequenceCreate):
+    return await create_sequence(db, sequence)
 
-def update_sequence_progress(db: Session, sequence_id: int, progress: int):
-    db_sequence = db.query(Sequence).filter(Sequence.id == sequence_id).first()
+async def update_sequence_progress(db: AsyncSession, sequence_id: int, progress: int):
+    db_sequence = await db.get(Sequence, sequence_id)
     if db_sequence:
         db_sequence.progress = progress
-        db.commit()
+        await db.commit()
     else:
         logger.error(f"Sequence {sequence_id} not found while updating progress")
 
-def finalize_sequence(db: Session, sequence_id: int):
+async def finalize_sequence(db: AsyncSession, sequence_id: int):
     try:
-        db_sequence = db.query(Sequence).filter(Sequence.id == sequence_id).first()
+        db_sequence = await db.get(Sequence, sequence_id)
         if db_sequence:
             db_sequence.status = "completed"
             db_sequence.progress = 100
-            db_sequence.next_email_date = db.query(func.min(Email.scheduled_for)).filter(Email.sequence_id == sequence_id).scalar()
-            db.commit()
+            db_sequence.next_email_date = await db.scalar(select(func.min(Email.scheduled_for)).where(Email.sequence_id == sequence_id))
+            await db.commit()
             logger.info(f"Sequence {sequence_id} finalized successfully")
         else:
             logger.error(f"Sequence {sequence_id} not found")
             raise AppException(f"Sequence {sequence_id} not found", status_code=404)
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Database error while finalizing sequence {sequence_id}: {str(e)}")
         raise AppException(f"Database error: {str(e)}", status_code=500)
 
-def mark_sequence_failed(db: Session, sequence_id: int, error_message: str):
-    db_sequence = db.query(Sequence).filter(Sequence.id == sequence_id).first()
+async def mark_sequence_failed(db: AsyncSession, sequence_id: int, error_message: str):
+    db_sequence = await db.get(Sequence, sequence_id)
     if db_sequence:
         db_sequence.status = "failed"
         db_sequence.error_message = error_message
-        db.commit()
-
-def add_emails_to_sequence(db: Session, sequence_id: int, emails: List[EmailBase]):
-    logger.info(f"Adding {len(emails)} emails to sequence {sequence_id}")
-    for email in emails:
-        logger.info(f"Email data: subject={email.subject}, image_url={email.image_url}, photographer={email.photographer}, pexels_url={email.pexels_url}")
-    
-    sequence = db.query(Sequence).filter(Sequence.id == sequence_id).first()
+        await db.commit()
+
+# Columns written by the COPY path; JSONB values go over as JSON text. sent_to_brevo has only
+# a Python-side default, which COPY doesn't apply.
+EMAIL_COPY_COLUMNS = [
+    "id", "sequence_id", "subject", "content", "scheduled_for", "sent_to_brevo", "category", "tags",
+    "image_url", "photographer", "pexels_url", "rendered_brevo_params", "rendered_blog_content", "render_version"
+]
+EMAIL_JSON_COLUMNS = {"content", "tags", "rendered_brevo_params", "rendered_blog_content"}
+
+async def _copy_records(db: AsyncSession, table: str, columns: List[str], records: List[tuple]):
+    """COPY records into table on the session's connection, inside its transaction."""
+    connection = await (await db.connection()).get_raw_connection()
+    await connection.driver_connection.copy_records_to_table(table, columns=columns, records=records)
+
+async def _copy_emails(db: AsyncSession, email_data: List[Dict[str, Any]]) -> List[Tuple[int, datetime]]:
+    # COPY can't return ids, so take them from the table's sequence up front
+    email_ids = (await db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('emails', 'id')) FROM generate_series(1, :count)"),
+        {"count": len(email_data)}
+    )).scalars().all()
+    records = []
+    for email_id, row in zip(email_ids, email_data):
+        row = {**row, "id": email_id, "sent_to_brevo": False}
+        records.append(tuple(
+            json.dumps(row[column]) if column in EMAIL_JSON_COLUMNS and row[column] is not None else row[column]
+            for column in EMAIL_COPY_COLUMNS
+        ))
+    await _copy_records(db, "emails", EMAIL_COPY_COLUMNS, records)
+    return [(email_id, row["scheduled_for"]) for email_id, row in zip(email_ids, email_data)]
+
+async def add_emails_to_sequence(db: AsyncSession, sequence_id: int, emails: List[EmailBase]) -> List[int]:
+    """Insert a batch of emails and queue their blog posts; returns the new email ids."""
+    sequence = await db.get(Sequence, sequence_id)
     if not sequence:
         raise AppException(f"Sequence with id {sequence_id} not found", status_code=404)
-    
+    logger.opt(lazy=True).debug("Adding emails to sequence {}: {}", lambda: sequence_id, lambda: [email.subject for email in emails])
+
     email_data = [
         {
             "sequence_id": sequence_id,
             "subject": email.subject,
             "content": email.content,
-            "scheduled_for": email.scheduled_for,
+            "scheduled_for": _utc_naive(email.scheduled_for),
             "category": email.category,
             "tags": email.tags,
             "image_url": email.image_url,
             "photographer": email.photographer,
-            "pexels_url": email.pexels_url
+            "pexels_url": email.pexels_url,
+            **render_email_fields(email, sequence.inputs)
         }
         for email in emails
     ]
-    
-    logger.info(f"Attempting to insert {len(email_data)} emails for sequence {sequence_id}")
-    
-    stmt = insert(Email).values(email_data)
-    stmt = stmt.on_conflict_do_nothing()  # In case of unique constraint violations
-    result = db.execute(stmt)
-    db.flush()
-    
-    logger.info(f"Inserted {result.rowcount} emails for sequence {sequence_id}")
-
-    # Verify the insertion
-    inserted_emails = db.query(Email).filter(Email.sequence_id == sequence_id).all()
-    logger.info(f"Total emails in database for sequence {sequence_id}: {len(inserted_emails)}")
-
-def get_sequence(db: Session, sequence_id: int) -> Sequence:
-    return db.query(Sequence).filter(Sequence.id == sequence_id).first()
-
-def get_existing_sequence(db: Session, form_id: str, recipient_email: str, inputs: Dict[str, Any]):
-    return db.query(Sequence).filter(
+    if not email_data:
+        return []
+
+    # Large bulk writes go through COPY; a multi-row INSERT's bind parameters grow with the
+    # batch and run into the protocol's 32767-parameter limit at a few thousand emails
+    await partition_service.ensure_email_partitions(db, [row["scheduled_for"] for row in email_data])
+    copy = len(email_data) >= settings.EMAIL_COPY_THRESHOLD
+    if copy:
+        email_keys = await _copy_emails(db, email_data)
+    else:
+        email_keys = (await db.execute(insert(Email).values(email_data).returning(Email.id, Email.scheduled_for))).all()
+    email_ids = [email_id for email_id, _ in email_keys]
+
+    # Queue the blog posts in the same transaction, so an email is never committed without its
+    # outbox entry; outbox_service publishes them
+    if sequence.api_key_id and sequence.custom_post_type:
+        outbox_rows = [
+            (email_id, scheduled_for, sequence.api_key_id, sequence.custom_post_type, uuid.uuid4().hex)
+            for email_id, scheduled_for in email_keys
+        ]
+        if copy:
+            # The email ids are new, so none of them can have an entry yet
+            await _copy_records(db, "blog_post_outbox", ["email_id", "email_scheduled_for", "api_key_id", "custom_post_type", "idempotency_key"], outbox_rows)
+        else:
+            await db.execute(insert(BlogPostOutbox).values([
+                {"email_id": email_id, "email_scheduled_for": scheduled_for, "api_key_id": api_key_id, "custom_post_type": custom_post_type, "idempotency_key": idempotency_key}
+                for email_id, scheduled_for, api_key_id, custom_post_type, idempotency_key in outbox_rows
+            ]).on_conflict_do_nothing(index_elements=["email_id"]))
+
+    logger.info(f"Inserted {len(email_ids)} emails for sequence {sequence_id}{' with COPY' if copy else ''}")
+    return email_ids
+
+async def get_sequence(db: AsyncSession, sequence_id: int) -> Sequence:
+    return await db.get(Sequence, sequence_id)
+
+async def get_existing_sequence(db: AsyncSession, form_id: str, recipient_email: str, inputs: Dict[str, Any]):
+    return (await db.execute(select(Sequence).where(
         Sequence.form_id == form_id,
         Sequence.recipient_email == recipient_email,
         Sequence.inputs.cast(String) == json.dumps(inputs)
-    ).first()
+    ))).scalars().first()
 
-def get_email_count(db: Session, sequence_id: int) -> int:
-    return db.query(func.count(Email.id)).filter(Email.sequence_id == sequence_id).scalar()
+async def get_email_count(db: AsyncSession, sequence_id: int) -> int:
+    return await db.scalar(select(func.count(Email.id)).where(Email.sequence_id == sequence_id))
 
-def get_emails_for_sequence(db: Session, sequence_id: int):
-    return db.query(Email).filter(Email.sequence_id == sequence_id).order_by(Email.scheduled_for).all()
\ No newline at end of file
+async def get_emails_for_sequence(db: AsyncSession, sequence_id: int):
+    return (await db.execute(select(Email).options(undefer_group(BODY)).where(Email.sequence_id == sequence_id).order_by(Email.scheduled_for))).scalars().all()
\ No newline at end of file
@@ -10,8 +10,7 @@ from app.core.auth import get_password_hash
 import secrets
 from app.services.email_service import send_email_to_brevo
 from app.schemas.sequence import EmailContent
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime, timedelta, timezone
 from app.core.config import settings
 
 def create_user_with_api_key(db: Session, user: UserCreate):
@@ -43,7 +42,7 @@ def send_password_reset_email(db: Session, email: str, reset_token: str):
             "body": f"Click the following link to reset your password: {reset_link}",
             "reset_link": reset_link
         },
-        scheduled_for=datetime.now(pytz.UTC) + timedelta(minutes=1)
+        scheduled_for=datetime.now(timezone.utc) + timedelta(minutes=1)
     )
     
     inputs = {}  # Add any additional inputs if needed
@@ -1,22 +1,105 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import engine
 from app.models.webhook_submission import WebhookSubmission
+from app.core.config import settings
+from app.core.metrics import SCHEDULER_TICK_SECONDS, WEBHOOK_SUBMISSIONS_TABLE_BYTES, WEBHOOK_SUBMISSIONS_ROWS, WEBHOOK_RETENTION_ROWS
+from loguru import logger
+import time
 
-def create_webhook_submission(db: Session, payload: dict) -> WebhookSubmission:
+# Every submission is kept twice: in the typed columns and in raw_payload. Once it has been
+# turned into a sequence and WEBHOOK_PAYLOAD_COMPACT_AFTER_DAYS have passed, raw_payload is
+# compacted down to the fields the typed columns don't hold (NULL if there are none), and
+# submissions older than WEBHOOK_SUBMISSION_RETENTION_DAYS are deleted. Both happen in small
+# batches, each its own short transaction, with a pause between them.
+
+# Payload fields copied into typed columns of the same name
+TYPED_FIELDS = (
+    "form_id", "topic", "recipient_email", "brevo_list_id", "brevo_template_id", "sequence_settings",
+    "email_structure", "inputs", "topic_depth", "preferred_time", "timezone",
+)
+
+RETENTION_LOCK_KEY = 7316050
+# A batch that would have to queue behind a migration's lock gives up instead of holding up everyone after it
+LOCK_TIMEOUT = "2s"
+
+COMPACT_BATCH = text("""
+    UPDATE webhook_submissions
+    SET raw_payload = NULLIF(raw_payload::jsonb - CAST(:fields AS text[]), '{}'::jsonb)::json, payload_compacted_at = now()
+    WHERE id IN (
+        SELECT id FROM webhook_submissions
+        WHERE sequence_id IS NOT NULL AND payload_compacted_at IS NULL
+          AND created_at < now() - make_interval(days => :days)
+        ORDER BY created_at LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+""")
+DELETE_BATCH = text("""
+    DELETE FROM webhook_submissions
+    WHERE id IN (
+        SELECT id FROM webhook_submissions
+        WHERE created_at < now() - make_interval(days => :days)
+        ORDER BY created_at LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+""")
+TABLE_SIZE = text("""
+    SELECT pg_total_relation_size('webhook_submissions'), reltuples::bigint
+    FROM pg_class WHERE oid = 'webhook_submissions'::regclass
+""")
+
+async def create_webhook_submission(db: AsyncSession, payload: dict) -> WebhookSubmission:
     db_submission = WebhookSubmission(
-        form_id=payload.get("form_id"),
-        topic=payload.get("topic"),
-        recipient_email=payload.get("recipient_email"),
-        brevo_list_id=payload.get("brevo_list_id"),
-        brevo_template_id=payload.get("brevo_template_id"),
-        sequence_settings=payload.get("sequence_settings"),
-        email_structure=payload.get("email_structure"),
-        inputs=payload.get("inputs"),
-        topic_depth=payload.get("topic_depth"),
-        preferred_time=payload.get("preferred_time"),
-        timezone=payload.get("timezone"),
+        **{field: payload.get(field) for field in TYPED_FIELDS},
         raw_payload=payload
     )
     db.add(db_submission)
-    db.commit()
-    db.refresh(db_submission)
-    return db_submission
\ No newline at end of file
+    await db.commit()
+    return db_submission
+
+async def link_submission_to_sequence(db: AsyncSession, submission_id: int, sequence_id: int):
+    await db.execute(update(WebhookSubmission).where(WebhookSubmission.id == submission_id).values(sequence_id=sequence_id))
+
+def run_in_batches(conn, statement, params: dict, action: str, deadline: float) -> int:
+    """Repeat a batch statement, one transaction each, until it runs out of rows or time."""
+    total = 0
+    while time.monotonic() < deadline:
+        with conn.begin():
+            conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+            count = conn.execute(statement, {**params, "limit": settings.WEBHOOK_RETENTION_BATCH_SIZE}).rowcount
+        total += count
+        WEBHOOK_RETENTION_ROWS.labels(action).inc(count)
+        if count < settings.WEBHOOK_RETENTION_BATCH_SIZE:
+            break
+        time.sleep(settings.WEBHOOK_RETENTION_BATCH_PAUSE_SECONDS)
+    return total
+
+@SCHEDULER_TICK_SECONDS.labels("apply_webhook_retention").time()
+def apply_webhook_retention():
+    try:
+        with engine.connect() as conn:
+            # Every process runs the job; the first one to get here does the work
+            if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RETENTION_LOCK_KEY}).scalar():
+                conn.rollback()
+                return
+            conn.commit()
+            try:
+                deadline = time.monotonic() + settings.WEBHOOK_RETENTION_MAX_SECONDS
+                deleted = 0
+                # Deleting first means nothing is compacted only to be deleted straight after
+                if settings.WEBHOOK_SUBMISSION_RETENTION_DAYS > 0:
+                    deleted = run_in_batches(conn, DELETE_BATCH, {"days": settings.WEBHOOK_SUBMISSION_RETENTION_DAYS}, "deleted", deadline)
+                compacted = run_in_batches(
+                    conn, COMPACT_BATCH, {"days": settings.WEBHOOK_PAYLOAD_COMPACT_AFTER_DAYS, "fields": list(TYPED_FIELDS)}, "compacted", deadline
+                )
+                size, rows = conn.execute(TABLE_SIZE).one()
+                conn.commit()
+                WEBHOOK_SUBMISSIONS_TABLE_BYTES.set(size)
+                WEBHOOK_SUBMISSIONS_ROWS.set(max(rows, 0))
+                logger.info(f"Webhook retention: deleted {deleted} submissions, compacted {compacted} payloads; table is {size} bytes")
+            finally:
+                conn.rollback()
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RETENTION_LOCK_KEY})
+                conn.commit()
+    except Exception as e:
+        logger.error(f"Error applying webhook retention: {str(e)}")
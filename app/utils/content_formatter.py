@@ -1,20 +1,263 @@
-import re
-from bs4 import BeautifulSoup
+from html.entities import html5
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from cachetools import LRUCache
+from app.core.config import settings
+from app.core.metrics import record_cache
+from typing import List
+import hashlib
+import multiprocessing
+import threading
+
+# Single-pass replacement for the old BeautifulSoup(html.parser) round-trip. The output is
+# kept byte-for-byte identical to it: script/style removed, every text node stripped with
+# inner whitespace collapsed, and markup re-serialised the way bs4's "minimal" formatter did
+# (sorted attributes, <br/>-style void elements, unknown end tags dropped, open tags closed).
+
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer'
+])
+REMOVED_ELEMENTS = frozenset(['script', 'style'])
+
+# Whitespace-separated list attributes; their values are normalised to single spaces
+MULTI_VALUED_ATTRIBUTES = {
+    '*': frozenset(['class', 'accesskey', 'dropzone']),
+    'a': frozenset(['rel', 'rev']),
+    'link': frozenset(['rel', 'rev']),
+    'td': frozenset(['headers']),
+    'th': frozenset(['headers']),
+    'form': frozenset(['accept-charset']),
+    'object': frozenset(['archive']),
+    'area': frozenset(['rel']),
+    'icon': frozenset(['sizes']),
+    'iframe': frozenset(['sandbox']),
+    'output': frozenset(['for']),
+}
+
+# Named entities with the trailing semicolon dropped; unknown names are kept as literal text
+ENTITIES = {}
+for _name, _character in sorted(html5.items()):
+    ENTITIES.setdefault(_name[:-1] if _name.endswith(';') else _name, _character)
+
+OPEN, DEFERRED, REMOVED = 0, 1, 2
+
+CACHE_SIZE = 4096
+POOL_THRESHOLD = 200  # Batches smaller than this are formatted in-process
+
+_cache = LRUCache(maxsize=CACHE_SIZE)
+_cache_lock = threading.Lock()
+
+# Started on the first large batch and kept for the life of the process, so its workers only
+# pay the interpreter and import cost once; shut down in the app's lifespan
+_format_executor = None
+_format_executor_lock = threading.Lock()
+
+def _escape(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def _quote(value: str) -> str:
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', '&quot;') + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+class _ContentSanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.out = []
+        self.text = []
+        # Open elements as [name, start tag, state]. Void elements stay DEFERRED until we know
+        # whether they get children (<br>...</br>) or not (<br/>).
+        self.stack = []
+        self.removed_depth = 0
+        # Void elements closed on their start tag; a matching stray end tag is swallowed
+        self.closed_void = []
+
+    def sanitize(self, content: str) -> str:
+        self.feed(content)
+        self.close()
+        self._flush_text()
+        while self.stack:
+            self._close(self.stack.pop())
+        return ''.join(self.out)
+
+    def _flush_text(self):
+        if not self.text:
+            return
+        text = ''.join(self.text)
+        self.text = []
+        if self.removed_depth:
+            return
+        self._mark_parent_content()
+        self.out.append(_escape(' '.join(text.split())))
+
+    def _mark_parent_content(self):
+        if self.stack and self.stack[-1][2] == DEFERRED:
+            parent = self.stack[-1]
+            self.out.append(parent[1] + '>')
+            parent[2] = OPEN
+
+    def _start_tag(self, name, attrs) -> str:
+        values = {}
+        for key, value in attrs:
+            values[key] = '' if value is None else value
+        multi_valued = MULTI_VALUED_ATTRIBUTES['*'] | MULTI_VALUED_ATTRIBUTES.get(name, frozenset())
+        rendered = []
+        for key in sorted(values):
+            value = values[key]
+            if key in multi_valued:
+                value = ' '.join(value.split())
+            rendered.append(f' {key}={_quote(_escape(value))}')
+        return '<' + name + ''.join(rendered)
+
+    def _push(self, name, attrs):
+        self._flush_text()
+        if self.removed_depth or name in REMOVED_ELEMENTS:
+            self.removed_depth += 1
+            self.stack.append([name, None, REMOVED])
+            return
+        self._mark_parent_content()
+        start_tag = self._start_tag(name, attrs)
+        if name in VOID_ELEMENTS:
+            self.stack.append([name, start_tag, DEFERRED])
+        else:
+            self.out.append(start_tag + '>')
+            self.stack.append([name, start_tag, OPEN])
+
+    def _close(self, entry):
+        name, start_tag, state = entry
+        if state == REMOVED:
+            self.removed_depth -= 1
+        elif state == DEFERRED:
+            self.out.append(start_tag + '/>')
+        else:
+            self.out.append('</' + name + '>')
+
+    def _pop_to(self, name):
+        self._flush_text()
+        if not any(entry[0] == name for entry in self.stack):
+            return
+        while self.stack:
+            entry = self.stack.pop()
+            self._close(entry)
+            if entry[0] == name:
+                break
+
+    def _string_node(self, data):
+        self._flush_text()
+        self.text.append(data)
+        self._flush_text()
+
+    def handle_starttag(self, tag, attrs):
+        self._push(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            self._pop_to(tag)
+            self.closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._push(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void:
+            self.closed_void.remove(tag)
+        else:
+            self._pop_to(tag)
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith(('x', 'X')):
+            codepoint = int(name.lstrip('xX'), 16)
+        else:
+            codepoint = int(name)
+        data = None
+        if codepoint < 256:
+            # Numeric references below 256 are frequently meant as windows-1252
+            try:
+                data = bytes([codepoint]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self.text.append(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_entityref(self, name):
+        character = ENTITIES.get(name)
+        self.text.append(character if character is not None else f'&{name}')
+
+    def handle_comment(self, data):
+        self._string_node(data)
+
+    def handle_decl(self, decl):
+        self._string_node(decl[len('DOCTYPE '):])
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            data = data[len('CDATA['):]
+        self._string_node(data)
+
+    def handle_pi(self, data):
+        self._string_node(data)
+
+def _content_key(content: str) -> bytes:
+    return hashlib.blake2b(content.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+def _format_uncached(content: str) -> str:
+    return _ContentSanitizer().sanitize(content)
+
+def _get_format_executor() -> ProcessPoolExecutor:
+    global _format_executor
+    with _format_executor_lock:
+        if _format_executor is None:
+            # spawn rather than fork: the app runs the scheduler and SDK clients in threads
+            _format_executor = ProcessPoolExecutor(max_workers=settings.CONTENT_FORMAT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _format_executor
+
+def shutdown_format_executor():
+    global _format_executor
+    with _format_executor_lock:
+        if _format_executor is not None:
+            _format_executor.shutdown(cancel_futures=True)
+            _format_executor = None
 
 def format_content(content: str) -> str:
-    # Parse the HTML content
-    soup = BeautifulSoup(content, 'html.parser')
-    
-    # Remove any script or style tags
-    for script in soup(["script", "style"]):
-        script.decompose()
-    
-    # Remove extra whitespace within tags, but preserve space after closing tags
-    for tag in soup.find_all(text=True):
-        if tag.parent.name not in ['script', 'style']:
-            new_text = re.sub(r'\s+', ' ', tag.strip())
-            new_text = re.sub(r'>\s+', '> ', new_text)  # Preserve space after closing tags
-            tag.replace_with(new_text)
-    
-    # Return the cleaned HTML as a string
-    return str(soup)
\ No newline at end of file
+    key = _content_key(content)
+    with _cache_lock:
+        result = _cache.get(key)
+    record_cache("content_formatter", result is not None)
+    if result is None:
+        result = _format_uncached(content)
+        with _cache_lock:
+            _cache[key] = result
+    return result
+
+def format_contents(contents: List[str], pool_threshold: int = POOL_THRESHOLD) -> List[str]:
+    """Format a batch of content strings, fanning cache misses out to a process pool for large batches."""
+    keys = [_content_key(content) for content in contents]
+    with _cache_lock:
+        results = [_cache.get(key) for key in keys]
+
+    misses = {}
+    for key, content, result in zip(keys, contents, results):
+        record_cache("content_formatter", result is not None)
+        if result is None and key not in misses:
+            misses[key] = content
+
+    if misses:
+        if len(misses) >= pool_threshold:
+            formatted = list(_get_format_executor().map(_format_uncached, misses.values(), chunksize=32))
+        else:
+            formatted = [_format_uncached(content) for content in misses.values()]
+        rendered = dict(zip(misses.keys(), formatted))
+        with _cache_lock:
+            _cache.update(rendered)
+        results = [result if result is not None else rendered[key] for key, result in zip(keys, results)]
+
+    return results
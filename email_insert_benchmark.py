@@ -0,0 +1,134 @@
+"""Time add_emails_to_sequence for generation-sized batches and for bulk adds, INSERT vs COPY.
+
+"batches" adds the emails ten per transaction, as generation does; the two extra rows
+replay the query the function used to run after every batch (reloading the sequence's
+emails, then counting them) to show what dropping it saved. "bulk" adds every email in one
+call, below and above EMAIL_COPY_THRESHOLD. Runs against DATABASE_URL and deletes the
+sequences it creates. Point it at a database across the network to see the round-trip
+cost, which is where the per-batch reload hurt most.
+
+    DATABASE_URL=postgresql://... python email_insert_benchmark.py --sizes 52 365 1000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, time as dtime
+from typing import Callable, List, Optional
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+def paragraph(rng: random.Random, words: int) -> str:
+    return "<p>" + " ".join(rng.choice(WORDS) for _ in range(words)) + "</p>"
+
+def make_emails(count: int, rng: random.Random):
+    from app.models.email import EmailBase
+    return [
+        EmailBase(
+            subject=f"Subject {i}",
+            content={"intro": paragraph(rng, 80), "body": paragraph(rng, 200), "cta": paragraph(rng, 40)},
+            category="News", tags=["a", "b"], scheduled_for=datetime.utcnow() + timedelta(days=i),
+            image_url=f"https://images.example.com/{i}.jpg"
+        )
+        for i in range(count)
+    ]
+
+async def create_sequence(created: List[int]) -> int:
+    from sqlalchemy import select
+    from app.db.database import async_session_scope
+    from app.models import APIKey, Sequence
+    async with async_session_scope() as db:
+        api_key_id = (await db.execute(select(APIKey.id).limit(1))).scalar()
+        sequence = Sequence(
+            form_id="email_insert_benchmark", topic="benchmark", recipient_email="benchmark@example.com", brevo_list_id=1,
+            total_emails=0, days_between_emails=1, email_structure=[], inputs={"name": "benchmark"}, preferred_time=dtime(9),
+            timezone="UTC", api_key_id=api_key_id, custom_post_type="email_post" if api_key_id else None
+        )
+        db.add(sequence)
+        await db.flush()
+        created.append(sequence.id)
+        return sequence.id
+
+async def reload_rows(db, sequence_id: int):
+    from sqlalchemy import select
+    from sqlalchemy.orm import undefer_group
+    from app.models.email import Email, BODY
+    (await db.execute(select(Email).options(undefer_group(BODY)).where(Email.sequence_id == sequence_id))).scalars().all()
+
+async def count_rows(db, sequence_id: int):
+    from sqlalchemy import func, select
+    from app.models.email import Email
+    (await db.execute(select(func.count()).select_from(Email).where(Email.sequence_id == sequence_id))).scalar()
+
+async def batched(emails, created: List[int], after_batch: Optional[Callable] = None) -> float:
+    from app.core.config import settings
+    from app.db.database import async_session_scope
+    from app.services.sequence_service import add_emails_to_sequence
+    settings.EMAIL_COPY_THRESHOLD = 10 ** 9
+    sequence_id = await create_sequence(created)
+    start = time.perf_counter()
+    for offset in range(0, len(emails), 10):
+        async with async_session_scope() as db:
+            await add_emails_to_sequence(db, sequence_id, emails[offset:offset + 10])
+            if after_batch:
+                await after_batch(db, sequence_id)
+    return time.perf_counter() - start
+
+async def bulk(emails, created: List[int], copy_threshold: int) -> float:
+    from app.core.config import settings
+    from app.db.database import async_session_scope
+    from app.services.sequence_service import add_emails_to_sequence
+    settings.EMAIL_COPY_THRESHOLD = copy_threshold
+    sequence_id = await create_sequence(created)
+    start = time.perf_counter()
+    async with async_session_scope() as db:
+        await add_emails_to_sequence(db, sequence_id, emails)
+    return time.perf_counter() - start
+
+async def cleanup(created: List[int]):
+    from sqlalchemy import delete, select
+    from app.db.database import async_session_scope
+    from app.models import Sequence
+    from app.models.blog_post_outbox import BlogPostOutbox
+    from app.models.email import Email
+    async with async_session_scope() as db:
+        email_ids = select(Email.id).where(Email.sequence_id.in_(created))
+        await db.execute(delete(BlogPostOutbox).where(BlogPostOutbox.email_id.in_(email_ids)))
+        await db.execute(delete(Email).where(Email.sequence_id.in_(created)))
+        await db.execute(delete(Sequence).where(Sequence.id.in_(created)))
+
+async def run(sizes: List[int], repeat: int, seed: int):
+    from app.db.database import async_engine
+    rng = random.Random(seed)
+    created: List[int] = []
+    try:
+        for size in sizes:
+            emails = make_emails(size, rng)
+            cases = [
+                ("batches, reload rows after each", lambda: batched(emails, created, reload_rows)),
+                ("batches, count after each", lambda: batched(emails, created, count_rows)),
+                ("batches, RETURNING only", lambda: batched(emails, created)),
+                ("bulk INSERT ... RETURNING", lambda: bulk(emails, created, 10 ** 9)),
+                ("bulk COPY", lambda: bulk(emails, created, 1)),
+            ]
+            print(f"{size} emails per sequence, best of {repeat}:")
+            for label, case in cases:
+                best = min([await case() for _ in range(repeat)])
+                print(f"  {label:34s} {best * 1000:8.1f} ms")
+    finally:
+        await cleanup(created)
+        await async_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[52, 365, 1000], help="Emails per sequence")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from loguru import logger
+    logger.remove()
+    asyncio.run(run(args.sizes, args.repeat, args.seed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Compare format_content with the BeautifulSoup formatter it replaced, for output and speed.
+
+Every string in a generated corpus (hand-written edge cases, email-like sections and seeded
+random tag soup) is formatted by both; any difference is printed and fails the run. Then the
+old and new formatters are timed on a typical email section, and format_contents on batches
+large enough to use the process pool. The old formatter needs beautifulsoup4, which the app no
+longer depends on:
+
+    pip install beautifulsoup4
+    python formatter_benchmark.py --random 20000
+    python formatter_benchmark.py --random 2000 --write-golden tests/fixtures/content_formatter_golden.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import warnings
+from typing import Callable, List
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("BREVO_API_KEY", "unused")
+os.environ.setdefault("PEXELS_API_KEY", "unused")
+
+EDGE_CASES = [
+    "<p>Hello  <strong>world</strong> \n and   more</p>",
+    "<h2>This Week's Training Tip</h2><p>This week, we're focusing on 'stay'.</p>",
+    "<ol><li>Start</li><li>Hold &amp; wait &nbsp; x</li></ol>",
+    "<p>a<br>b<br/>c</p>", "a<br>b</br>c", "<br><br/>x y <script>z</script> q", "<img src=x alt='a \"b\"'></img> t",
+    "<p class='  a   b '>x</p>", "<a rel=' no  follow ' href=\"x?a=1&b=2\">l</a>", "<!-- c < d --> e", "<!DOCTYPE html><p>x",
+    "<![CDATA[ hi ]]> there", "<?php echo 1 ?> x", "&#150; &#x41; &#0; &#129; &#99999999; &foo; &amp &ampx AT&T", "<p>a<p>b",
+    "<b><i>x</b></i>y", "<style>p{}</style><p> s </p>", "<script>", "<p>unterminated <", "<div><br/></br></div>",
+    "<input disabled value=1 value=2>", "<p title=\"it's &quot;q&quot;\">z</p>", "  \n ", "", "<pre>  a\n b </pre>",
+    "<textarea> x </textarea>", "<td headers=' a b'>", "<p>\xa0x\xa0 y</p>", "<br></br></br>", "<br/><br/>a<br>b", "<BR>x</BR>",
+    "<img><img/>t<p>u</p></img>v", "<p/>x", "<script/>x", "<hr>a</hr></hr>b", "<!---->x<!-- -->y",
+]
+
+SECTION = (
+    "<h3>How to Teach 'Stay'</h3><ol><li>Start with your dog in a sitting position.</li>"
+    "<li>Hold your hand out, palm facing the dog, and say 'stay'.</li><li>Take a step back.</li>"
+    "<li>If your dog stays, immediately reward them with a treat and praise.</li></ol>"
+    "<p>Remember, <strong>Labradors</strong> are energetic breeds &amp; need exercise.</p>"
+) * 3
+
+RANDOM_TAGS = ['p', 'br', 'br/', 'img', 'b', 'i', 'script', 'style', 'li', 'ul', 'a class="x  y"', 'hr', 'span',
+               '/p', '/br', '/b', '/img', '/i', '/script', '!-- c --', 'input disabled']
+RANDOM_TEXT = ['x', ' ', '  y \n', '&amp;', '&lt;', '&#150;', '&nbsp;', 'z&w', '<', '>', '"', "'", '\t']
+
+def old_format_content(content: str) -> str:
+    """The BeautifulSoup formatter format_content replaced, verbatim."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    for tag in soup.find_all(text=True):
+        if tag.parent.name not in ['script', 'style']:
+            new_text = re.sub(r'\s+', ' ', tag.strip())
+            new_text = re.sub(r'>\s+', '> ', new_text)
+            tag.replace_with(new_text)
+    return str(soup)
+
+def email_sections(count: int, rng: random.Random) -> List[str]:
+    """Sections shaped like generated emails: headings, lists, emphasis and entities, each one unique."""
+    sections = []
+    for i in range(count):
+        items = "".join(f"<li>Step {j} for reader {i}: keep  it\nshort &amp; kind.</li>" for j in range(rng.randint(2, 6)))
+        sections.append(
+            f"<h2>Tip #{i}</h2>\n<p>This week  we're focusing on <em>habit {i}</em> &mdash; "
+            f"<a href='https://example.com/{i}?a=1&b=2' class=' cta  link '>read more</a>.</p><ul>{items}</ul><p>{'Keep going. ' * rng.randint(1, 8)}</p>"
+        )
+    return sections
+
+def random_fragments(count: int, rng: random.Random) -> List[str]:
+    fragments = []
+    for _ in range(count):
+        fragment = ""
+        for _ in range(rng.randint(0, 12)):
+            fragment += f"<{rng.choice(RANDOM_TAGS)}>" if rng.random() < 0.5 else rng.choice(RANDOM_TEXT)
+        fragments.append(fragment)
+    return fragments
+
+def build_corpus(random_count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return EDGE_CASES + email_sections(200, rng) + random_fragments(random_count, rng)
+
+def best_of(fn: Callable[[], object], repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--random", type=int, default=5000, help="Random tag-soup fragments added to the corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--calls", type=int, default=2000, help="format_content calls per timing")
+    parser.add_argument("--batch", type=int, default=1000, help="Unique sections per format_contents batch")
+    parser.add_argument("--write-golden", metavar="PATH", help="Write the corpus and the old formatter's output as JSON, then exit")
+    args = parser.parse_args()
+
+    try:
+        import bs4  # noqa: F401
+    except ImportError:
+        sys.exit("beautifulsoup4 is needed to run the old formatter: pip install beautifulsoup4")
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    from app.utils import content_formatter
+    from app.utils.content_formatter import format_content, format_contents, _format_uncached, shutdown_format_executor
+
+    corpus = build_corpus(args.random, args.seed)
+    if args.write_golden:
+        with open(args.write_golden, "w") as f:
+            json.dump([{"input": content, "expected": old_format_content(content)} for content in corpus], f, indent=0, ensure_ascii=False)
+        print(f"Wrote {len(corpus)} cases to {args.write_golden}")
+        return
+
+    mismatches = 0
+    for content in corpus:
+        expected, actual = old_format_content(content), _format_uncached(content)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"Mismatch for {content!r}:\n  bs4 {expected!r}\n  new {actual!r}")
+    print(f"Output: {mismatches} mismatches in {len(corpus)} strings")
+
+    old = best_of(lambda: [old_format_content(SECTION) for _ in range(args.calls)])
+    new = best_of(lambda: [_format_uncached(SECTION) for _ in range(args.calls)])
+    format_content(SECTION)
+    cached = best_of(lambda: [format_content(SECTION) for _ in range(args.calls)])
+    print(f"One section ({len(SECTION)} chars), per call: bs4 {old / args.calls * 1e6:.0f} us, "
+          f"new {new / args.calls * 1e6:.0f} us ({old / new:.1f}x), cached {cached / args.calls * 1e6:.1f} us")
+
+    # Every batch is new content, so each one is all cache misses, like a re-render run
+    rng = random.Random(args.seed + 1)
+    serial_sections = email_sections(args.batch, rng)
+    serial = best_of(lambda: [_format_uncached(section) for section in serial_sections], repeat=3)
+    batches = []
+    for _ in range(4):
+        sections = email_sections(args.batch, rng)
+        start = time.perf_counter()
+        format_contents(sections)
+        batches.append(time.perf_counter() - start)
+    shutdown_format_executor()
+    print(f"Batch of {args.batch} uncached sections: in-process {serial * 1000:.0f} ms; format_contents with "
+          f"{content_formatter.settings.CONTENT_FORMAT_WORKERS} pool workers: first batch {batches[0] * 1000:.0f} ms (starts the pool), "
+          f"later batches median {statistics.median(batches[1:]) * 1000:.0f} ms")
+
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
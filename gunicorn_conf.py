@@ -1,4 +1,8 @@
+import gc
+import importlib
 import multiprocessing
+import os
+import shutil
 
 workers = min(multiprocessing.cpu_count() * 2, 4)  # Cap at 4 workers
 bind = "0.0.0.0:8080"
@@ -10,4 +14,55 @@ timeout = 300  # 5 minutes
 keepalive = 120  # How long to wait for requests on a Keep-Alive connection
 
 # Specify the application
-app = "app.main:app"
\ No newline at end of file
+app = "app.main:app"
+
+# Import the app once in the master and fork the workers from it, so modules, settings,
+# prompts and templates are shared copy-on-write instead of loaded by every worker. Importing
+# app.main has no side effects; connections, http clients, listener threads, logging and the
+# scheduler are started per worker by the app's lifespan.
+preload_app = True
+
+# Recycle workers to contain slow memory growth; the jitter keeps them from restarting together
+max_requests = 1000
+max_requests_jitter = 100
+
+# Modules the app imports lazily to keep plain startup fast; a preloading master imports them
+# up front so the workers share them
+PRELOAD_MODULES = ("openai", "sib_api_v3_sdk", "psutil")
+
+# Collections in the master would leave freed holes in pages the workers share
+if preload_app:
+    gc.disable()
+
+# The preloaded app opens its Prometheus value files as it's imported, which is before
+# on_starting runs, so the directory has to exist already
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+def on_starting(server):
+    # Start every deploy with an empty Prometheus multiprocess directory
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        for module in PRELOAD_MODULES:
+            importlib.import_module(module)
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the collector's reach, so a worker's collections
+    # don't write to (and copy) the pages it shares with the master
+    gc.freeze()
+
+def post_fork(server, worker):
+    gc.enable()
+    if server.cfg.preload_app:
+        from app.db.database import reset_engines_after_fork
+        reset_engines_after_fork()
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,85 @@
+"""Compare the pooled clients in app/core/http_clients.py with a new client per call.
+
+A local aiohttp server stands in for Pexels and WordPress. It speaks plain HTTP, so the
+numbers show what connection reuse saves on TCP setup alone; against the real upstreams
+each new connection also pays a TLS handshake and a DNS lookup.
+
+    python http_client_benchmark.py --calls 500
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("BREVO_API_KEY", "unused")
+os.environ.setdefault("PEXELS_API_KEY", "unused")
+
+async def search(request):
+    from aiohttp import web
+    return web.json_response({"photos": []})
+
+def per_call_ms(start: float, calls: int) -> float:
+    return (time.perf_counter() - start) / calls * 1000
+
+async def run(calls: int, port: int):
+    import httpx
+    from aiohttp import web
+    from app.core import http_clients
+    from app.core.metrics import HTTP_CLIENT_REQUESTS, HTTP_CLIENT_CONNECTIONS
+
+    server = web.Application()
+    server.router.add_get("/v1/search", search)
+    server.router.add_post("/v1/search", search)
+    runner = web.AppRunner(server)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    url = f"http://127.0.0.1:{port}/v1/search"
+
+    try:
+        start = time.perf_counter()
+        for _ in range(calls):
+            async with httpx.AsyncClient() as client:
+                (await client.get(url)).json()
+        print(f"async GET, new AsyncClient per call: {per_call_ms(start, calls):.2f} ms")
+
+        client = http_clients.get_async_client("pexels")
+        start = time.perf_counter()
+        for _ in range(calls):
+            (await client.get(url)).json()
+        print(f"async GET, pooled client:            {per_call_ms(start, calls):.2f} ms")
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client.get(url) for _ in range(calls)])
+        print(f"async GET, pooled client, concurrent: {per_call_ms(start, calls):.2f} ms per request")
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            async with httpx.AsyncClient() as new_client:
+                await new_client.post(url, json={})
+        print(f"async POST, new AsyncClient per call: {per_call_ms(start, calls):.2f} ms")
+
+        # The client blog_post_service publishes through
+        wordpress = http_clients.get_async_client("wordpress")
+        start = time.perf_counter()
+        for _ in range(calls):
+            await wordpress.post(url, json={})
+        print(f"async POST, pooled wordpress client: {per_call_ms(start, calls):.2f} ms")
+
+        for upstream in ("pexels", "wordpress"):
+            print(f"{upstream}: {HTTP_CLIENT_REQUESTS.labels(upstream)._value.get():.0f} requests over "
+                  f"{HTTP_CLIENT_CONNECTIONS.labels(upstream)._value.get():.0f} connections")
+    finally:
+        await http_clients.close_http_clients()
+        await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500, help="Requests per measurement")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the stand-in server")
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.port))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Time the log calls on the send and generation paths, before and after the move to loguru.
+
+The "before" calls are the stdlib f-string lines send_email and the OpenAI prompt builder used
+to make, verbatim, with a plain StreamHandler; the "after" calls are the ones in the tree now,
+going through configure_logging()'s filter and log_payload. Both write to /dev/null at the
+given level, so what's measured is formatting and filtering, not I/O.
+
+    python logging_benchmark.py --calls 5000 --level INFO
+"""
+import argparse
+import json
+import logging
+import os
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("BREVO_API_KEY", "unused")
+os.environ.setdefault("PEXELS_API_KEY", "unused")
+
+CONTENT = {f"section_{i}": "<p>" + "word " * 120 + "</p>" for i in range(4)}
+PARAMS = {"subject": "This week's tip", **CONTENT, "input_name": "Joe", "input_email": "joe@example.com"}
+PROMPT = "Generate 10 unique emails for an email sequence about dog training. " * 90
+SCHEMA = {"type": "object", "properties": {f"field_{i}": {"type": "string", "description": "x" * 40} for i in range(40)}}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5000, help="Calls per timing")
+    parser.add_argument("--level", default="INFO", help="Level enabled for both loggers")
+    args = parser.parse_args()
+    os.environ["LOG_LEVEL"] = args.level
+
+    from loguru import logger
+    from app.core import logging_config
+    from app.core.logging_config import configure_logging, log_payload
+
+    devnull = open(os.devnull, "w")
+    configure_logging()
+    logger.remove()
+    logger.add(devnull, level=args.level, filter=logging_config._filter)
+
+    old = logging.getLogger("logging_benchmark.old")
+    old.setLevel(args.level)
+    old.addHandler(logging.StreamHandler(devnull))
+    old.propagate = False
+
+    def old_send():
+        old.info("Preparing to send email to joe@example.com")
+        old.info(f"Email content: {CONTENT}")
+        old.info(f"Retrieved subject: {PARAMS['subject']}")
+        old.info(f"Params being sent to Brevo: {PARAMS}")
+        old.info(f"Sending email with subject: {PARAMS['subject']}")
+        old.info("Making API call to Brevo with the following details:")
+        old.info(f"To: {[{'email': 'joe@example.com'}]}")
+        old.info("Template ID: 1")
+        old.info(f"Params: {PARAMS}")
+        old.info("Email sent successfully. Message ID: <m1@smtp-relay>")
+
+    def new_send():
+        logger.debug("Preparing to send email {} to {}", 1, "joe@example.com")
+        logger.opt(lazy=True).debug("Params being sent to Brevo: {}", lambda: log_payload(PARAMS))
+        logger.info("Email {} sent to Brevo for template {}. Message ID: {}", 1, 1, "<m1@smtp-relay>")
+
+    def old_generate():
+        old.info(f"Full prompt:\n{PROMPT}")
+        old.info(f"JSON structure:\n{json.dumps(SCHEMA, indent=2)}")
+
+    def new_generate():
+        logger.opt(lazy=True).debug("Full prompt:\n{}", lambda: log_payload(PROMPT))
+        logger.opt(lazy=True).debug("JSON structure: {}", lambda: log_payload(SCHEMA))
+
+    for label, before, after in [("send_email", old_send, new_send), ("generation batch", old_generate, new_generate)]:
+        old_us = min(timeit.repeat(before, number=args.calls, repeat=3)) / args.calls * 1e6
+        new_us = min(timeit.repeat(after, number=args.calls, repeat=3)) / args.calls * 1e6
+        print(f"{label} at {args.level}: before {old_us:.1f} us, after {new_us:.1f} us per call ({old_us / new_us:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measure how much concurrent logins stall the event loop, hashing inline vs in auth.py's process pool.
+
+A ticker coroutine sleeps 5 ms at a time and records how late it wakes up; that lateness is
+what every other request on the worker waits while a burst of password checks runs.
+
+    python password_hash_benchmark.py --logins 8
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, List
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("BREVO_API_KEY", "unused")
+os.environ.setdefault("PEXELS_API_KEY", "unused")
+
+TICK = 0.005
+
+async def ticker(lags: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+async def measure(label: str, login: Callable[[], Awaitable[None]], logins: int):
+    lags: List[float] = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(logins)])
+    burst = time.perf_counter() - start
+    stop.set()
+    await tick
+    lags.sort()
+    print(f"{label}: {logins} logins took {burst * 1000:.0f} ms; loop lag max {lags[-1] * 1000:.1f} ms, "
+          f"p99 {lags[int(len(lags) * 0.99)] * 1000:.1f} ms")
+
+async def run(logins: int):
+    from app.core import auth
+    from app.core.config import settings
+
+    hashed = auth.get_password_hash("correct horse battery staple")
+
+    async def inline():
+        auth.verify_password("correct horse battery staple", hashed)
+
+    async def pooled():
+        await auth.verify_password_async("correct horse battery staple", hashed)
+
+    # Start the pool's processes outside the measurement
+    await asyncio.gather(*[pooled() for _ in range(settings.PASSWORD_HASH_WORKERS)])
+    try:
+        await measure("inline", inline, logins)
+        await measure(f"process pool ({settings.PASSWORD_HASH_WORKERS} workers)", pooled, logins)
+    finally:
+        auth.shutdown_hash_executor()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=8, help="Concurrent password checks per burst")
+    args = parser.parse_args()
+    print(f"CPUs: {os.cpu_count()}")
+    asyncio.run(run(args.logins))
+
+if __name__ == "__main__":
+    main()
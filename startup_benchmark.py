@@ -0,0 +1,66 @@
+"""Measure how long `import app.main` takes and fail if it goes over budget.
+
+Each run imports the app in a fresh interpreter with `python -X importtime`, so nothing is
+cached between runs. Importing the app must not need a database or any other service.
+
+    python startup_benchmark.py --runs 5 --budget-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+def import_times(module: str) -> Tuple[int, Dict[str, int]]:
+    """Import `module` in a new interpreter; returns (total microseconds, own import microseconds per top-level package)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr}")
+
+    total = 0
+    packages: Dict[str, int] = defaultdict(int)
+    # Lines look like "import time:   self [us] | cumulative | imported package", with nesting shown by indentation
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        # Everything is nested under the app, so packages are charged their own time, not their subtree's
+        packages[name.strip().split(".")[0]] += int(own)
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return total, packages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Fail if the median import time is over this")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest packages to show")
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    packages: Dict[str, List[int]] = defaultdict(list)
+    for _ in range(args.runs):
+        total, run_packages = import_times(args.module)
+        totals.append(total / 1000)
+        for name, micros in run_packages.items():
+            packages[name].append(micros)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms over {args.runs} runs")
+    print("Slowest top-level imports (median ms):")
+    slowest = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:args.top]
+    for name, micros in slowest:
+        print(f"  {statistics.median(micros) / 1000:8.1f}  {name}")
+
+    if median > args.budget_ms:
+        print(f"Over budget: {median:.0f} ms > {args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Settings needs these to construct; nothing under test connects to them
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("BREVO_API_KEY", "unused")
+os.environ.setdefault("PEXELS_API_KEY", "unused")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
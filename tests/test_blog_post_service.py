@@ -0,0 +1,41 @@
+import asyncio
+import gzip
+
+import httpx
+
+from app.models.api_key import APIKey
+from app.services import blog_post_service
+
+IMAGE = b"\xff\xd8 not really a jpeg " * 1000
+
+def test_upload_media_sends_the_decoded_image_with_its_length(monkeypatch):
+    api_key = APIKey(wordpress_url="https://example.com", wordpress_username="admin", wordpress_app_password="secret")
+    semaphore = blog_post_service.site_semaphore(api_key)
+    uploads = []
+
+    async def cdn(request):
+        # The site's request slots are all free while the image downloads
+        assert semaphore._value == blog_post_service.settings.WORDPRESS_MAX_CONCURRENT_REQUESTS
+        return httpx.Response(200, content=gzip.compress(IMAGE),
+                              headers={"Content-Type": "image/jpeg", "Content-Encoding": "gzip"})
+
+    async def wordpress(request):
+        uploads.append((request.headers, await request.aread()))
+        return httpx.Response(201, json={"id": 42})
+
+    clients = {
+        "images": httpx.AsyncClient(transport=httpx.MockTransport(cdn)),
+        "wordpress": httpx.AsyncClient(transport=httpx.MockTransport(wordpress)),
+    }
+    monkeypatch.setattr(blog_post_service, "get_async_client", clients.__getitem__)
+    monkeypatch.setattr(blog_post_service.settings, "MEDIA_SPOOL_MEMORY_BYTES", 1024)
+
+    media_id = asyncio.run(blog_post_service.upload_media(api_key, "https://images.pexels.com/photos/1/teaching.jpeg"))
+
+    assert media_id == 42
+    headers, body = uploads[0]
+    assert body == IMAGE
+    assert headers["Content-Length"] == str(len(IMAGE))
+    assert "Transfer-Encoding" not in headers
+    assert headers["Content-Type"] == "image/jpeg"
+    assert headers["Content-Disposition"] == 'attachment; filename="teaching.jpeg"'
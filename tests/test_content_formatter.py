@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+from app.utils import content_formatter
+from app.utils.content_formatter import _format_uncached, format_content, format_contents, shutdown_format_executor
+
+# Inputs and the output of the BeautifulSoup formatter format_content replaced; regenerate with
+# formatter_benchmark.py --write-golden
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "content_formatter_golden.json")
+
+with open(GOLDEN_PATH) as f:
+    GOLDEN = json.load(f)
+
+def test_matches_beautifulsoup_output():
+    mismatches = [case for case in GOLDEN if _format_uncached(case["input"]) != case["expected"]]
+    assert not mismatches, f"{len(mismatches)} of {len(GOLDEN)} differ, first: {mismatches[0]!r}"
+
+def test_cached_result_is_the_same():
+    case = GOLDEN[0]
+    assert format_content(case["input"]) == format_content(case["input"]) == case["expected"]
+
+@pytest.mark.parametrize("pool_threshold", [10 ** 9, 1])
+def test_format_contents_in_process_and_pooled(pool_threshold):
+    cases = GOLDEN[:300]
+    content_formatter._cache.clear()
+    try:
+        assert format_contents([case["input"] for case in cases], pool_threshold=pool_threshold) == [case["expected"] for case in cases]
+    finally:
+        shutdown_format_executor()
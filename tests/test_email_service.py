@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+
+import pytest
+import urllib3
+from sib_api_v3_sdk.rest import ApiException
+
+from app.core.exceptions import CircuitOpenError
+from app.core.rate_limiter import OutboundController
+from app.models.email import Email
+from app.services import email_service
+
+NOW = datetime(2026, 1, 1, 9, tzinfo=timezone.utc)
+
+@pytest.fixture
+def open_circuit(monkeypatch):
+    controller = OutboundController("Brevo", max_rate=100, burst=10, min_rate=1, failure_threshold=1, reset_timeout=30)
+    controller.record_response(email_service.BREVO_SMTP_ENDPOINT, 503)
+    monkeypatch.setattr(email_service, "brevo_controller", controller)
+    return controller
+
+def test_open_circuit_does_not_use_an_attempt(open_circuit):
+    def never_called(send_smtp_email):
+        raise AssertionError("Brevo was called while the circuit was open")
+    api = type("Api", (), {"send_transac_email": staticmethod(never_called)})()
+    email = Email(id=1, attempt_count=3, last_error="earlier failure")
+
+    with pytest.raises(CircuitOpenError) as error:
+        email_service.send_transac_email_with_retry(api, {})
+    email_service.record_send_failure(email, error.value, NOW)
+
+    assert email.attempt_count == 3
+    assert email.last_error == "earlier failure"
+    assert email.dead_lettered_at is None
+    assert 0 < (email.next_attempt_at - NOW).total_seconds() <= 30
+
+def test_failed_send_uses_an_attempt():
+    email = Email(id=1, attempt_count=3)
+    email_service.record_send_failure(email, RuntimeError("Brevo returned 500"), NOW)
+    assert email.attempt_count == 4
+    assert email.last_error == "Brevo returned 500"
+    assert email.next_attempt_at > NOW
+
+class FlakyApi:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def send_transac_email(self, send_smtp_email):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "accepted"
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setattr(email_service, "brevo_controller", OutboundController("Brevo", max_rate=100, burst=10, min_rate=1, failure_threshold=5, reset_timeout=30))
+    monkeypatch.setattr(email_service.time, "sleep", lambda seconds: None)
+
+def test_retries_a_connection_that_never_opened(controller):
+    error = urllib3.exceptions.MaxRetryError(None, "/v3/smtp/email", urllib3.exceptions.NewConnectionError(None, "refused"))
+    api = FlakyApi(error)
+    assert email_service.send_transac_email_with_retry(api, {}) == "accepted"
+    assert api.calls == 2
+
+@pytest.mark.parametrize("error", [
+    urllib3.exceptions.ReadTimeoutError(None, "/v3/smtp/email", "read timed out"),
+    urllib3.exceptions.ProtocolError("Connection aborted"),
+    ApiException(status=502),
+])
+def test_does_not_resend_when_brevo_may_have_accepted_it(controller, error):
+    api = FlakyApi(error)
+    with pytest.raises(type(error)):
+        email_service.send_transac_email_with_retry(api, {})
+    assert api.calls == 1
+
+def test_retries_a_429(controller):
+    api = FlakyApi(ApiException(status=429))
+    assert email_service.send_transac_email_with_retry(api, {}) == "accepted"
+    assert api.calls == 2
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from app import main
+
+def test_failed_startup_tears_down_what_it_started(monkeypatch):
+    calls = []
+    def record(name):
+        async def async_step():
+            calls.append(name)
+        def step():
+            calls.append(name)
+        return async_step if name in ("open_http_clients", "close_http_clients", "dispose_async_engine") else step
+    for name in ("open_http_clients", "close_http_clients", "dispose_async_engine", "shutdown_hash_executor",
+                 "shutdown_format_executor", "start_api_key_listener", "stop_api_key_listener",
+                 "start_origin_refresher", "stop_origin_refresher"):
+        monkeypatch.setattr(main, name, record(name))
+    async def background():
+        await asyncio.Event().wait()
+    monkeypatch.setattr(main, "monitor_event_loop_lag", background)
+    monkeypatch.setattr(main, "run_outbox_worker", background)
+    def start_scheduler():
+        raise RuntimeError("scheduler failed to start")
+    monkeypatch.setattr(main, "start_scheduler", start_scheduler)
+
+    async def start():
+        with pytest.raises(RuntimeError, match="scheduler failed to start"):
+            async with main.lifespan(main.app):
+                pass
+        # The background tasks were cancelled and awaited, not left running
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+    asyncio.run(start())
+
+    assert calls == [
+        "open_http_clients", "start_api_key_listener", "start_origin_refresher",
+        "stop_origin_refresher", "stop_api_key_listener", "close_http_clients",
+        "shutdown_hash_executor", "shutdown_format_executor", "dispose_async_engine",
+    ]
@@ -0,0 +1,32 @@
+import asyncio
+
+from app.models.api_key import APIKey
+from app.models.blog_post_outbox import BlogPostOutbox
+from app.models.email import Email
+from app.services import outbox_service
+
+def make_entry(claim_count: int, attempt_count: int = 0) -> BlogPostOutbox:
+    email = Email(id=7, subject="Teaching stay")
+    return BlogPostOutbox(id=1, email_id=7, email=email, idempotency_key="abc123", status="pending",
+                          claim_count=claim_count, attempt_count=attempt_count)
+
+def resolve(monkeypatch, entry: BlogPostOutbox, existing_post_id):
+    lookups = []
+    async def find_post_by_slug(api_key, custom_post_type, slug):
+        lookups.append(slug)
+        return existing_post_id
+    monkeypatch.setattr(outbox_service.blog_post_service, "find_post_by_slug", find_post_by_slug)
+    remaining = asyncio.run(outbox_service._resolve_existing([entry], APIKey(wordpress_url="https://example.com"), "email_post"))
+    return remaining, lookups
+
+def test_first_claim_skips_the_lookup(monkeypatch):
+    entry = make_entry(claim_count=1)
+    remaining, lookups = resolve(monkeypatch, entry, None)
+    assert remaining == [entry] and lookups == []
+
+def test_reclaimed_entry_adopts_the_post_even_without_a_recorded_failure(monkeypatch):
+    # The previous worker created the post, then died before marking the entry published
+    entry = make_entry(claim_count=2, attempt_count=0)
+    remaining, lookups = resolve(monkeypatch, entry, 42)
+    assert remaining == [] and len(lookups) == 1
+    assert entry.status == "published" and entry.email.wordpress_post_id == 42